@@ -8,6 +8,11 @@ import compare_mt.reporters
 import compare_mt.arg_utils
 import compare_mt.print_utils
 import compare_mt.repetition_utils
+import compare_mt.streaming_utils
+import compare_mt.meteor_utils
+import compare_mt.cache_utils
+import compare_mt.parallel_utils
+import compare_mt.incremental_utils
 
 
 __version__ = "0.2.4"
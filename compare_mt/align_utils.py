@@ -1,17 +1,30 @@
+import itertools
+import numpy as np
 from collections import defaultdict
 from compare_mt import corpus_utils
 
-def _count_ngram(sent, order):
-  gram_pos = dict()
-  for i in range(order):
-    gram_pos[i+1] = defaultdict(lambda: [])
+def _extend_backward(sent, positions, word):
+  return [i-1 for i in positions if i > 0 and sent[i-1] == word]
+
+def _extend_forward(sent, positions, n, word):
+  return [i for i in positions if i+n < len(sent) and sent[i+n] == word]
+
+def word_positions(sent):
+  """
+  Find the positions of every word in a sentence
+
+  Args:
+    sent: A sentence, as a list of words or word IDs
+
+  Returns:
+    A defaultdict mapping each word to the list of its positions
+  """
+  word_pos = defaultdict(list)
   for i, word in enumerate(sent):
-    for j in range(min(i+1, order)):
-      gram_pos[j+1][word].append(i-j)
-      word = sent[i-j-1] + ' ' + word
-  return gram_pos
+    word_pos[word].append(i)
+  return word_pos
 
-def ngram_context_align(ref, out, order=-1, case_insensitive=False):
+def ngram_context_align(ref, out, order=-1, case_insensitive=False, ref_word_pos=None):
   """
   Calculate the word alignment between a reference sentence and an output sentence. 
   Proposed in the following paper:
@@ -25,6 +38,8 @@ def ngram_context_align(ref, out, order=-1, case_insensitive=False):
     out: An output sentence
     order: The highest order of grams we want to consider (-1=inf)
     case_insensitive: A boolean specifying whether to turn on the case insensitive option
+    ref_word_pos: The positions of the words of the reference as returned by `word_positions`, to share them when
+                  aligning several outputs with the same reference (calculated if not specified)
 
   Returns:
     The word alignment, represented as a list of integers. 
@@ -36,29 +51,96 @@ def ngram_context_align(ref, out, order=-1, case_insensitive=False):
 
   order = len(ref) if order == -1 else order
 
-  ref_gram_pos = _count_ngram(ref, order)
-  out_gram_pos = _count_ngram(out, order)
+  if ref_word_pos is None or case_insensitive:
+    ref_word_pos = word_positions(ref)
+  out_word_pos = word_positions(out)
 
   worder = []
   for i, word in enumerate(out):
-    if len(ref_gram_pos[1][word]) == 0:
+    if not ref_word_pos.get(word):
       continue
-    if len(ref_gram_pos[1][word]) == len(out_gram_pos[1][word]) == 1:
-      worder.append(ref_gram_pos[1][word][0])
+    if len(ref_word_pos[word]) == len(out_word_pos[word]) == 1:
+      worder.append(ref_word_pos[word][0])
     else:
-      word_forward = word 
-      word_backward = word 
+      # Start positions of the growing backward and forward n-grams around the word, in both sentences. An n-gram
+      # that does not occur in the reference cannot become unique by growing, so a direction stops there.
+      ref_backward = ref_forward = ref_word_pos[word]
+      out_backward = out_forward = out_word_pos[word]
       for j in range(1, order):
-        if i - j >= 0:
-          word_backward = out[i-j] + ' ' + word_backward 
-          if len(ref_gram_pos[j+1][word_backward]) == len(out_gram_pos[j+1][word_backward]) == 1:
-            worder.append(ref_gram_pos[j+1][word_backward][0]+j)
+        if i - j >= 0 and ref_backward:
+          ref_backward = _extend_backward(ref, ref_backward, out[i-j])
+          out_backward = _extend_backward(out, out_backward, out[i-j])
+          if len(ref_backward) == len(out_backward) == 1:
+            worder.append(ref_backward[0]+j)
             break
 
-        if i + j < len(out):
-          word_forward = word_forward + ' ' + out[i+j]
-          if len(ref_gram_pos[j+1][word_forward]) == len(out_gram_pos[j+1][word_forward]) == 1:
-            worder.append(ref_gram_pos[j+1][word_forward][0])
+        if i + j < len(out) and ref_forward:
+          ref_forward = _extend_forward(ref, ref_forward, j, out[i+j])
+          out_forward = _extend_forward(out, out_forward, j, out[i+j])
+          if len(ref_forward) == len(out_forward) == 1:
+            worder.append(ref_forward[0])
             break
 
+        if not ((i - j >= 0 and ref_backward) or (i + j < len(out) and ref_forward)):
+          break
+
   return worder
+
+def count_increasing_pairs(seq):
+  """
+  Count the pairs of positions i < j in a sequence of non-negative integers for which seq[i] < seq[j], in
+  O(n log n) time with a Fenwick tree over the values seen so far.
+
+  Args:
+    seq: A list of non-negative integers, such as an alignment returned by ngram_context_align
+
+  Returns:
+    The number of increasing pairs
+  """
+  if len(seq) <= 1:
+    return 0
+  tree = [0] * (max(seq) + 2)
+  count = 0
+  for x in seq:
+    # Number of earlier values smaller than x
+    i = x
+    while i > 0:
+      count += tree[i]
+      i -= i & -i
+    i = x + 1
+    while i < len(tree):
+      tree[i] += 1
+      i += i & -i
+  return count
+
+def count_increasing_pairs_batch(seqs):
+  """
+  Count the increasing pairs of many sequences at once. This is a bottom-up merge sort where all the merges of one
+  level, over all sequences, are done together: the elements of each right half are looked up in the sorted left half
+  of the same block with a single searchsorted.
+
+  Args:
+    seqs: A list of sequences of non-negative integers
+
+  Returns:
+    A numpy array with the number of increasing pairs of each sequence
+  """
+  lens = np.array([len(x) for x in seqs], dtype=np.int64)
+  counts = np.zeros(len(seqs), dtype=np.int64)
+  if lens.sum() == 0:
+    return counts
+  values = np.fromiter(itertools.chain.from_iterable(seqs), dtype=np.int64, count=lens.sum())
+  seq_ids = np.repeat(np.arange(len(seqs)), lens)
+  pos = np.arange(len(values)) - np.repeat(np.cumsum(lens) - lens, lens)
+  base = values.max() + 1
+  width = 1
+  while width < lens.max():
+    blocks_per_seq = (lens.max() + 2*width - 1) // (2*width)
+    block_keys = (seq_ids * blocks_per_seq + pos // (2*width)) * base
+    right = (pos // width) % 2 == 1
+    left_keys = np.sort(block_keys[~right] + values[~right])
+    smaller = (np.searchsorted(left_keys, block_keys[right] + values[right]) -
+               np.searchsorted(left_keys, block_keys[right]))
+    counts += np.bincount(seq_ids[right], weights=smaller, minlength=len(seqs)).astype(np.int64)
+    width *= 2
+  return counts
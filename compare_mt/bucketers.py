@@ -1,7 +1,9 @@
 import itertools
+import numpy as np
 from collections import defaultdict
 
 from compare_mt import corpus_utils
+from compare_mt import parallel_utils
 from compare_mt import scorers
 from compare_mt import arg_utils
 
@@ -25,6 +27,18 @@ class Bucketer:
         return i
     return len(self.bucket_cutoffs)
 
+  def cutoffs_into_buckets(self, values):
+    """
+    Find the buckets of many values at once, as `cutoff_into_bucket` would
+
+    Args:
+      values: A numpy array of values
+
+    Returns:
+      A list with the integer ID of the bucket of each value
+    """
+    return np.digitize(values, self.bucket_cutoffs).tolist()
+
 class WordBucketer(Bucketer):
 
   def calc_bucket(self, val, ref_label=None, out_label=None, src_label=None):
@@ -62,47 +76,111 @@ class WordBucketer(Bucketer):
         prec: precision of the bucket
         fmeas: f1-measure of the bucket
     """
+    return self.calc_match_stats(self.calc_bucketed_match_counts(ref, out, ref_labels=ref_labels, out_labels=out_labels))
+
+  def calc_match_stats(self, matches):
+    """
+    Calculate recall, precision and F-measure from bucketed match counts
+
+    Args:
+      matches: A list containing [both_tot, ref_tot, out_tot] for each bucket.
+               Counts for different parts of a corpus can simply be added together before calling this.
+
+    Returns:
+      A tuple for each bucket, in the same format as calc_bucketed_matches
+    """
+    for both_tot, ref_tot, out_tot in matches:
+      if both_tot == 0:
+        rec, prec, fmeas = 0.0, 0.0, 0.0
+      else:
+        rec = both_tot / float(ref_tot)
+        prec = both_tot / float(out_tot)
+        fmeas = 2 * prec * rec / (prec + rec)
+      yield both_tot, ref_tot, out_tot, rec, prec, fmeas
+
+  def calc_bucketed_match_counts(self, ref, out, ref_labels=None, out_labels=None):
+    """
+    Calculate the raw match counts used by calc_bucketed_matches
+
+    Args:
+      ref: The reference corpus
+      out: The output corpus
+      ref_labels: Labels of the reference corpus (optional)
+      out_labels: Labels of the output corpus (should be specified iff ref_labels is)
+
+    Returns:
+      A list containing [both_tot, ref_tot, out_tot] for each bucket
+    """
     if not hasattr(self, 'case_insensitive'):
       self.case_insensitive = False
-      
+
+    results = parallel_utils.map_chunks(self._calc_bucketed_match_counts, ref, out, ref_labels, out_labels)
+    return [[sum(x) for x in zip(*bucket_matches)] for bucket_matches in zip(*results)]
+
+  def _calc_bucketed_match_counts(self, ref, out, ref_labels, out_labels):
     ref_labels = ref_labels if ref_labels else []
     out_labels = out_labels if out_labels else []
+    case_insensitive = self.case_insensitive
+    # When both corpora share a vocabulary, match on word IDs (of the corpora lowercased once in case-insensitive
+    # mode) and calculate the bucket of each distinct word and label only once
+    vocab = corpus_utils.shared_vocab(ref, out)
+    if vocab is not None:
+      if case_insensitive:
+        ref, out = corpus_utils.lower(ref), corpus_utils.lower(out)
+        case_insensitive = False
+      ref, out = corpus_utils.as_id_sents(ref, out)
+      calc_bucket = self._memoize_calc_bucket(vocab.i2w.__getitem__)
+    else:
+      calc_bucket = self.calc_bucket
     matches = [[0, 0, 0] for x in self.bucket_strs]
     for ref_sent, out_sent, ref_lab, out_lab in itertools.zip_longest(ref, out, ref_labels, out_labels):
       ref_pos = defaultdict(lambda: [])
       for i, word in enumerate(ref_sent):
-        if self.case_insensitive:
+        if case_insensitive:
           word = corpus_utils.lower(word)
         ref_pos[word].append(i)
       for i, word in enumerate(out_sent):
-        if self.case_insensitive:
+        if case_insensitive:
           word = corpus_utils.lower(word)
         if len(ref_pos[word]) > 0:
           ri = ref_pos[word][0]
           ref_pos[word] = ref_pos[word][1:]
-          bucket = self.calc_bucket(word,
-                                    ref_label=ref_lab[ri] if ref_lab else None,
-                                    out_label=out_lab[i] if out_lab else None)
+          bucket = calc_bucket(word,
+                               ref_label=ref_lab[ri] if ref_lab else None,
+                               out_label=out_lab[i] if out_lab else None)
           matches[bucket][0] += 1
           matches[bucket][1] += 1
         else:
-          bucket = self.calc_bucket(word,
-                                    out_label=out_lab[i] if out_lab else None)
+          bucket = calc_bucket(word,
+                               out_label=out_lab[i] if out_lab else None)
         matches[bucket][2] += 1
       for word, my_pos in ref_pos.items():
         if len(my_pos) > 0:
           for ri in my_pos:
-            bucket = self.calc_bucket(ref_sent[ri],
-                                      ref_label=ref_lab[ri] if ref_lab else None)
+            bucket = calc_bucket(ref_sent[ri],
+                                 ref_label=ref_lab[ri] if ref_lab else None)
             matches[bucket][1] += 1
-    for both_tot, ref_tot, out_tot in matches:
-      if both_tot == 0:
-        rec, prec, fmeas = 0.0, 0.0, 0.0
-      else:
-        rec = both_tot / float(ref_tot)
-        prec = both_tot / float(out_tot)
-        fmeas = 2 * prec * rec / (prec + rec)
-      yield both_tot, ref_tot, out_tot, rec, prec, fmeas
+    return matches
+
+  def _memoize_calc_bucket(self, word_str):
+    """
+    Wrap calc_bucket so that it is only calculated once for each combination of word ID and labels
+
+    Args:
+      word_str: A function mapping word IDs to word strings
+
+    Returns:
+      A function with the same arguments as calc_bucket, taking word IDs instead of words
+    """
+    bucket_cache = {}
+    def calc_bucket(word, ref_label=None, out_label=None, src_label=None):
+      key = (word, ref_label, out_label, src_label)
+      bucket = bucket_cache.get(key)
+      if bucket is None:
+        bucket = bucket_cache[key] = self.calc_bucket(word_str(word), ref_label=ref_label, out_label=out_label,
+                                                      src_label=src_label)
+      return bucket
+    return calc_bucket
 
   def calc_source_bucketed_matches(self, src, ref, out, ref_aligns, out_aligns, src_labels=None):
     """
@@ -126,10 +204,37 @@ class WordBucketer(Bucketer):
         prec: precision of the bucket
         fmeas: f1-measure of the bucket
     """
+    return self.calc_match_stats(self.calc_source_bucketed_match_counts(src, ref, out, ref_aligns, out_aligns,
+                                                                        src_labels=src_labels))
+
+  def calc_source_bucketed_match_counts(self, src, ref, out, ref_aligns, out_aligns, src_labels=None):
+    """
+    Calculate the raw match counts used by calc_source_bucketed_matches
+
+    Args:
+      src: The source corpus
+      ref: The reference corpus
+      out: The output corpus
+      ref_aligns: Alignments of the reference corpus
+      out_aligns: Alignments of the output corpus
+      src_labels: Labels of the source corpus (optional)
+
+    Returns:
+      A list containing [both_tot, ref_tot, out_tot] for each bucket
+    """
     if not hasattr(self, 'case_insensitive'):
       self.case_insensitive = False
 
+    if not isinstance(ref_aligns, corpus_utils.Alignments):
+      ref_aligns = corpus_utils.Alignments.from_strs(ref_aligns)
+    if not isinstance(out_aligns, corpus_utils.Alignments):
+      out_aligns = corpus_utils.Alignments.from_strs(out_aligns)
     src_labels = src_labels if src_labels else []
+    if corpus_utils.shared_vocab(ref, out) is not None:
+      if self.case_insensitive:
+        ref, out = corpus_utils.lower(ref), corpus_utils.lower(out)
+      return self._calc_source_id_match_counts(src, ref, out, ref_aligns, out_aligns, src_labels)
+
     matches = [[0, 0, 0] for x in self.bucket_strs]
     for src_sent, ref_sent, out_sent, ref_align, out_align, src_lab in itertools.zip_longest(src, ref, out, ref_aligns, out_aligns, src_labels):
       ref_cnt = defaultdict(lambda: 0)
@@ -137,10 +242,7 @@ class WordBucketer(Bucketer):
         if self.case_insensitive:
           word = corpus_utils.lower(word)
         ref_cnt[word] += 1
-      for i, align in enumerate(out_align):
-        src_index, trg_index = align.split('-')
-        src_index = int(src_index)
-        trg_index = int(trg_index)
+      for src_index, trg_index in out_align:
         src_word = src_sent[src_index]
         word = out_sent[trg_index]
         if self.case_insensitive:
@@ -151,23 +253,68 @@ class WordBucketer(Bucketer):
           ref_cnt[word] -= 1
           matches[bucket][0] += 1
         matches[bucket][2] += 1
-      for i, align in enumerate(ref_align):
-        src_index, trg_index = align.split('-')
-        src_index = int(src_index)
-        trg_index = int(trg_index)
+      for src_index, trg_index in ref_align:
         src_word = src_sent[src_index]
         bucket = self.calc_bucket(src_word,
                                   src_label=src_lab[src_index] if src_lab else None)
         matches[bucket][1] += 1
+    return matches
 
-    for both_tot, ref_tot, out_tot in matches:
-      if both_tot == 0:
-        rec, prec, fmeas = 0.0, 0.0, 0.0
-      else:
-        rec = both_tot / float(ref_tot)
-        prec = both_tot / float(out_tot)
-        fmeas = 2 * prec * rec / (prec + rec)
-      yield both_tot, ref_tot, out_tot, rec, prec, fmeas
+  def _calc_source_id_match_counts(self, src, ref, out, ref_aligns, out_aligns, src_labels):
+    """
+    Calculate the same counts as calc_source_bucketed_match_counts with array operations over all alignment
+    links at once, for a reference and output that are Corpus objects with a shared vocabulary (and already
+    lowercased in case-insensitive mode)
+    """
+    num_sents = len(ref)
+    if not len(src) == len(out) == len(ref_aligns) == len(out_aligns) == num_sents:
+      raise ValueError('The source, reference, output and alignments should have the same number of sentences.')
+    # The bucket of every source word, calling calc_bucket only once for every distinct word and label
+    src_vocab = corpus_utils.shared_vocab(src)
+    if src_vocab is not None:
+      src_sents, calc_bucket = src.iter_ids(), self._memoize_calc_bucket(src_vocab.i2w.__getitem__)
+    else:
+      src_sents, calc_bucket = src, self._memoize_calc_bucket(lambda x: x)
+    src_buckets, src_offsets = [], [0]
+    for src_sent, src_lab in itertools.zip_longest(src_sents, src_labels):
+      for i, word in enumerate(src_sent):
+        src_buckets.append(calc_bucket(word, src_label=src_lab[i] if src_lab else None))
+      src_offsets.append(len(src_buckets))
+    src_buckets, src_offsets = np.array(src_buckets, dtype=np.int64), np.array(src_offsets, dtype=np.int64)
+
+    def link_positions(aligns, column, offsets):
+      # Index of each link's sentence, and the position of its source/target word in the flat corpus
+      link_sents = np.repeat(np.arange(num_sents), np.diff(aligns.offsets))
+      indices = aligns.links[:, column].astype(np.int64)
+      if np.any(indices >= offsets[link_sents + 1] - offsets[link_sents]) or np.any(indices < 0):
+        raise IndexError('An alignment link points outside of its sentence.')
+      return link_sents, offsets[link_sents] + indices
+
+    num_buckets = len(self.bucket_strs)
+    _, ref_src_pos = link_positions(ref_aligns, 0, src_offsets)
+    ref_tot = np.bincount(src_buckets[ref_src_pos], minlength=num_buckets)
+    _, out_src_pos = link_positions(out_aligns, 0, src_offsets)
+    out_link_buckets = src_buckets[out_src_pos]
+    out_tot = np.bincount(out_link_buckets, minlength=num_buckets)
+
+    # An output link is a match if its target word has not yet been used up by earlier links of the sentence,
+    # i.e. if its rank among the links to the same word is smaller than the count of the word in the reference
+    num_words = len(ref.vocab)
+    out_sents, out_trg_pos = link_positions(out_aligns, 1, out.offsets)
+    out_keys = out_sents * num_words + out.ids[out_trg_pos]
+    ref_sents = np.repeat(np.arange(num_sents), np.diff(ref.offsets))
+    ref_keys, ref_counts = np.unique(ref_sents * num_words + ref.ids, return_counts=True)
+    order = np.argsort(out_keys, kind='stable')
+    sorted_keys = out_keys[order]
+    is_start = np.ones(len(sorted_keys), dtype=bool)
+    is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    starts = np.flatnonzero(is_start)
+    ranks = np.arange(len(sorted_keys)) - np.repeat(starts, np.diff(np.append(starts, len(sorted_keys))))
+    found = np.minimum(np.searchsorted(ref_keys, sorted_keys), max(len(ref_keys) - 1, 0))
+    available = np.where(ref_keys[found] == sorted_keys, ref_counts[found], 0) if len(ref_keys) else 0
+    both_tot = np.bincount(out_link_buckets[order][ranks < available], minlength=num_buckets)
+
+    return np.stack([both_tot, ref_tot, out_tot], axis=1).tolist()
 
   def calc_bucketed_likelihoods(self, corpus, likelihoods):
     """
@@ -233,7 +380,7 @@ class FreqWordBucketer(WordBucketer):
       freq_counts = defaultdict(lambda: 0)
       if freq_count_file != None:
         print(f'Reading frequency from "{freq_count_file}"')
-        with open(freq_count_file, "r") as f:
+        with corpus_utils.open_text(freq_count_file) as f:
           for line in f:
             word, freq = line.strip().split('\t')
             if self.case_insensitive:
@@ -242,12 +389,11 @@ class FreqWordBucketer(WordBucketer):
               freq_counts[word] = int(freq)
       elif freq_corpus_file:
         print(f'Reading frequency from "{freq_corpus_file}"')
-        for words in corpus_utils.iterate_tokens(freq_corpus_file):
-          for word in words:
-            if self.case_insensitive:
-              freq_counts[corpus_utils.lower(word)] += 1
-            else:
-              freq_counts[word] += 1
+        for word, count in corpus_utils.count_words(freq_corpus_file).items():
+          if self.case_insensitive:
+            freq_counts[corpus_utils.lower(word)] += count
+          else:
+            freq_counts[word] += count
       elif freq_data:
         print('Reading frequency from the reference')
         for words in freq_data:
@@ -360,6 +506,21 @@ class SentenceBucketer(Bucketer):
     """
     raise NotImplementedError('calc_bucket must be implemented in subclasses of SentenceBucketer')
 
+  def calc_buckets(self, out, ref, labels=None):
+    """
+    Calculate the buckets for all the sentences of a corpus
+
+    Args:
+      out: The output corpus
+      ref: The reference corpus
+      labels: The label of each sentence, if they exist
+
+    Returns:
+      A list with the integer ID of the bucket of each sentence
+    """
+    return [self.calc_bucket(out_words, ref=ref_words, label=(labels[i] if labels else None))
+            for i, (out_words, ref_words) in enumerate(zip(out, ref))]
+
   def create_bucketed_corpus(self, out, ref=None, ref_labels=None, out_labels=None):
     bucketed_corpus = [([],[] if ref else None) for _ in self.bucket_strs]
     if ref is None:
@@ -368,8 +529,10 @@ class SentenceBucketer(Bucketer):
     if ref_labels is None:
       ref_labels = out_labels
     
-    for i, (out_words, ref_words) in enumerate(zip(out, ref)):
-      bucket = self.calc_bucket(out_words, ref=(ref_words if ref else None), label=(ref_labels[i][0] if ref_labels else None))
+    labels = [x[0] for x in ref_labels] if ref_labels else None
+    buckets = parallel_utils.concat_lists(parallel_utils.map_chunks(
+      lambda o, r, lab: self.calc_buckets(o, r, labels=lab), out, ref, labels))
+    for bucket, out_words, ref_words in zip(buckets, out, ref):
       bucketed_corpus[bucket][0].append(out_words)
       if ref != None:
         bucketed_corpus[bucket][1].append(ref_words)
@@ -394,6 +557,11 @@ class ScoreSentenceBucketer(SentenceBucketer):
     else:
       return self.cutoff_into_bucket(self.scorer.score_sentence(ref, val)[0])
 
+  def calc_buckets(self, out, ref, labels=None):
+    if self.case_insensitive:
+      ref, out = corpus_utils.lower(ref), corpus_utils.lower(out)
+    return [self.cutoff_into_bucket(score) for score, _ in self.scorer.score_sentences(ref, out)]
+
   def name(self):
     return self.scorer.name()
 
@@ -413,6 +581,9 @@ class LengthSentenceBucketer(SentenceBucketer):
   def calc_bucket(self, val, ref=None, label=None):
     return self.cutoff_into_bucket(len(val))
 
+  def calc_buckets(self, out, ref, labels=None):
+    return self.cutoffs_into_buckets(corpus_utils.sent_lengths(out))
+
   def name(self):
     return "length"
 
@@ -432,6 +603,9 @@ class LengthDiffSentenceBucketer(SentenceBucketer):
   def calc_bucket(self, val, ref=None, label=None):
     return self.cutoff_into_bucket(len(val) - len(ref))
 
+  def calc_buckets(self, out, ref, labels=None):
+    return self.cutoffs_into_buckets(corpus_utils.sent_lengths(out) - corpus_utils.sent_lengths(ref))
+
   def name(self):
     return "len(output)-len(reference)"
 
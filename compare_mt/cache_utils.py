@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import weakref
+import numpy as np
+
+from compare_mt import corpus_utils
+from compare_mt import scorers
+
+# Global variable holding the persistent cache of sufficient statistics (None to disable it)
+global_score_cache = None
+
+# Version of the cached statistics, to be increased whenever a scorer changes the statistics it caches
+_CACHE_VERSION = 1
+
+# Default maximum size of the score cache in bytes
+DEFAULT_MAX_SIZE = 1 << 30
+
+# Text hashes of the Corpus objects seen so far, which are kept only as long as the corpora themselves
+_corpus_hashes = weakref.WeakKeyDictionary()
+
+def corpus_text_hash(corpus):
+  """
+  Calculate a hash of the tokenized text of a corpus, which does not depend on the vocabulary or on the file it was
+  read from. It is calculated only once for each Corpus object.
+
+  Args:
+    corpus: A corpus, or a MultiReference
+
+  Returns:
+    A hexadecimal SHA-1 digest of the corpus
+  """
+  if isinstance(corpus, corpus_utils.MultiReference):
+    text_hashes = ' '.join(corpus_text_hash(x) for x in corpus.refs)
+    return hashlib.sha1(f'multi {text_hashes}'.encode('utf-8')).hexdigest()
+  is_corpus = isinstance(corpus, corpus_utils.Corpus)
+  if is_corpus and corpus in _corpus_hashes:
+    return _corpus_hashes[corpus]
+  sha = hashlib.sha1()
+  for sent in corpus:
+    sha.update(' '.join(sent).encode('utf-8'))
+    sha.update(b'\n')
+  text_hash = sha.hexdigest()
+  if is_corpus:
+    _corpus_hashes[corpus] = text_hash
+  return text_hash
+
+def scorer_config(scorer):
+  """
+  Describe the configuration of a scorer: its class, ID string, scale, and all its public settings with simple
+  values (e.g. case sensitivity, weights or the ROUGE type)
+
+  Args:
+    scorer: A scorer
+
+  Returns:
+    A dictionary that can be serialized as JSON
+  """
+  params = {}
+  for name, value in sorted(vars(scorer).items()):
+    if name.startswith('_'):
+      continue
+    if isinstance(value, np.ndarray):
+      value = value.tolist()
+    if isinstance(value, (str, int, float, bool, type(None), list, tuple)):
+      params[name] = value
+  return {'class': type(scorer).__name__, 'idstr': scorer.idstr(), 'scale': scorer.scale, 'params': params}
+
+class ScoreCache(object):
+  """
+  A persistent cache of the sufficient statistics calculated by `Scorer.cache_stats`, keyed by the scorer
+  configuration and the text of the reference and output corpora.
+
+  Each entry is stored in its own .npy file. Reading an entry marks it as recently used, and the least recently
+  used entries are deleted whenever the cache grows beyond its maximum size. Only statistics that are numpy arrays
+  (or SufficientStats) are stored.
+  """
+  def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+    """
+    Args:
+      directory: The directory of the cache
+      max_size: The maximum size of the cache in bytes
+    """
+    self.directory = directory
+    self.max_size = max_size
+
+  def key(self, scorer, ref, out):
+    """
+    Build the key of the statistics of a scorer for a reference and an output corpus
+
+    Returns:
+      A hexadecimal SHA-1 digest
+    """
+    desc = {'version': _CACHE_VERSION, 'scorer': scorer_config(scorer),
+            'ref': corpus_text_hash(ref), 'out': corpus_text_hash(out)}
+    return hashlib.sha1(json.dumps(desc, sort_keys=True).encode('utf-8')).hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.directory, 'stats', f'{key}.npy')
+
+  def get(self, key):
+    """
+    Read cached statistics
+
+    Args:
+      key: The key of the statistics
+
+    Returns:
+      The SufficientStats, or None if they are not in the cache
+    """
+    path = self._path(key)
+    try:
+      stats = np.load(path, allow_pickle=False)
+      os.utime(path)
+    except (OSError, ValueError):
+      return None
+    return scorers.SufficientStats(stats)
+
+  def put(self, key, stats):
+    """
+    Store statistics in the cache, evicting the least recently used entries if the cache becomes too large
+
+    Args:
+      key: The key of the statistics
+      stats: The statistics (ignored if they are not a numpy array or SufficientStats)
+    """
+    if isinstance(stats, scorers.SufficientStats):
+      stats = stats.data
+    if not isinstance(stats, np.ndarray) or stats.dtype == object:
+      return
+    corpus_utils._atomic_write(self._path(key), lambda f: np.save(f, stats, allow_pickle=False))
+    self.evict()
+
+  def evict(self):
+    """
+    Delete the least recently used entries until the cache is no larger than its maximum size
+    """
+    entries = []
+    with os.scandir(os.path.join(self.directory, 'stats')) as it:
+      for entry in it:
+        if entry.name.endswith('.npy'):
+          try:
+            stat = entry.stat()
+          except OSError:
+            continue
+          entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total_size <= self.max_size:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      total_size -= size
+
+def cache_stats(scorer, ref, out):
+  """
+  Get the sufficient statistics of a scorer for a corpus, from the global score cache if possible
+
+  Args:
+    scorer: A scorer
+    ref: A reference corpus
+    out: An output corpus
+
+  Returns:
+    The statistics returned by `scorer.cache_stats`
+  """
+  return cache_system_stats(scorer, ref, [out])[0]
+
+def cache_system_stats(scorer, ref, outs):
+  """
+  Get the sufficient statistics of a scorer for several systems, from the global score cache if possible. The
+  statistics that are not cached are calculated together with `scorer.cache_system_stats`, and stored.
+
+  Args:
+    scorer: A scorer
+    ref: A reference corpus
+    outs: A list of output corpora
+
+  Returns:
+    A list with the statistics of each system
+  """
+  cache = global_score_cache
+  keys = [cache.key(scorer, ref, out) for out in outs] if cache is not None else [None] * len(outs)
+  stats = [cache.get(key) for key in keys] if cache is not None else [None] * len(outs)
+  missing = [i for i, x in enumerate(stats) if x is None]
+  if missing:
+    computed = scorer.cache_system_stats(ref, [outs[i] for i in missing])
+    for i, x in zip(missing, computed):
+      stats[i] = x
+      if cache is not None and x is not None:
+        cache.put(keys[i], x)
+  return stats
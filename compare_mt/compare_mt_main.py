@@ -1,5 +1,6 @@
 # Overall imports
 import argparse
+import itertools
 import operator
 from whatthelang import WhatTheLang
 import langid
@@ -16,42 +17,64 @@ from compare_mt import reporters
 from compare_mt import arg_utils
 from compare_mt import formatting
 from compare_mt import repetition_utils
+from compare_mt import streaming_utils
+from compare_mt import cache_utils
+from compare_mt import parallel_utils
 
 def generate_score_report(ref, outs,
                        score_type='bleu',
                        bootstrap=0, prob_thresh=0.05,
-                       meteor_directory=None, options=None,
+                       meteor_directory=None, options=None, meteor_workers=1,
                        title=None, 
-                       case_insensitive=False):
+                       case_insensitive=False,
+                       sample_ratio=0.5, with_replacement=False):
   """
   Generate a report comparing overall scores of system(s) in both plain text and graphs.
 
   Args:
-    ref: Tokens from the reference
+    ref: Tokens from the reference, or a MultiReference with several references (only used by the scorers that
+         support them, the others use the first reference)
     outs: Tokens from the output file(s)
     score_type: A string specifying the scoring type (bleu/length)
     bootstrap: Number of samples for significance test (0 to disable)
     prob_thresh: P-value threshold for significance test
     meteor_directory: Path to the directory of the METEOR code
     options: Options when using external program
+    meteor_workers: Number of METEOR processes that score different systems at the same time
     compare_directions: A string specifying which systems to compare 
     title: A string specifying the caption of the printed table
     case_insensitive: A boolean specifying whether to turn on the case insensitive option
+    sample_ratio: The size of each bootstrap sample relative to the test set
+    with_replacement: A boolean specifying whether to draw the bootstrap samples with replacement
   """
   bootstrap = int(bootstrap)
   prob_thresh = float(prob_thresh)
+  meteor_workers = int(meteor_workers)
   case_insensitive = True if case_insensitive == 'True' else False
-
-  scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive, meteor_directory=meteor_directory, options=options)
-
-  scores, strs = zip(*[scorer.score_corpus(ref, out) for out in outs])
+  sample_ratio = float(sample_ratio)
+  with_replacement = True if with_replacement == 'True' else False
+
+  scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive, meteor_directory=meteor_directory, options=options, meteor_workers=meteor_workers)
+  if isinstance(ref, corpus_utils.MultiReference) and not scorer.multi_reference:
+    ref = ref.refs[0]
+
+  # The statistics of each system are calculated (or read from the score cache) only once, for both the scores
+  # and the bootstrap
+  cached_stats = cache_utils.cache_system_stats(scorer, ref, outs)
+  if all(x is not None for x in cached_stats):
+    scores, strs = zip(*[scorer.score_cached_corpus(range(len(ref)), x) for x in cached_stats])
+  else:
+    cached_stats = None
+    scores, strs = zip(*[scorer.score_corpus(ref, out) for out in outs])
 
   if bootstrap != 0:
     direcs = []
     for i in range(len(scores)):
       for j in range(i+1, len(scores)):
         direcs.append( (i,j) )
-    wins, sys_stats = sign_utils.eval_with_paired_bootstrap(ref, outs, scorer, direcs, num_samples=bootstrap)
+    wins, sys_stats = sign_utils.eval_with_paired_bootstrap(ref, outs, scorer, direcs, num_samples=bootstrap,
+                                                            sample_ratio=sample_ratio, cached_stats=cached_stats,
+                                                            with_replacement=with_replacement)
     wins = list(zip(direcs, wins))
   else:
     wins = sys_stats = direcs = None
@@ -104,8 +127,9 @@ def generate_word_accuracy_report(ref, outs,
                                                          freq_data=ref,
                                                          label_set=label_set,
                                                          case_insensitive=case_insensitive)
-  ref_labels = corpus_utils.load_tokens(ref_labels) if type(ref_labels) == str else ref_labels
-  out_labels = [corpus_utils.load_tokens(out_labels[i]) if not out_labels is None else None for i in range(len(outs))]
+  vocab = corpus_utils.shared_vocab(ref)
+  ref_labels = corpus_utils.load_corpus(ref_labels, vocab=vocab) if type(ref_labels) == str else ref_labels
+  out_labels = [corpus_utils.load_corpus(out_labels[i], vocab=vocab) if not out_labels is None else None for i in range(len(outs))]
   matches = [bucketer.calc_bucketed_matches(ref, out, ref_labels=ref_labels, out_labels=out_label) for out, out_label in zip(outs, out_labels)]
   
   reporter = reporters.WordReport(bucketer=bucketer, matches=matches,
@@ -150,8 +174,9 @@ def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None, out_a
   if not src or not ref_align_file or not out_align_files:
     raise ValueError("Must specify the source and the alignment files when performing source analysis.")
 
-  ref_align = corpus_utils.load_tokens(ref_align_file) 
-  out_aligns = [corpus_utils.load_tokens(x) for x in arg_utils.parse_files(out_align_files)]
+  vocab = corpus_utils.shared_vocab(ref)
+  ref_align = corpus_utils.load_alignments(ref_align_file)
+  out_aligns = [corpus_utils.load_alignments(x) for x in arg_utils.parse_files(out_align_files)]
 
   if len(out_aligns) != len(outs):
     raise ValueError(f'The number of output files should be equal to the number of output alignment files.')
@@ -163,7 +188,7 @@ def generate_src_word_accuracy_report(ref, outs, src, ref_align_file=None, out_a
                                                          freq_data=src,
                                                          label_set=label_set,
                                                          case_insensitive=case_insensitive)
-  src_labels = corpus_utils.load_tokens(src_labels) if type(src_labels) == str else src_labels
+  src_labels = corpus_utils.load_corpus(src_labels, vocab=vocab) if type(src_labels) == str else src_labels
   matches = [bucketer.calc_source_bucketed_matches(src, ref, out, ref_align, out_align, src_labels=src_labels) for out, out_align in zip(outs, out_aligns)]
 
   reporter = reporters.WordReport(bucketer=bucketer, matches=matches,
@@ -198,7 +223,7 @@ def generate_sentence_bucketed_report(ref, outs,
   case_insensitive = True if case_insensitive == 'True' else False
 
   if ref_labels is not None:
-    ref_labels = corpus_utils.load_tokens(ref_labels) if type(ref_labels) == str else ref_labels
+    ref_labels = corpus_utils.load_corpus(ref_labels, vocab=corpus_utils.shared_vocab(ref)) if type(ref_labels) == str else ref_labels
     if len(ref_labels) != len(ref):
       raise ValueError(f'The number of labels should be equal to the number of sentences.')
 
@@ -207,7 +232,7 @@ def generate_sentence_bucketed_report(ref, outs,
     if len(out_labels) != len(outs):
       raise ValueError(f'The number of output files should be equal to the number of output labels.')
 
-    out_labels = [corpus_utils.load_tokens(out_label) if type(out_label) == str else out_label for out_label in out_labels]
+    out_labels = [corpus_utils.load_corpus(out_label, vocab=corpus_utils.shared_vocab(ref)) if type(out_label) == str else out_label for out_label in out_labels]
     for out, out_label in zip(outs, out_labels):
       if len(out_label) != len(out):
         raise ValueError(f'The number of labels should be equal to the number of sentences.')
@@ -290,8 +315,9 @@ def generate_ngram_report(ref, outs,
     ref = corpus_utils.lower(ref)
     outs = [corpus_utils.lower(out) for out in outs]
 
-  ref_labels = corpus_utils.load_tokens(ref_labels) if type(ref_labels) == str else ref_labels
-  out_labels = [corpus_utils.load_tokens(out_labels[i]) if not out_labels is None else None for i in range(len(outs))]
+  vocab = corpus_utils.shared_vocab(ref)
+  ref_labels = corpus_utils.load_corpus(ref_labels, vocab=vocab) if type(ref_labels) == str else ref_labels
+  out_labels = [corpus_utils.load_corpus(out_labels[i], vocab=vocab) if not out_labels is None else None for i in range(len(outs))]
   totals, matches, overs, unders = zip(*[ngram_utils.compare_ngrams(ref, out, ref_labels=ref_labels, out_labels=out_label,
                                                              min_length=min_ngram_length, max_length=max_ngram_length) for out, out_label in zip(outs, out_labels)])
   direcs = arg_utils.parse_compare_directions(compare_directions)
@@ -346,23 +372,20 @@ def generate_sentence_examples(ref, outs, src=None,
 
   direcs = arg_utils.parse_compare_directions(compare_directions)
 
-  scorediff_lists = []
-  for (left, right) in direcs:
-    scorediff_list = []
-    deduplicate_set = set()
-    for i, (o1, o2, r) in enumerate(zip(outs[left], outs[right], ref)):
-      if (tuple(o1), tuple(o2), tuple(r)) in deduplicate_set:
-        continue
-      deduplicate_set.add( (tuple(o1), tuple(o2), tuple(r)) )
-      s1, str1 = scorer.score_sentence(r, o1)
-      s2, str2 = scorer.score_sentence(r, o2)
-      scorediff_list.append((s2-s1, s1, s2, str1, str2, i))
-    scorediff_list.sort()
-    scorediff_lists.append(scorediff_list)
+  # Score every compared system once, and deduplicate sentences by their hashes instead of copies of the sentences
+  compared = set(itertools.chain.from_iterable(direcs))
+  sent_scores = [scorer.score_sentences(ref, out) if i in compared else None for i, out in enumerate(outs)]
+  out_hashes = [corpus_utils.sent_hashes(out) if i in compared else None for i, out in enumerate(outs)]
+  scorediff_lists = stat_utils.calc_scorediff_lists(sent_scores, corpus_utils.sent_hashes(ref), out_hashes, direcs)
 
+  # The report only keeps lazily loaded views of the corpora, from which it reads the few sentences it prints
+  example_ids = set(x[-1] for scorediff_list in scorediff_lists
+                    for x in scorediff_list[:report_length] + scorediff_list[-report_length:])
   reporter = reporters.SentenceExampleReport(report_length=report_length, scorediff_lists=scorediff_lists,
                                              scorer=scorer,
-                                             ref=ref, outs=outs, src=src,
+                                             ref=corpus_utils.lazy_view(ref, example_ids),
+                                             outs=[corpus_utils.lazy_view(out, example_ids) for out in outs],
+                                             src=corpus_utils.lazy_view(src, example_ids),
                                              compare_directions=direcs,
                                              title=title)
   reporter.generate_report()
@@ -409,9 +432,10 @@ def generate_repetitions_examples(ref, outs, src=None, report_length=10, title=N
                                                                ngram_order=ngram_order,
                                                                ignore_legitimate_reps=ignore_legitimate_reps)
 
-    reporter = reporters.RepetitionExamplesReport(ref=ref,
-                                                  outs=outs,
-                                                  src=src,
+    example_ids = set(itertools.chain.from_iterable(repetition_examples))
+    reporter = reporters.RepetitionExamplesReport(ref=corpus_utils.lazy_view(ref, example_ids),
+                                                  outs=[corpus_utils.lazy_view(out, example_ids) for out in outs],
+                                                  src=corpus_utils.lazy_view(src, example_ids),
                                                   repetition_examples=repetition_examples,
                                                   title=title,
                                                   report_length=report_length,
@@ -471,7 +495,8 @@ def main():
       description='Program to compare MT results',
   )
   parser.add_argument('ref_file', type=str,
-                      help='A path to a correct reference file')
+                      help='A path to a correct reference file, or several reference files separated by semicolons. '
+                           'Several references are used by the BLEU scores, and the other analyses use the first one')
   parser.add_argument('out_files', type=str, nargs='+',
                       help='Paths to system outputs')
   parser.add_argument('--sys_names', type=str, nargs='+', default=None,
@@ -540,6 +565,35 @@ def main():
                       help="""
                       The name of the HTML report.
                       """)
+  parser.add_argument('--streaming', action='store_true',
+                      help="""
+                      Read all input files in a single pass instead of loading them into memory, accumulating only the
+                      statistics needed by the reports. Repetition examples and language identification are skipped.
+                      """)
+  parser.add_argument('--cache_dir', type=str, default=None,
+                      help="""
+                      A directory where pre-tokenized binary copies of the input files are cached.
+                      Later runs re-use (memory-map) them instead of re-reading the text as long as the files are unchanged.
+                      """)
+  parser.add_argument('--score_cache_dir', type=str, default=None,
+                      help="""
+                      A directory where the sufficient statistics of the scores are cached, so that later runs on the
+                      same reference and outputs do not calculate them again.
+                      """)
+  parser.add_argument('--score_cache_size', type=int, default=1024,
+                      help="""
+                      The maximum size of the score cache in megabytes. The least recently used statistics are deleted
+                      when it grows larger.
+                      """)
+  parser.add_argument('--load_workers', type=int, default=4,
+                      help="""
+                      The number of input files (outputs, labels, alignments, etc.) that are read at the same time.
+                      """)
+  parser.add_argument('--jobs', type=int, default=1,
+                      help="""
+                      The number of processes that share the per-sentence work of the scorers, bucketers, n-gram and
+                      repetition analyses. The reports are the same whatever the number of processes.
+                      """)
   parser.add_argument('--decimals', type=int, default=4,
                       help="Number of decimals to print for floating point numbers")
   parser.add_argument('--scorer_scale', type=float, default=100, choices=[1, 100],
@@ -558,16 +612,92 @@ def main():
   # Set scale
   scorers.global_scorer_scale = args.scorer_scale
 
-  ref = corpus_utils.load_tokens(args.ref_file)
-  outs = [corpus_utils.load_tokens(x) for x in args.out_files]
+  # Set number of processes
+  parallel_utils.global_jobs = args.jobs
+
+  # Set corpus cache
+  corpus_utils.global_cache_dir = args.cache_dir
 
-  src = corpus_utils.load_tokens(args.src_file) if args.src_file else None 
-  reporters.sys_names = args.sys_names if args.sys_names else [f'sys{i+1}' for i in range(len(outs))]
+  # Set score cache
+  if args.score_cache_dir is not None:
+    cache_utils.global_score_cache = cache_utils.ScoreCache(args.score_cache_dir,
+                                                            max_size=args.score_cache_size * (1 << 20))
+
+  reporters.sys_names = args.sys_names if args.sys_names else [f'sys{i+1}' for i in range(len(args.out_files))]
   reporters.fig_size = tuple([float(x) for x in args.fig_size.split('x')])
-  if len(reporters.sys_names) != len(outs):
-    raise ValueError(f'len(sys_names) != len(outs) -- {len(reporters.sys_names)} != {len(outs)}')
+  if len(reporters.sys_names) != len(args.out_files):
+    raise ValueError(f'len(sys_names) != len(outs) -- {len(reporters.sys_names)} != {len(args.out_files)}')
+
+  if args.streaming:
+    reports = generate_streaming_reports(args)
+  else:
+    reports = generate_reports(args)
 
+  # Write all reports into a single html file
+  if args.output_directory != None:
+    reporters.generate_html_report(reports, args.output_directory, args.report_title)
+
+def generate_reports(args):
+  """
+  Load all the input files and generate the reports requested in the arguments
+
+  Args:
+    args: The parsed command line arguments
+
+  Returns:
+    A list of (report name, reporters) tuples
+  """
+  # All corpora share one vocabulary so that words can be compared by their integer IDs. Every file that
+  # the reports will need is read up front by a pool of workers and then loaded only once.
+  loader = corpus_utils.CorpusLoader(num_workers=args.load_workers)
+  corpus_utils.global_loader = loader
+  try:
+    loader.preload(*_input_files(args))
+    refs = [loader.load(x) for x in arg_utils.parse_files(args.ref_file)]
+    outs = [loader.load(x) for x in args.out_files]
+    src = loader.load(args.src_file) if args.src_file else None
+    return _generate_reports(args, refs, outs, src)
+  finally:
+    loader.close()
+    corpus_utils.global_loader = None
+
+# Arguments of the report profiles that name input files, and whether they can hold several files
+_PROFILE_CORPUS_ARGS = [('ref_labels', False), ('out_labels', True), ('src_labels', False)]
+_PROFILE_ALIGNMENT_ARGS = [('ref_align_file', False), ('out_align_files', True)]
+
+def _input_files(args):
+  """
+  Find all the files that will be read when generating the reports requested in the arguments
+
+  Args:
+    args: The parsed command line arguments
+
+  Returns:
+    A list of files that are loaded as corpora, a list of files whose words are counted, and a list of
+    alignment files
+  """
+  filenames = arg_utils.parse_files(args.ref_file) + args.out_files + ([args.src_file] if args.src_file else [])
+  counted_filenames, alignment_filenames = [], []
+  profile_args = [args.compare_word_accuracies, args.compare_src_word_accuracies, args.compare_sentence_buckets,
+                  args.compare_ngrams]
+  for profile in itertools.chain.from_iterable(x for x in profile_args if x is not None):
+    kargs = arg_utils.parse_profile(profile)
+    for names, file_args in [(filenames, _PROFILE_CORPUS_ARGS), (alignment_filenames, _PROFILE_ALIGNMENT_ARGS)]:
+      for key, multiple in file_args:
+        if kargs.get(key):
+          names += arg_utils.parse_files(kargs[key]) if multiple else [kargs[key]]
+    if kargs.get('freq_corpus_file') and not kargs.get('freq_count_file'):
+      counted_filenames.append(kargs['freq_corpus_file'])
+  return filenames, counted_filenames, alignment_filenames
+
+def _generate_reports(args, refs, outs, src):
+  """
+  Generate the reports requested in the arguments from the loaded corpora. The score reports get all the
+  references, and the other reports the first one.
+  """
   reports = []
+  ref = refs[0]
+  score_ref = corpus_utils.MultiReference(refs) if len(refs) > 1 else ref
 
   report_types = [
     (args.compare_scores, generate_score_report, 'Aggregate Scores', False),
@@ -585,14 +715,48 @@ def main():
 
   for arg, func, name, use_src in report_types:
     if arg is not None:
+      func_ref = score_ref if func is generate_score_report else ref
       if use_src:
-        reports.append( (name, [func(ref, outs, src, **arg_utils.parse_profile(x)) for x in arg]) )
+        reports.append( (name, [func(func_ref, outs, src, **arg_utils.parse_profile(x)) for x in arg]) )
       else:
-        reports.append( (name, [func(ref, outs, **arg_utils.parse_profile(x)) for x in arg]) )
+        reports.append( (name, [func(func_ref, outs, **arg_utils.parse_profile(x)) for x in arg]) )
+  return reports
 
-  # Write all reports into a single html file
-  if args.output_directory != None:
-    reporters.generate_html_report(reports, args.output_directory, args.report_title)
+def generate_streaming_reports(args):
+  """
+  Generate the reports requested in the arguments with a single pass over the input files
+
+  Args:
+    args: The parsed command line arguments
+
+  Returns:
+    A list of (report name, reporters) tuples
+  """
+  report_types = [
+    (args.compare_scores, 'score', 'Aggregate Scores'),
+    (args.compare_word_accuracies, 'word_accuracy', 'Word Accuracies'),
+    (args.compare_src_word_accuracies, 'src_word_accuracy', 'Source Word Accuracies'),
+    (args.compare_sentence_buckets, 'sentence_bucket', 'Sentence Buckets'),
+    (args.compare_repetitions, 'repetition', 'Repetition Statistics')]
+  if len(args.out_files) > 1:
+    report_types += [
+      (args.compare_ngrams, 'ngram', 'Characteristic N-grams'),
+      (args.compare_sentence_examples, 'sentence_example', 'Sentence Examples'),
+    ]
+  unsupported = [
+    (args.compare_repetition_examples, 'Repetition Examples'),
+    (args.lang_id, 'Language Identification')]
+  for arg, name in unsupported:
+    if arg:
+      print(f'Skipping "{name}" as it is not supported in streaming mode')
+
+  ref_files = arg_utils.parse_files(args.ref_file)
+  if len(ref_files) > 1:
+    print('Only the first reference is used in streaming mode')
+
+  report_profiles = [(name, report_type, arg) for arg, report_type, name in report_types if arg is not None]
+  return streaming_utils.generate_streaming_reports(ref_files[0], args.out_files, src_file=args.src_file,
+                                                    report_profiles=report_profiles)
 
 if __name__ == '__main__':
   main()
@@ -1,11 +1,151 @@
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import queue
+import tempfile
+import threading
+import numpy as np
+
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Global variable specifying the directory for pre-tokenized corpus caches (None to disable caching)
+global_cache_dir = None
+
+# Global variable holding the CorpusLoader of the current run (None to load every file when requested)
+global_loader = None
+
+# Number of sentences converted to Python lists at once when iterating over a Corpus
+_ITER_BLOCK_SIZE = 10000
+
+# Locks of the cache entries that the threads of this process are reading or creating, by entry prefix
+_cache_entry_locks = defaultdict(threading.Lock)
+_cache_entry_locks_lock = threading.Lock()
+
+# Size of the blocks read at once when finding the offsets of the lines of a file
+_INDEX_BLOCK_SIZE = 1 << 20
+
+# Size of the decompressed chunks passed from the background decompression thread, and the number of chunks
+# that may be buffered ahead of the reader
+_DECOMPRESS_CHUNK_SIZE = 1 << 20
+_DECOMPRESS_QUEUE_SIZE = 8
+
+def _open_zstd(filename):
+  try:
+    import zstandard
+  except ImportError:
+    raise ImportError(f'Reading zstd-compressed file "{filename}" requires the zstandard package '
+                      '(pip install zstandard)')
+  return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+
+# Magic bytes at the start of a file and the function used to open a decompressed binary stream
+_COMPRESSION_FORMATS = [
+  (b'\x1f\x8b', lambda x: gzip.open(x, 'rb')),
+  (b'\xfd7zXZ\x00', lambda x: lzma.open(x, 'rb')),
+  (b'BZh', lambda x: bz2.open(x, 'rb')),
+  (b'\x28\xb5\x2f\xfd', _open_zstd),
+]
+
+class _BackgroundDecompressor(io.RawIOBase):
+  """
+  A raw binary stream returning data that is decompressed in a background thread.
+
+  The decompressors release the GIL while working, so decompression of the next chunks overlaps with
+  the parsing of the current one.
+  """
+  def __init__(self, stream):
+    self.stream = stream
+    self.chunks = queue.Queue(maxsize=_DECOMPRESS_QUEUE_SIZE)
+    self.stopped = threading.Event()
+    self.buffer = b''
+    self.finished = False
+    self.thread = threading.Thread(target=self._decompress, daemon=True)
+    self.thread.start()
+
+  def _put(self, item):
+    while not self.stopped.is_set():
+      try:
+        self.chunks.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _decompress(self):
+    try:
+      with self.stream:
+        while True:
+          chunk = self.stream.read(_DECOMPRESS_CHUNK_SIZE)
+          if not self._put(chunk) or not chunk:
+            return
+    except Exception as e:
+      self._put(e)
+
+  def readable(self):
+    return True
+
+  def readinto(self, b):
+    while not self.buffer and not self.finished:
+      chunk = self.chunks.get()
+      if isinstance(chunk, Exception):
+        self.finished = True
+        raise chunk
+      self.buffer = memoryview(chunk)
+      self.finished = not chunk
+    n = min(len(b), len(self.buffer))
+    b[:n] = self.buffer[:n]
+    self.buffer = self.buffer[n:]
+    return n
+
+  def close(self):
+    if not self.closed:
+      self.stopped.set()
+      self.thread.join()
+    super().close()
+
+def open_text(filename):
+  """
+  Open a text file for reading, transparently decompressing gzip, xz, bzip2 or zstd files.
+  The compression format is detected from the first bytes of the file, not from its name.
+  Compressed files are decompressed in a background thread while they are read.
+
+  Args:
+    filename: The name of the file
+
+  Returns:
+    A text file object with UTF-8 decoding
+  """
+  open_func = _compressed_opener(filename)
+  if open_func is not None:
+    raw = _BackgroundDecompressor(open_func(filename))
+    return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=_DECOMPRESS_CHUNK_SIZE), encoding='utf-8')
+  return open(filename, 'r', encoding='utf-8')
+
+def _compressed_opener(filename):
+  """
+  Detect the compression format of a file
+
+  Returns:
+    The function opening a decompressed binary stream of the file, or None if it is not compressed
+  """
+  with open(filename, 'rb') as f:
+    magic = f.read(6)
+  for prefix, open_func in _COMPRESSION_FORMATS:
+    if magic.startswith(prefix):
+      return open_func
+  return None
 
 def iterate_tokens(filename):
-  with open(filename, "r", encoding="utf-8") as f:
+  with open_text(filename) as f:
     for line in f:
       yield line.strip().split()
 
 def iterate_nums(filename):
-  with open(filename, "r", encoding="utf-8") as f:
+  with open_text(filename) as f:
     for line in f:
       yield [float(i) for i in line.strip().split()]
 
@@ -16,6 +156,8 @@ def load_nums(filename):
   return list(iterate_nums(filename))
 
 def lower(inp):
+  if isinstance(inp, (Corpus, MultiReference)):
+    return inp.lower()
   return inp.lower() if type(inp) == str else [lower(x) for x in inp]
 
 def list2str(l):
@@ -23,7 +165,7 @@ def list2str(l):
   for i, s in enumerate(l):
     string = string + ' ' + str(s) if i != 0 else string + str(s)
   return string
-  
+
 def write_tokens(filename, ls):
   with open(filename, 'w') as f:
     for i, l in enumerate(ls):
@@ -31,3 +173,874 @@ def write_tokens(filename, ls):
       string = '\n' + string if i != 0 else string
       f.write(string)
   return string
+
+class Vocabulary(object):
+  """
+  A bidirectional mapping between word strings and integer IDs.
+
+  A single vocabulary is usually shared by the reference, the outputs, the source and the label files
+  of a run, so that equal words in different corpora map to equal IDs.
+  """
+  def __init__(self):
+    self.w2i = {}
+    self.i2w = []
+    self._lower_ids = np.zeros(0, dtype=np.int32)
+
+  def __len__(self):
+    return len(self.i2w)
+
+  def __contains__(self, word):
+    return word in self.w2i
+
+  def get_id(self, word):
+    """
+    Get the ID of a word, adding it to the vocabulary if necessary
+
+    Args:
+      word: A word string
+
+    Returns:
+      The integer ID of the word
+    """
+    wid = self.w2i.get(word)
+    if wid is None:
+      wid = self.w2i[word] = len(self.i2w)
+      self.i2w.append(word)
+    return wid
+
+  def encode(self, words):
+    """
+    Convert a list of words into a list of IDs, adding unknown words to the vocabulary
+
+    Args:
+      words: A list of word strings
+
+    Returns:
+      A list of integer IDs
+    """
+    w2i, get_id = self.w2i, self.get_id
+    return [w2i[w] if w in w2i else get_id(w) for w in words]
+
+  def decode(self, ids):
+    """
+    Convert a sequence of IDs back into a list of words
+
+    Args:
+      ids: A sequence of integer IDs
+
+    Returns:
+      A list of word strings
+    """
+    i2w = self.i2w
+    return [i2w[i] for i in ids]
+
+  def lower_ids(self):
+    """
+    Get the mapping from each word ID to the ID of the lowercased word, adding lowercased words to the
+    vocabulary if necessary. The mapping is only extended for words added since the last call.
+
+    Returns:
+      An int32 numpy array indexed by word ID
+    """
+    # Lowercased words that are new to the vocabulary are mapped in the next iteration
+    while len(self._lower_ids) < len(self.i2w):
+      new_words = self.i2w[len(self._lower_ids):]
+      new_ids = np.array(self.encode([w.lower() for w in new_words]), dtype=np.int32)
+      self._lower_ids = np.concatenate([self._lower_ids, new_ids])
+    return self._lower_ids
+
+class Corpus(object):
+  """
+  A tokenized corpus stored as a flat int32 array of word IDs plus sentence offsets.
+
+  Sentence `i` consists of the IDs `ids[offsets[i]:offsets[i+1]]`. A Corpus behaves like a list of
+  sentences (lists of word strings) when indexed or iterated, so it can be passed anywhere a corpus
+  loaded with `load_tokens` is accepted, while taking a small fraction of the memory.
+  Corpora loaded with `load_corpus` remember the name of their file in `filename`.
+  """
+  def __init__(self, ids, offsets, vocab, content_hash=None):
+    self.ids = ids
+    self.offsets = offsets
+    self.vocab = vocab
+    self.content_hash = content_hash
+    self.filename = None
+    self._lower = None
+    self._lengths = None
+
+  @classmethod
+  def from_sents(cls, sents, vocab=None):
+    """
+    Create a corpus from an iterable of tokenized sentences
+
+    Args:
+      sents: An iterable over lists of word strings
+      vocab: The vocabulary to use (a new one is created if not specified)
+
+    Returns:
+      A Corpus containing the sentences
+    """
+    vocab = Vocabulary() if vocab is None else vocab
+    ids, offsets = [], [0]
+    for sent in sents:
+      ids.extend(vocab.encode(sent))
+      offsets.append(len(ids))
+    return cls(np.array(ids, dtype=np.int32), np.array(offsets, dtype=np.int64), vocab)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    return self.vocab.decode(self.ids[self.offsets[i]:self.offsets[i+1]].tolist())
+
+  def __iter__(self):
+    for sent_ids in self.iter_ids():
+      yield self.vocab.decode(sent_ids)
+
+  def lower(self):
+    """
+    Get a lowercased version of the corpus in the same vocabulary. It is calculated only once by mapping the
+    word IDs, and then shared by all the scorers and bucketers working in case-insensitive mode.
+
+    Returns:
+      A Corpus with all words lowercased
+    """
+    if self._lower is None:
+      self._lower = Corpus(self.vocab.lower_ids()[self.ids], self.offsets, self.vocab)
+      self._lower._lower = self._lower
+    return self._lower
+
+  def lengths(self):
+    """
+    Get the length of every sentence, calculated only once from the sentence offsets
+
+    Returns:
+      An int64 numpy array with the number of words in each sentence
+    """
+    if self._lengths is None:
+      self._lengths = np.diff(self.offsets).astype(np.int64)
+    return self._lengths
+
+  def sent_ids(self, i):
+    """
+    Get the IDs of a single sentence
+
+    Args:
+      i: The index of the sentence
+
+    Returns:
+      A numpy array view of the word IDs in the sentence
+    """
+    return self.ids[self.offsets[i]:self.offsets[i+1]]
+
+  def sub_corpus(self, start, end):
+    """
+    Get the consecutive sentences `start` to `end` (excluded) as a corpus sharing the same arrays and vocabulary
+
+    Args:
+      start: The index of the first sentence
+      end: The index after the last sentence
+
+    Returns:
+      A Corpus with the sentences
+    """
+    offsets = self.offsets[start:end+1]
+    return Corpus(self.ids[offsets[0]:offsets[-1]], offsets - offsets[0], self.vocab)
+
+  def iter_ids(self):
+    """
+    Iterate over the sentences of the corpus as lists of word IDs
+    """
+    # Convert blocks of sentences at a time to avoid both per-sentence numpy overhead and
+    # materializing the whole corpus as Python integers
+    offsets = self.offsets.tolist()
+    for block_start in range(0, len(self), _ITER_BLOCK_SIZE):
+      block_offsets = offsets[block_start:block_start+_ITER_BLOCK_SIZE+1]
+      base = block_offsets[0]
+      block = self.ids[base:block_offsets[-1]].tolist()
+      for start, end in zip(block_offsets, block_offsets[1:]):
+        yield block[start-base:end-base]
+
+class MultiReference(object):
+  """
+  Several reference translations of the same sentences.
+
+  A MultiReference behaves like its first reference when indexed or iterated, so that it can be passed to code that
+  handles a single reference. Scorers that use all the references (those with `multi_reference` set) read them from
+  `refs`.
+  """
+  def __init__(self, refs):
+    """
+    Args:
+      refs: A list of reference corpora with the same number of sentences
+    """
+    if len(set(len(x) for x in refs)) > 1:
+      raise ValueError('All the references must have the same number of sentences')
+    self.refs = list(refs)
+    self._lower = None
+
+  def __len__(self):
+    return len(self.refs[0])
+
+  def __getitem__(self, i):
+    return self.refs[0][i]
+
+  def __iter__(self):
+    return iter(self.refs[0])
+
+  def lower(self):
+    """
+    Get a lowercased version of all the references, calculated only once
+
+    Returns:
+      A MultiReference with all words lowercased
+    """
+    if self._lower is None:
+      self._lower = MultiReference([lower(x) for x in self.refs])
+      self._lower._lower = self._lower
+    return self._lower
+
+class LazyCorpus(object):
+  """
+  A read-only view of a tokenized file that only reads sentences from disk when they are accessed.
+
+  Only the byte offset of the start of every line is kept in memory, so reports that print a few example
+  sentences can keep a view of a large file instead of the whole corpus. Compressed files cannot be seeked,
+  so their sentences are found with a sequential pass, which `prefetch` does once for a whole set of sentences.
+  """
+  def __init__(self, filename):
+    self.filename = filename
+    self.fetched = {}
+    if _compressed_opener(filename) is not None:
+      self.line_offsets = None
+      with open_text(filename) as f:
+        self.num_sents = sum(1 for _ in f)
+    else:
+      self.line_offsets = _index_lines(filename)
+      self.num_sents = len(self.line_offsets) - 1
+
+  def __len__(self):
+    return self.num_sents
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('LazyCorpus index out of range')
+    if i not in self.fetched:
+      self.prefetch([i])
+    return list(self.fetched[i])
+
+  def __iter__(self):
+    return iterate_tokens(self.filename)
+
+  def prefetch(self, sent_ids):
+    """
+    Read a set of sentences from the file, so that later accesses do not need to go back to the file
+
+    Args:
+      sent_ids: The indices of the sentences
+    """
+    needed = set(sent_ids) - set(self.fetched)
+    if not needed:
+      return
+    if self.line_offsets is None:
+      with open_text(self.filename) as f:
+        for i, line in enumerate(f):
+          if i in needed:
+            self.fetched[i] = line.strip().split()
+    else:
+      with open(self.filename, 'rb') as f:
+        for i in sorted(needed):
+          f.seek(self.line_offsets[i])
+          line = f.read(self.line_offsets[i+1] - self.line_offsets[i])
+          self.fetched[i] = line.decode('utf-8').strip().split()
+
+def _index_lines(filename):
+  """
+  Find the byte offsets of the lines of an uncompressed file. As when the file is read in text mode by the loaders,
+  a line ends with "\n", "\r\n" or a bare "\r".
+
+  Returns:
+    An int64 numpy array with the offset of the start of each line, followed by the size of the file
+  """
+  starts, pos, pending_cr = [np.zeros(1, dtype=np.int64)], 0, False
+  with open(filename, 'rb') as f:
+    for block in iter(lambda: f.read(_INDEX_BLOCK_SIZE), b''):
+      data = np.frombuffer(block, dtype=np.uint8)
+      is_lf, is_cr = data == ord('\n'), data == ord('\r')
+      # A "\r" at the end of the previous block ends a line unless this block starts with "\n"
+      if pending_cr and not is_lf[0]:
+        starts.append(np.array([pos], dtype=np.int64))
+      ends = is_lf | (is_cr & ~np.append(is_lf[1:], False))
+      pending_cr = bool(is_cr[-1])
+      ends[-1] &= not pending_cr
+      starts.append(np.flatnonzero(ends).astype(np.int64) + pos + 1)
+      pos += len(block)
+  if pending_cr:
+    starts.append(np.array([pos], dtype=np.int64))
+  offsets = np.concatenate(starts)
+  # A last line without a newline still counts as a line
+  return offsets if offsets[-1] == pos else np.append(offsets, pos)
+
+def lazy_view(corpus, sent_ids=()):
+  """
+  Get a lazily loaded view of a corpus that was loaded from a file, to keep instead of the corpus itself
+
+  Args:
+    corpus: A corpus (or None)
+    sent_ids: The indices of the sentences that will be accessed, which are read right away
+
+  Returns:
+    A LazyCorpus over the file of the corpus, or the corpus itself if it was not loaded from a file
+  """
+  if isinstance(corpus, Corpus) and corpus.filename is not None:
+    corpus = LazyCorpus(corpus.filename)
+  if isinstance(corpus, LazyCorpus):
+    corpus.prefetch(sent_ids)
+  return corpus
+
+def slice_corpus(corpus, start, end):
+  """
+  Get consecutive sentences of a corpus, keeping the integer IDs of a Corpus
+
+  Args:
+    corpus: A corpus, or a list of per-sentence items such as labels (or None)
+    start: The index of the first sentence
+    end: The index after the last sentence
+
+  Returns:
+    A Corpus or list with the sentences, or None
+  """
+  if corpus is None:
+    return None
+  if isinstance(corpus, Corpus):
+    return corpus.sub_corpus(start, end)
+  return corpus[start:end]
+
+def sent_lengths(corpus):
+  """
+  Get the length of every sentence of a corpus. The lengths of a Corpus are calculated only once and shared by all
+  the scorers and bucketers working on it.
+
+  Args:
+    corpus: A corpus (the lengths of a MultiReference are those of its first reference)
+
+  Returns:
+    An int64 numpy array with the number of words in each sentence
+  """
+  if isinstance(corpus, MultiReference):
+    corpus = corpus.refs[0]
+  if isinstance(corpus, Corpus):
+    return corpus.lengths()
+  return np.fromiter((len(x) for x in corpus), dtype=np.int64, count=len(corpus))
+
+def closest_refs(ref, out):
+  """
+  Find the reference whose length is closest to the output for every sentence, preferring the shorter one on ties
+  as in multi-reference BLEU
+
+  Args:
+    ref: A reference corpus, or a MultiReference
+    out: An output corpus
+
+  Returns:
+    An int64 numpy array with the index of the closest reference of each sentence, and one with its length
+  """
+  refs = ref.refs if isinstance(ref, MultiReference) else [ref]
+  ref_lens = np.stack([sent_lengths(x) for x in refs]).reshape(len(refs), -1)
+  # Sort by distance to the output length first, and then by length
+  keys = np.abs(ref_lens - sent_lengths(out)) * (int(ref_lens.max(initial=0)) + 1) + ref_lens
+  closest = keys.argmin(axis=0)
+  return closest, ref_lens[closest, np.arange(ref_lens.shape[1])]
+
+def sent_hashes(corpus):
+  """
+  Calculate a content digest of every sentence of a corpus, e.g. to find duplicate sentences without keeping copies
+  of them. The digest is a 16-byte BLAKE2b hash of the words of the sentence, which is wide enough that different
+  sentences practically never collide, and which does not depend on the vocabulary or the process, so that digests
+  of corpora with different vocabularies (e.g. the blocks of a streamed file) can be compared.
+
+  Args:
+    corpus: A corpus
+
+  Returns:
+    A list with the digest of each sentence as bytes
+  """
+  return [hashlib.blake2b(' '.join(x).encode('utf-8'), digest_size=16).digest() for x in corpus]
+
+class Alignments(object):
+  """
+  Word alignments stored as an N x 2 int32 array of (source index, target index) links plus sentence offsets.
+
+  The links of sentence `i` are `links[offsets[i]:offsets[i+1]]`. Indexing or iterating returns the links of
+  each sentence as a list of (source index, target index) tuples.
+  """
+  def __init__(self, links, offsets, content_hash=None):
+    self.links = links
+    self.offsets = offsets
+    self.content_hash = content_hash
+
+  @classmethod
+  def from_strs(cls, sents):
+    """
+    Create alignments from sentences of links in "src-trg" format
+
+    Args:
+      sents: An iterable over lists of link strings, e.g. a corpus loaded from an alignment file
+
+    Returns:
+      An Alignments object
+    """
+    return cls(*_parse_links(' '.join(sent) for sent in sents))
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    return [tuple(x) for x in self.links[self.offsets[i]:self.offsets[i+1]].tolist()]
+
+  def __iter__(self):
+    offsets = self.offsets.tolist()
+    for block_start in range(0, len(self), _ITER_BLOCK_SIZE):
+      block_offsets = offsets[block_start:block_start+_ITER_BLOCK_SIZE+1]
+      base = block_offsets[0]
+      block = [tuple(x) for x in self.links[base:block_offsets[-1]].tolist()]
+      for start, end in zip(block_offsets, block_offsets[1:]):
+        yield block[start-base:end-base]
+
+  def sent_links(self, i):
+    """
+    Get the links of a single sentence
+
+    Args:
+      i: The index of the sentence
+
+    Returns:
+      A numpy array view with one (source index, target index) row per link
+    """
+    return self.links[self.offsets[i]:self.offsets[i+1]]
+
+def load_alignments(filename, cache_dir=None):
+  """
+  Load a word alignment file with links in "src-trg" format, e.g. "0-0 1-2 2-1"
+
+  Args:
+    filename: The name of the file to load
+    cache_dir: A directory where a binary copy of the parsed alignments is stored and re-used by later
+               runs as long as the content of the file does not change (defaults to `global_cache_dir`)
+
+  Returns:
+    An Alignments object
+  """
+  if global_loader is not None:
+    return global_loader.load_alignments(filename)
+  return _load_alignments(filename, global_cache_dir if cache_dir is None else cache_dir)
+
+def _parse_links(texts):
+  """
+  Parse link strings into an array of links and sentence offsets
+
+  Args:
+    texts: An iterable over the links of each sentence as a single string, e.g. lines of an alignment file
+
+  Returns:
+    An N x 2 int32 array of links, and the int64 offsets of the sentences into it
+  """
+  counts, block, link_blocks = [0], [], []
+  def parse_block():
+    # Let numpy convert a whole block of numbers at a time instead of converting every link in Python
+    words = ' '.join(block).replace('-', ' ').split()
+    try:
+      numbers = np.array(words, dtype=np.int32)
+    except (ValueError, OverflowError):
+      numbers = None
+    if numbers is None or len(numbers) != 2 * sum(x.count('-') for x in block):
+      raise ValueError('Failed to parse alignments. The expected format is "src1-trg1 src2-trg2 [...]" on each line')
+    link_blocks.append(numbers.reshape(-1, 2))
+    block.clear()
+  for text in texts:
+    counts.append(text.count('-'))
+    block.append(text)
+    if len(block) == _ITER_BLOCK_SIZE:
+      parse_block()
+  parse_block()
+  return np.concatenate(link_blocks), np.cumsum(counts, dtype=np.int64)
+
+def _load_alignments(filename, cache_dir):
+  if cache_dir is None:
+    with open_text(filename) as f:
+      return Alignments(*_parse_links(f))
+  content_hash = file_content_hash(filename, cache_dir=cache_dir)
+  prefix = _alignment_cache_prefix(cache_dir, content_hash)
+  with _cache_entry_lock(prefix):
+    try:
+      alignments = Alignments(np.load(f'{prefix}.links.npy', mmap_mode='r'),
+                              np.load(f'{prefix}.offsets.npy', mmap_mode='r'))
+    except (OSError, ValueError):
+      with open_text(filename) as f:
+        alignments = Alignments(*_parse_links(f))
+      # The offsets are written last, so their presence marks the entry as complete
+      _atomic_write(f'{prefix}.links.npy', lambda f: np.save(f, alignments.links))
+      _atomic_write(f'{prefix}.offsets.npy', lambda f: np.save(f, alignments.offsets))
+  alignments.content_hash = content_hash
+  return alignments
+
+def load_corpus(filename, vocab=None, cache_dir=None):
+  """
+  Load a tokenized file into an integer ID-based corpus
+
+  Args:
+    filename: The name of the file to load
+    vocab: The vocabulary to map words into (a new one is created if not specified)
+    cache_dir: A directory where a pre-tokenized binary copy of the file is stored and re-used by later
+               runs as long as the content of the file does not change (defaults to `global_cache_dir`)
+
+  Returns:
+    A Corpus containing the sentences of the file
+  """
+  if global_loader is not None and vocab is not None and vocab is global_loader.vocab:
+    return global_loader.load(filename)
+  cache_dir = global_cache_dir if cache_dir is None else cache_dir
+  if cache_dir is None:
+    corpus = Corpus.from_sents(iterate_tokens(filename), vocab=vocab)
+  else:
+    local_corpus = _load_local_corpus(filename, cache_dir)
+    corpus = _remap_corpus(local_corpus, Vocabulary() if vocab is None else vocab, local_corpus.content_hash)
+  corpus.filename = filename
+  return corpus
+
+def count_words(filename, cache_dir=None):
+  """
+  Count the occurrences of each word in a tokenized file
+
+  Args:
+    filename: The name of the file
+    cache_dir: A directory with pre-tokenized corpus caches (defaults to `global_cache_dir`)
+
+  Returns:
+    A dictionary mapping each word to its count
+  """
+  if global_loader is not None:
+    return global_loader.count_words(filename)
+  return _count_words(filename, global_cache_dir if cache_dir is None else cache_dir)
+
+def _load_local_corpus(filename, cache_dir):
+  """
+  Load a file into a corpus with its own vocabulary, through the cache if a cache directory is specified
+  """
+  if cache_dir is None:
+    return Corpus.from_sents(iterate_tokens(filename))
+  content_hash = file_content_hash(filename, cache_dir=cache_dir)
+  with _cache_entry_lock(_corpus_cache_prefix(cache_dir, content_hash)):
+    local_corpus = _read_corpus_cache(cache_dir, content_hash)
+    if local_corpus is None:
+      local_corpus = Corpus.from_sents(iterate_tokens(filename))
+      _write_corpus_cache(cache_dir, content_hash, local_corpus)
+  local_corpus.content_hash = content_hash
+  return local_corpus
+
+def _count_words(filename, cache_dir):
+  if cache_dir is None:
+    counts = defaultdict(lambda: 0)
+    for words in iterate_tokens(filename):
+      for word in words:
+        counts[word] += 1
+    return counts
+  corpus = _load_local_corpus(filename, cache_dir)
+  counts = np.bincount(corpus.ids, minlength=len(corpus.vocab))
+  return dict(zip(corpus.vocab.i2w, counts.tolist()))
+
+class CorpusLoader(object):
+  """
+  Loads the input files of a run into a shared vocabulary, each file only once.
+
+  Files announced with `preload` are read and tokenized concurrently by a pool of worker threads, each into
+  its own vocabulary. They are only mapped into the shared vocabulary (in the order in which they are
+  requested through `load`), so word IDs do not depend on the order in which the workers finish.
+  """
+  def __init__(self, vocab=None, num_workers=1, cache_dir=None):
+    """
+    Args:
+      vocab: The shared vocabulary (a new one is created if not specified)
+      num_workers: The number of files to read at the same time
+      cache_dir: A directory with pre-tokenized corpus caches (defaults to `global_cache_dir`)
+    """
+    self.vocab = Vocabulary() if vocab is None else vocab
+    self.cache_dir = global_cache_dir if cache_dir is None else cache_dir
+    self.executor = ThreadPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    self.corpora = {}
+    self.counts = {}
+    self.alignments = {}
+
+  def preload(self, filenames, counted_filenames=[], alignment_filenames=[]):
+    """
+    Start reading files in the background
+
+    Args:
+      filenames: Names of files that will be loaded with `load`
+      counted_filenames: Names of files whose words will be counted with `count_words`
+      alignment_filenames: Names of files that will be loaded with `load_alignments`
+    """
+    if self.executor is None:
+      return
+    for results, load_func, names in [(self.corpora, _load_local_corpus, filenames),
+                                      (self.counts, _count_words, counted_filenames),
+                                      (self.alignments, _load_alignments, alignment_filenames)]:
+      for filename in names:
+        key = os.path.abspath(filename)
+        if key not in results:
+          results[key] = self.executor.submit(load_func, filename, self.cache_dir)
+
+  def _result(self, results, load_func, filename):
+    """
+    Get the result of loading a file, waiting for a worker or loading it now if necessary
+
+    Returns:
+      The result, and whether it was already returned before
+    """
+    key = os.path.abspath(filename)
+    result = results.get(key)
+    if result is None:
+      return load_func(filename, self.cache_dir), False
+    elif isinstance(result, Future):
+      return result.result(), False
+    return result, True
+
+  def load(self, filename):
+    """
+    Load a file into the shared vocabulary, or return the corpus that was already loaded from it
+
+    Args:
+      filename: The name of the file
+
+    Returns:
+      A Corpus using the shared vocabulary
+    """
+    corpus, done = self._result(self.corpora, _load_local_corpus, filename)
+    if not done:
+      corpus = self.corpora[os.path.abspath(filename)] = _remap_corpus(corpus, self.vocab, corpus.content_hash)
+      corpus.filename = filename
+    return corpus
+
+  def count_words(self, filename):
+    """
+    Count the occurrences of each word in a tokenized file, or return the counts that were already calculated
+
+    Args:
+      filename: The name of the file
+
+    Returns:
+      A dictionary mapping each word to its count
+    """
+    counts, _ = self._result(self.counts, _count_words, filename)
+    self.counts[os.path.abspath(filename)] = counts
+    return counts
+
+  def load_alignments(self, filename):
+    """
+    Load an alignment file, or return the alignments that were already loaded from it
+
+    Args:
+      filename: The name of the file
+
+    Returns:
+      An Alignments object
+    """
+    alignments, _ = self._result(self.alignments, _load_alignments, filename)
+    self.alignments[os.path.abspath(filename)] = alignments
+    return alignments
+
+  def close(self):
+    """
+    Stop the worker threads
+    """
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
+      self.executor = None
+
+def file_content_hash(filename, cache_dir=None):
+  """
+  Calculate a hash of the content of a file.
+  If a cache directory is specified, the hash is remembered together with the size and modification
+  time of the file, and only recalculated when either of them changes.
+
+  Args:
+    filename: The name of the file
+    cache_dir: A directory where the hash can be remembered between runs (optional)
+
+  Returns:
+    A hexadecimal SHA-1 digest of the file content
+  """
+  stat = os.stat(filename)
+  index_file = None
+  if cache_dir is not None:
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    index_file = os.path.join(cache_dir, 'index', f'{path_hash}.json')
+    try:
+      with open(index_file, 'r') as f:
+        entry = json.load(f)
+      if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['content_hash']
+    except (OSError, ValueError, KeyError):
+      pass
+
+  sha = hashlib.sha1()
+  with open(filename, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      sha.update(block)
+  content_hash = sha.hexdigest()
+
+  if index_file is not None:
+    entry = {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+             'content_hash': content_hash}
+    _atomic_write(index_file, lambda f: f.write(json.dumps(entry).encode('utf-8')))
+  return content_hash
+
+def _atomic_write(filename, write_func):
+  """
+  Write a file through a temporary file so that concurrent runs never see partial content. The temporary file has
+  a unique name, so that threads and processes writing the same file do not move each other's files away.
+  """
+  dirname, basename = os.path.split(filename)
+  os.makedirs(dirname, exist_ok=True)
+  fd, tmp_name = tempfile.mkstemp(prefix=f'{basename}.', suffix='.tmp', dir=dirname)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      write_func(f)
+    os.replace(tmp_name, filename)
+  except BaseException:
+    if os.path.exists(tmp_name):
+      os.remove(tmp_name)
+    raise
+
+def _cache_entry_lock(prefix):
+  """
+  Get the lock of a cache entry, which the threads of this process hold while reading or creating the entry, so that
+  a file that is loaded several times at once (e.g. identical outputs) is only parsed and written once
+  """
+  with _cache_entry_locks_lock:
+    return _cache_entry_locks[prefix]
+
+def _corpus_cache_prefix(cache_dir, content_hash):
+  return os.path.join(cache_dir, 'corpus', content_hash)
+
+def _alignment_cache_prefix(cache_dir, content_hash):
+  return os.path.join(cache_dir, 'align', content_hash)
+
+def _read_corpus_cache(cache_dir, content_hash):
+  """
+  Read a cached corpus in its own file-local vocabulary, memory-mapping the ID arrays
+
+  Returns:
+    A Corpus, or None if there is no (complete) cache for this content
+  """
+  prefix = _corpus_cache_prefix(cache_dir, content_hash)
+  try:
+    ids = np.load(f'{prefix}.ids.npy', mmap_mode='r')
+    offsets = np.load(f'{prefix}.offsets.npy', mmap_mode='r')
+    with open(f'{prefix}.vocab', 'r', encoding='utf-8') as f:
+      words = f.read().split('\n')[:-1]
+  except (OSError, ValueError):
+    return None
+  vocab = Vocabulary()
+  vocab.encode(words)
+  return Corpus(ids, offsets, vocab)
+
+def _write_corpus_cache(cache_dir, content_hash, corpus):
+  """
+  Write a corpus with a file-local vocabulary to the cache.
+  Words never contain whitespace, so the vocabulary is stored one word per line.
+  """
+  prefix = _corpus_cache_prefix(cache_dir, content_hash)
+  # The vocabulary is written last, so its presence marks the entry as complete
+  _atomic_write(f'{prefix}.ids.npy', lambda f: np.save(f, corpus.ids))
+  _atomic_write(f'{prefix}.offsets.npy', lambda f: np.save(f, corpus.offsets))
+  _atomic_write(f'{prefix}.vocab',
+                lambda f: f.write(''.join(f'{w}\n' for w in corpus.vocab.i2w).encode('utf-8')))
+
+def _remap_corpus(local_corpus, vocab, content_hash=None):
+  """
+  Map a corpus with its own vocabulary into a (shared) vocabulary
+
+  Args:
+    local_corpus: A Corpus in its own vocabulary
+    vocab: The vocabulary to map into
+    content_hash: The content hash to record in the returned corpus
+
+  Returns:
+    A Corpus using `vocab`
+  """
+  mapping = np.array(vocab.encode(local_corpus.vocab.i2w), dtype=np.int32)
+  if np.array_equal(mapping, np.arange(len(mapping), dtype=np.int32)):
+    # IDs are already the same in both vocabularies (e.g. the first corpus loaded), keep the arrays as they are
+    ids = local_corpus.ids
+  else:
+    ids = mapping[local_corpus.ids]
+  return Corpus(ids, local_corpus.offsets, vocab, content_hash=content_hash)
+
+def shared_vocab(*corpora):
+  """
+  Check whether all the corpora are Corpus objects with the same vocabulary, in which case
+  word IDs can be compared directly instead of word strings.
+
+  Args:
+    corpora: The corpora to check (None entries are ignored)
+
+  Returns:
+    The shared Vocabulary, or None if the corpora cannot be compared by ID
+  """
+  vocab = None
+  for corpus in corpora:
+    if corpus is None:
+      continue
+    if not isinstance(corpus, Corpus) or (vocab is not None and corpus.vocab is not vocab):
+      return None
+    vocab = corpus.vocab
+  return vocab
+
+def as_id_sents(*corpora):
+  """
+  If all the corpora share a vocabulary, view them as sentences of word IDs, otherwise return them
+  unchanged. Useful for code that only needs to compare words for equality.
+
+  Args:
+    corpora: The corpora to convert
+
+  Returns:
+    A list with either an iterator over ID lists or the original object for each corpus
+  """
+  if shared_vocab(*corpora) is None:
+    return list(corpora)
+  return [None if x is None else x.iter_ids() for x in corpora]
+
+def shared_corpora(*corpora):
+  """
+  Convert corpora into Corpus objects sharing one vocabulary, unless they already share one, so that the structures
+  built from a corpus (n-gram statistics, lowercased words, lengths) are cached and shared by everything using it. The
+  references of a MultiReference are converted separately.
+
+  Args:
+    corpora: The corpora to convert
+
+  Returns:
+    A list with the converted corpora
+  """
+  flat = [x for corpus in corpora for x in (corpus.refs if isinstance(corpus, MultiReference) else [corpus])]
+  if shared_vocab(*flat) is not None:
+    return list(corpora)
+  vocab = Vocabulary()
+  def convert(corpus):
+    if isinstance(corpus, MultiReference):
+      return MultiReference([convert(x) for x in corpus.refs])
+    return Corpus.from_sents(corpus, vocab)
+  return [convert(x) for x in corpora]
@@ -0,0 +1,197 @@
+import numpy as np
+
+from compare_mt import corpus_utils
+
+# Number of sentences whose edit distances are calculated together
+_BATCH_SIZE = 256
+
+def _bit_parallel_distance(ref, out):
+  """
+  Calculate the unit-cost edit distance between two sentences with the bit-parallel algorithm of Myers (1999), in
+  the global alignment variant of Hyyrö (2001). Each column of the dynamic programming matrix is updated with a
+  constant number of operations on integers holding one bit per word of the reference.
+
+  Args:
+    ref: A reference sentence (a list of words or word IDs)
+    out: An output sentence (a list of words or word IDs)
+
+  Returns:
+    The number of substitutions, insertions and deletions needed to turn the output into the reference
+  """
+  if len(ref) == 0:
+    return len(out)
+  peq = {}
+  for i, word in enumerate(ref):
+    peq[word] = peq.get(word, 0) | (1 << i)
+  mask = (1 << len(ref)) - 1
+  high = 1 << (len(ref) - 1)
+  pv, mv, score = mask, 0, len(ref)
+  for word in out:
+    eq = peq.get(word, 0)
+    xv = eq | mv
+    xh = (((eq & pv) + pv) ^ pv) | eq
+    ph = (mv | ~(xh | pv)) & mask
+    mh = pv & xh
+    if ph & high:
+      score += 1
+    elif mh & high:
+      score -= 1
+    # The first row of the matrix increases by one in every column
+    ph = ((ph << 1) | 1) & mask
+    mh = (mh << 1) & mask
+    pv = (mh | ~(xv | ph)) & mask
+    mv = ph & xv
+  return score
+
+def _next_row(prev, sub_scores, i, sub_pen, ins_pen, del_pen):
+  """
+  Calculate a row of edit distance matrices from the previous one, for a batch of sentences at once. Substitutions
+  and deletions only depend on the previous row, and the chain of insertions along the row is resolved with a
+  running minimum: D[i,j] = min_k (T[k] + (j-k)*ins_pen), where T holds the other two options.
+
+  Args:
+    prev: The previous rows, one per sentence
+    sub_scores: The substitution penalties between the i-th reference word and each output word, one row per sentence
+    i: The index of the row to calculate
+    sub_pen: The penalty of a substitution
+    ins_pen: The penalty of an insertion
+    del_pen: The penalty of a deletion
+
+  Returns:
+    The i-th rows
+  """
+  ins_offsets = np.arange(prev.shape[1]) * ins_pen
+  row = np.empty_like(prev)
+  row[:,0] = i * del_pen
+  row[:,1:] = np.minimum(prev[:,:-1] + sub_scores, prev[:,1:] + del_pen)
+  return np.minimum.accumulate(row - ins_offsets, axis=1) + ins_offsets
+
+def _as_ids(sents, word_ids, length, pad):
+  ids = np.full((len(sents), length), pad, dtype=np.int64)
+  for k, sent in enumerate(sents):
+    ids[k,:len(sent)] = [word_ids.setdefault(x, len(word_ids)) for x in sent]
+  return ids
+
+def _weighted_matrix(ref, out, sub_pen, ins_pen, del_pen):
+  """
+  Fill the full edit distance matrix for arbitrary penalties, one vectorized row at a time.
+
+  Args:
+    ref: A reference sentence
+    out: An output sentence
+    sub_pen: The penalty of a substitution
+    ins_pen: The penalty of an insertion
+    del_pen: The penalty of a deletion
+
+  Returns:
+    A (len(ref)+1)x(len(out)+1) matrix with the edit distances between all prefixes of the sentences
+  """
+  word_ids = {}
+  ref_ids = _as_ids([ref], word_ids, len(ref), -1)[0]
+  out_ids = _as_ids([out], word_ids, len(out), -1)
+  scores = np.empty((len(ref)+1, len(out)+1))
+  scores[0] = np.arange(len(out)+1) * ins_pen
+  for i in range(len(ref)):
+    scores[i+1] = _next_row(scores[i:i+1], (out_ids != ref_ids[i]) * sub_pen, i+1, sub_pen, ins_pen, del_pen)[0]
+  return scores
+
+def _weighted_distances(refs, outs, sub_pen, ins_pen, del_pen):
+  """
+  Calculate the edit distances of a batch of sentences for arbitrary penalties. The sentences are padded to the same
+  length and the rows of all their matrices are calculated together.
+
+  Args:
+    refs: A list of reference sentences
+    outs: A list of output sentences
+    sub_pen: The penalty of a substitution
+    ins_pen: The penalty of an insertion
+    del_pen: The penalty of a deletion
+
+  Returns:
+    A numpy array with the edit distance of each sentence
+  """
+  ref_lens = np.array([len(x) for x in refs], dtype=np.int64)
+  out_lens = np.array([len(x) for x in outs], dtype=np.int64)
+  word_ids = {}
+  # Padding never matches and is never used for the final distances
+  ref_ids = _as_ids(refs, word_ids, ref_lens.max(initial=0), -1)
+  out_ids = _as_ids(outs, word_ids, out_lens.max(initial=0), -2)
+  rows = np.tile(np.arange(out_ids.shape[1]+1) * float(ins_pen), (len(refs), 1))
+  distances = out_lens * float(ins_pen)
+  for i in range(ref_ids.shape[1]):
+    rows = _next_row(rows, (out_ids != ref_ids[:,i:i+1]) * sub_pen, i+1, sub_pen, ins_pen, del_pen)
+    done = np.flatnonzero(ref_lens == i+1)
+    distances[done] = rows[done, out_lens[done]]
+  return distances
+
+def _backtrace(ref, out, scores, sub_pen, ins_pen, del_pen):
+  # Follow the same preference as the forward pass: diagonal moves, then deletions, then insertions
+  ops = []
+  i, j = len(ref), len(out)
+  while i > 0 or j > 0:
+    if i > 0 and j > 0 and ref[i-1] == out[j-1] and np.isclose(scores[i,j], scores[i-1,j-1]):
+      i, j = i-1, j-1
+      ops.append(('match', i, j))
+    elif i > 0 and j > 0 and np.isclose(scores[i,j], scores[i-1,j-1] + sub_pen):
+      i, j = i-1, j-1
+      ops.append(('sub', i, j))
+    elif i > 0 and np.isclose(scores[i,j], scores[i-1,j] + del_pen):
+      i -= 1
+      ops.append(('del', i, None))
+    else:
+      j -= 1
+      ops.append(('ins', None, j))
+  ops.reverse()
+  return ops
+
+def edit_distance(ref, out, sub_pen=1.0, ins_pen=1.0, del_pen=1.0, return_ops=False):
+  """
+  Calculate the edit distance between a reference sentence and an output sentence.
+
+  Args:
+    ref: A reference sentence (a list of words or word IDs)
+    out: An output sentence (a list of words or word IDs)
+    sub_pen: The penalty of a substitution
+    ins_pen: The penalty of an insertion (an output word not in the reference)
+    del_pen: The penalty of a deletion (a reference word not in the output)
+    return_ops: Whether to also return the edit operations
+
+  Returns:
+    The edit distance, and if return_ops is set also a list of edit operations. Each operation is a tuple
+    (op, ref_pos, out_pos) where op is one of 'match', 'sub', 'ins' or 'del', and the position that an operation
+    does not touch is None.
+  """
+  if not return_ops and sub_pen == ins_pen == del_pen:
+    return _bit_parallel_distance(ref, out) * sub_pen
+  scores = _weighted_matrix(ref, out, sub_pen, ins_pen, del_pen)
+  if not return_ops:
+    return scores[-1,-1]
+  return scores[-1,-1], _backtrace(ref, out, scores, sub_pen, ins_pen, del_pen)
+
+def edit_distances(ref, out, sub_pen=1.0, ins_pen=1.0, del_pen=1.0):
+  """
+  Calculate the edit distance of every sentence in a corpus. If the corpora share a vocabulary, the sentences are
+  compared by word ID.
+
+  Args:
+    ref: A reference corpus
+    out: An output corpus
+    sub_pen: The penalty of a substitution
+    ins_pen: The penalty of an insertion
+    del_pen: The penalty of a deletion
+
+  Returns:
+    A numpy array with the edit distance of each sentence
+  """
+  ref, out = corpus_utils.as_id_sents(ref, out)
+  if sub_pen == ins_pen == del_pen:
+    return np.array([_bit_parallel_distance(r, o) * sub_pen for r, o in zip(ref, out)], dtype=float)
+  ref, out = list(ref), list(out)
+  distances = np.zeros(len(ref))
+  # Batch sentences of similar length together to keep the padding small
+  order = np.argsort([len(x) for x in ref], kind='stable')
+  for start in range(0, len(order), _BATCH_SIZE):
+    batch = order[start:start+_BATCH_SIZE]
+    distances[batch] = _weighted_distances([ref[k] for k in batch], [out[k] for k in batch],
+                                           sub_pen, ins_pen, del_pen)
+  return distances
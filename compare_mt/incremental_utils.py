@@ -0,0 +1,212 @@
+########################################################################################
+# Incremental analysis of growing corpora                                              #
+#                                                                                      #
+# When sentences are only ever appended to the reference and the outputs (e.g. an      #
+# online test set that grows every day), the statistics of the sentences seen so far   #
+# never change. The accumulators below keep these statistics, together with their      #
+# sums where the score only depends on sums, so that appending new sentences costs     #
+# time proportional to the new sentences and not to the whole corpus.                  #
+########################################################################################
+
+import itertools
+import numpy as np
+
+from compare_mt import scorers
+
+def concat_stats(stats_blocks):
+  """
+  Concatenate the statistics cached for consecutive blocks of a corpus
+
+  Args:
+    stats_blocks: A list with the statistics returned by `Scorer.cache_stats` for each block
+
+  Returns:
+    SufficientStats if all the blocks are numpy arrays or SufficientStats, or a list otherwise
+  """
+  if stats_blocks and all(isinstance(x, (np.ndarray, scorers.SufficientStats)) for x in stats_blocks):
+    return scorers.SufficientStats.concatenate(stats_blocks)
+  return list(itertools.chain.from_iterable(stats_blocks))
+
+class IncrementalScorer(object):
+  """
+  Scores a corpus to which sentences are appended over time.
+
+  For scorers that implement `Scorer.sum_stats`, the summed statistics are updated with those of the new sentences
+  only, and scoring the corpus takes constant time. For other scorers, the corpus is scored from all the cached
+  statistics, which are still calculated only once for each sentence.
+  """
+  def __init__(self, scorer, cached_stats=None):
+    """
+    Args:
+      scorer: The scorer
+      cached_stats: Statistics of the sentences scored so far (e.g. saved from the `stats` of a previous run)
+    """
+    self.scorer = scorer
+    self._blocks = []
+    self._num_sents = 0
+    self._summed_stats = None
+    self._summable = True
+    if cached_stats is not None:
+      self.append_stats(cached_stats)
+
+  def __len__(self):
+    return self._num_sents
+
+  @property
+  def stats(self):
+    """
+    The cached statistics of all the sentences, for e.g. significance tests or saving them for a later run
+    """
+    if len(self._blocks) > 1:
+      self._blocks = [concat_stats(self._blocks)]
+    return self._blocks[0] if self._blocks else []
+
+  def append(self, ref, out):
+    """
+    Append sentences to the corpus
+
+    Args:
+      ref: The new reference sentences
+      out: The new output sentences
+
+    Returns:
+      The cached statistics of the new sentences
+    """
+    cached_stats = self.scorer.cache_stats(ref, out)
+    self.append_stats(cached_stats)
+    return cached_stats
+
+  def append_stats(self, cached_stats):
+    """
+    Append sentences to the corpus, given their statistics
+
+    Args:
+      cached_stats: The statistics of the new sentences, as returned by `cache_stats` of the scorer
+    """
+    if cached_stats is None:
+      raise ValueError(f'Scorer "{self.scorer.idstr()}" cannot score a corpus incrementally as it cannot cache '
+                       f'statistics')
+    if len(cached_stats) == 0:
+      return
+    self._blocks.append(cached_stats)
+    self._num_sents += len(cached_stats)
+    if self._summable:
+      summed_stats = self.scorer.sum_stats(cached_stats)
+      if summed_stats is None:
+        self._summable = False
+        self._summed_stats = None
+      elif self._summed_stats is None:
+        self._summed_stats = summed_stats
+      else:
+        self._summed_stats = self._summed_stats + summed_stats
+
+  def score(self):
+    """
+    Score the corpus
+
+    Returns:
+      A tuple containing a single value for the score and a string summarizing auxiliary information
+    """
+    if self._num_sents == 0:
+      return self.scorer.score_corpus([], [])
+    if self._summable:
+      return self.scorer.score_summed_stats(self._summed_stats, self._num_sents)
+    return self.scorer.score_cached_corpus(range(self._num_sents), self.stats)
+
+class IncrementalWordMatches(object):
+  """
+  Accumulates the bucketed word match counts of a corpus to which sentences are appended over time.
+  The bucketer must not depend on the corpus itself (e.g. word frequencies should come from a fixed file), as the
+  buckets of the sentences seen so far are not recalculated.
+  """
+  def __init__(self, bucketer):
+    """
+    Args:
+      bucketer: A word bucketer
+    """
+    self.bucketer = bucketer
+    self.match_counts = [[0, 0, 0] for _ in bucketer.bucket_strs]
+
+  def _add(self, match_counts):
+    for total, counts in zip(self.match_counts, match_counts):
+      for j in range(3):
+        total[j] += counts[j]
+
+  def append(self, ref, out, ref_labels=None, out_labels=None):
+    """
+    Append sentences to the corpus
+
+    Args:
+      ref: The new reference sentences
+      out: The new output sentences
+      ref_labels: Labels of the new reference sentences (optional)
+      out_labels: Labels of the new output sentences (should be specified iff ref_labels is)
+    """
+    self._add(self.bucketer.calc_bucketed_match_counts(ref, out, ref_labels=ref_labels, out_labels=out_labels))
+
+  def append_source(self, src, ref, out, ref_aligns, out_aligns, src_labels=None):
+    """
+    Append sentences to the corpus, counting the matches of source words
+
+    Args:
+      src: The new source sentences
+      ref: The new reference sentences
+      out: The new output sentences
+      ref_aligns: Alignments of the new reference sentences
+      out_aligns: Alignments of the new output sentences
+      src_labels: Labels of the new source sentences (optional)
+    """
+    self._add(self.bucketer.calc_source_bucketed_match_counts(src, ref, out, ref_aligns, out_aligns,
+                                                              src_labels=src_labels))
+
+  def match_stats(self):
+    """
+    Calculate recall, precision and F-measure of each bucket
+
+    Returns:
+      A list with a tuple for each bucket, in the format of `WordBucketer.calc_bucketed_matches`
+    """
+    return list(self.bucketer.calc_match_stats(self.match_counts))
+
+class IncrementalSentenceBuckets(object):
+  """
+  Accumulates the number of sentences of each bucket, and optionally their score, for a corpus to which sentences
+  are appended over time
+  """
+  def __init__(self, bucketer, scorer=None):
+    """
+    Args:
+      bucketer: A sentence bucketer
+      scorer: A scorer to score the sentences of each bucket, or None to only count them
+    """
+    self.bucketer = bucketer
+    self.scorer = scorer
+    self.counts = [0 for _ in bucketer.bucket_strs]
+    self.scores = [IncrementalScorer(scorer) for _ in bucketer.bucket_strs] if scorer is not None else None
+
+  def append(self, out, ref=None, ref_labels=None, out_labels=None):
+    """
+    Append sentences to the corpus
+
+    Args:
+      out: The new output sentences
+      ref: The new reference sentences
+      ref_labels: Labels of the new reference sentences (optional)
+      out_labels: Labels of the new output sentences (optional)
+    """
+    bucketed_corpus = self.bucketer.create_bucketed_corpus(out, ref=ref, ref_labels=ref_labels, out_labels=out_labels)
+    for j, (bucket_out, bucket_ref) in enumerate(bucketed_corpus):
+      self.counts[j] += len(bucket_out)
+      if self.scores is not None and len(bucket_out) > 0:
+        self.scores[j].append(bucket_ref, bucket_out)
+
+  def statistics(self):
+    """
+    Calculate the statistic of each bucket
+
+    Returns:
+      A list with the number of sentences of each bucket, or with their score if there is a scorer
+    """
+    if self.scores is None:
+      return list(self.counts)
+    return [x.score()[0] for x in self.scores]
@@ -0,0 +1,256 @@
+import atexit
+import functools
+import glob
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from compare_mt import corpus_utils
+
+# Default METEOR weights of the matching stages and parameters (alpha, beta, gamma, delta)
+DEFAULT_WEIGHTS = (1.0, 0.6, 0.8, 0.6)
+DEFAULT_PARAMETERS = (0.85, 0.2, 0.6, 0.75)
+
+def _find_jar(meteor_directory):
+  jars = sorted(glob.glob(os.path.join(meteor_directory, 'meteor-*.jar')))
+  if not jars:
+    raise ValueError(f'Could not find meteor-*.jar in the METEOR directory "{meteor_directory}"')
+  return jars[0]
+
+def meteor_command(meteor_directory, options=None):
+  """
+  Build the command that starts a METEOR process reading sentence pairs from standard input
+
+  Args:
+    meteor_directory: The directory of the METEOR code, containing meteor-*.jar
+    options: A string with additional command line options for METEOR
+
+  Returns:
+    The command as a list of arguments
+  """
+  command = ['java', '-Xmx2G', '-jar', _find_jar(meteor_directory), '-', '-', '-stdio']
+  if options:
+    command += shlex.split(options)
+  return command
+
+@functools.lru_cache(maxsize=None)
+def get_weights_and_parameters(meteor_directory, options=None):
+  """
+  Get the weights and parameters that METEOR uses with some options.
+  Weights and parameters given explicitly with `-w` and `-p` are read from the options. Otherwise METEOR is run
+  once on a dummy sentence to print them, and the result is remembered for the rest of the run.
+
+  Args:
+    meteor_directory: The directory of the METEOR code, containing meteor-*.jar
+    options: A string with additional command line options for METEOR
+
+  Returns:
+    A numpy array with the weights of the four matching stages, and one with the parameters alpha, beta, gamma
+    and delta
+  """
+  if options is None:
+    return np.array(DEFAULT_WEIGHTS), np.array(DEFAULT_PARAMETERS)
+
+  args = shlex.split(options)
+  given = {flag: args[i+1].split() for i, flag in enumerate(args[:-1]) if flag in ('-w', '-p')}
+  if '-w' in given and '-p' in given:
+    return np.array(given['-w'], dtype=float), np.array(given['-p'], dtype=float)
+
+  with tempfile.TemporaryDirectory() as directory:
+    ref_name = os.path.join(directory, 'ref')
+    out_name = os.path.join(directory, 'out')
+    corpus_utils.write_tokens(ref_name, [["test"]])
+    corpus_utils.write_tokens(out_name, [["test"]])
+    command = ['java', '-Xmx2G', '-jar', _find_jar(meteor_directory), out_name, ref_name] + args
+    stats = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout.decode("utf-8").split()
+
+  weights_index = stats.index('Weights:') + 1
+  params_index = stats.index('Parameters:') + 1
+  return (np.array(stats[weights_index:weights_index+4], dtype=float),
+          np.array(stats[params_index:params_index+4], dtype=float))
+
+class MeteorWorker(object):
+  """
+  A METEOR process that stays alive and scores sentences sent to it over standard input, using the `-stdio`
+  protocol: each "SCORE ||| reference ||| output" line is answered by a line with the sufficient statistics of the
+  sentence.
+  """
+  def __init__(self, command):
+    """
+    Args:
+      command: The command that starts the process, as a list of arguments
+    """
+    self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    encoding='utf-8', bufsize=1)
+
+  def _write_requests(self, ref, out):
+    try:
+      for r, o in zip(ref, out):
+        self.process.stdin.write(f'SCORE ||| {" ".join(r)} ||| {" ".join(o)}\n')
+      self.process.stdin.flush()
+    except (BrokenPipeError, ValueError):
+      # The process died, which is reported by the reader
+      pass
+
+  def sentence_stats(self, ref, out):
+    """
+    Calculate the METEOR statistics of every sentence of a corpus.
+    The sentences are written by a separate thread while the answers are read, so that neither side blocks
+    on a full pipe.
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A numpy matrix with one row of statistics per sentence
+    """
+    writer = threading.Thread(target=self._write_requests, args=(ref, out), daemon=True)
+    writer.start()
+    stats = []
+    for _ in range(min(len(ref), len(out))):
+      line = self.process.stdout.readline()
+      if not line:
+        raise RuntimeError(f'The METEOR process exited with code {self.process.wait()}')
+      stats.append([float(x) for x in line.split()])
+    writer.join()
+    return np.array(stats, dtype=float)
+
+  def close(self):
+    """
+    Stop the process
+    """
+    if self.process.poll() is None:
+      try:
+        self.process.stdin.close()
+        self.process.wait(timeout=5)
+      except (OSError, subprocess.TimeoutExpired):
+        self.process.kill()
+        self.process.wait()
+
+class MeteorPool(object):
+  """
+  A set of METEOR workers sharing one command. Workers are started only when needed, up to `num_workers`, and are
+  re-used by all the scorers, systems and reports of a run.
+  """
+  def __init__(self, command, num_workers=1):
+    """
+    Args:
+      command: The command that starts a worker, as a list of arguments
+      num_workers: The maximum number of workers running at the same time
+    """
+    self.command = list(command)
+    self.num_workers = num_workers
+    self.idle = []
+    self.num_started = 0
+    self.condition = threading.Condition()
+
+  def _acquire(self):
+    with self.condition:
+      while not self.idle and self.num_started >= self.num_workers:
+        self.condition.wait()
+      if self.idle:
+        return self.idle.pop()
+      self.num_started += 1
+    try:
+      return MeteorWorker(self.command)
+    except Exception:
+      self._release(None)
+      raise
+
+  def _release(self, worker):
+    with self.condition:
+      if worker is None:
+        self.num_started -= 1
+      else:
+        self.idle.append(worker)
+      self.condition.notify()
+
+  def sentence_stats(self, ref, out):
+    """
+    Calculate the METEOR statistics of every sentence of a corpus with the first free worker
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A numpy matrix with one row of statistics per sentence
+    """
+    worker = self._acquire()
+    try:
+      stats = worker.sentence_stats(ref, out)
+    except Exception:
+      # A failed worker may still have answers in its pipe, so it is not re-used
+      worker.close()
+      self._release(None)
+      raise
+    self._release(worker)
+    return stats
+
+  def map_sentence_stats(self, ref, outs):
+    """
+    Calculate the METEOR statistics of several output corpora, each on its own worker
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with a matrix of statistics for each output corpus
+    """
+    if self.num_workers <= 1 or len(outs) <= 1:
+      return [self.sentence_stats(ref, out) for out in outs]
+    with ThreadPoolExecutor(max_workers=min(self.num_workers, len(outs))) as executor:
+      return list(executor.map(lambda out: self.sentence_stats(ref, out), outs))
+
+  def close(self):
+    """
+    Stop all the idle workers
+    """
+    with self.condition:
+      idle, self.idle = self.idle, []
+      self.num_started -= len(idle)
+    for worker in idle:
+      worker.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(command, num_workers=1):
+  """
+  Get the shared pool of METEOR workers that run a command, creating it if necessary
+
+  Args:
+    command: The command that starts a worker, as a list of arguments
+    num_workers: The number of workers that may run at the same time. A pool that already exists is only ever
+                 enlarged.
+
+  Returns:
+    A MeteorPool
+  """
+  with _pools_lock:
+    pool = _pools.get(tuple(command))
+    if pool is None:
+      pool = _pools[tuple(command)] = MeteorPool(command, num_workers=num_workers)
+    elif num_workers > pool.num_workers:
+      with pool.condition:
+        pool.num_workers = num_workers
+        pool.condition.notify_all()
+    return pool
+
+@atexit.register
+def close_pools():
+  """
+  Stop the workers of all the shared pools
+  """
+  with _pools_lock:
+    pools = list(_pools.values())
+    _pools.clear()
+  for pool in pools:
+    pool.close()
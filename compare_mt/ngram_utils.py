@@ -1,5 +1,19 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+import functools
 import itertools
+import operator
+import weakref
+
+import numpy as np
+
+from compare_mt import corpus_utils
+from compare_mt import parallel_utils
+
+# N-gram orders whose statistics are always calculated together, so that BLEU and ROUGE-1/2 share them
+DEFAULT_MAX_LENGTH = 4
+
+# N-gram match statistics of pairs of corpora sharing a vocabulary, which are kept only as long as the corpora
+_pair_stats = weakref.WeakKeyDictionary()
 
 def sent_ngrams_list(words, n):
   """
@@ -40,6 +54,138 @@ def iterate_sent_ngrams(words, labels=None, min_length=1, max_length=4):
       label_ngram = tuple(labels[i:i + n + 1]) if (labels is not None) else word_ngram
       yield word_ngram, label_ngram
 
+def sent_ngram_counts(words, max_length=DEFAULT_MAX_LENGTH):
+  """
+  Count the n-grams of all orders up to a maximum length in a sentence
+
+  Arguments:
+    words: A list of words (or word IDs) representing a sentence
+    max_length: The maximum ngram length to consider
+
+  Returns:
+    A list with a Counter of the n-grams of each order, starting with unigrams
+  """
+  return [Counter(zip(*[words[i:] for i in range(n)])) for n in range(1, max_length+1)]
+
+def corpus_ngram_counts(corpus, max_length=DEFAULT_MAX_LENGTH):
+  """
+  Count the n-grams of every sentence of a corpus, one sentence at a time.
+  The n-grams of a Corpus are tuples of word IDs. The counts are not kept, so that only the counts of the current
+  sentence are in memory.
+
+  Arguments:
+    corpus: A corpus
+    max_length: The maximum ngram length to consider
+
+  Returns:
+    An iterator over the n-gram counts of each sentence as returned by `sent_ngram_counts`
+  """
+  return _ngram_counts(corpus, max_length, isinstance(corpus, corpus_utils.Corpus))
+
+def _ngram_counts(corpus, max_length, by_id):
+  sents = corpus.iter_ids() if by_id else corpus
+  return (sent_ngram_counts(words, max_length) for words in sents)
+
+def _pair_ngram_counts(ref, out, max_length):
+  """
+  Count the n-grams of a reference and an output corpus over word IDs if they share a vocabulary, or over words
+
+  Returns:
+    Iterators over the n-gram counts of each corpus, and the shared vocabulary or None
+  """
+  vocab = corpus_utils.shared_vocab(ref, out)
+  by_id = vocab is not None
+  return _ngram_counts(ref, max_length, by_id), _ngram_counts(out, max_length, by_id), vocab
+
+def ngram_match_stats(ref, out, max_length=DEFAULT_MAX_LENGTH):
+  """
+  Calculate the n-gram statistics of each pair of sentences: the number of output n-grams that match the reference
+  (clipped by their count in the reference), and the number of n-grams in the output and in the reference.
+  For corpora sharing a vocabulary, they are calculated once per pair of corpora.
+
+  With several references, the output n-grams are clipped by their maximum count in any reference, and the
+  reference n-grams are those of the reference whose length is closest to the output (the shorter one on ties),
+  as in multi-reference BLEU.
+
+  Args:
+    ref: A reference corpus, or a MultiReference
+    out: An output corpus
+    max_length: The maximum ngram length to consider
+
+  Returns:
+    An integer numpy array with shape (sentences, orders, 3), holding the matches, output n-grams and reference
+    n-grams of each order, and which may include orders above `max_length`
+  """
+  return system_ngram_match_stats(ref, [out], max_length)[0]
+
+def system_ngram_match_stats(ref, outs, max_length=DEFAULT_MAX_LENGTH):
+  """
+  Calculate the n-gram statistics of several outputs against the same reference, as `ngram_match_stats` does for
+  each of them. The n-grams are counted in each chunk of sentences and reduced into the statistics right away, with
+  the n-grams of each reference sentence counted once for all the outputs. Only the statistics are cached.
+
+  Args:
+    ref: A reference corpus, or a MultiReference
+    outs: A list of output corpora
+    max_length: The maximum ngram length to consider
+
+  Returns:
+    A list with the statistics of each output, as returned by `ngram_match_stats`
+  """
+  refs = ref.refs if isinstance(ref, corpus_utils.MultiReference) else [ref]
+  shared = [corpus_utils.shared_vocab(out, *refs) is not None for out in outs]
+  stats = [_pair_stats.get(out, {}).get(ref) if is_shared else None for out, is_shared in zip(outs, shared)]
+  missing = [i for i, x in enumerate(stats) if x is None or x.shape[1] < max_length]
+  if not missing:
+    return stats
+
+  by_id = all(shared[i] for i in missing)
+  # Corpora sharing a vocabulary always have the statistics of the default orders
+  length = max(max_length, DEFAULT_MAX_LENGTH) if by_id else max_length
+  missing_outs = [outs[i] for i in missing]
+  if len(refs) == 1:
+    chunk_stats = parallel_utils.map_chunks(lambda r, *os: _ngram_match_stats(r, os, length, by_id),
+                                            refs[0], *missing_outs)
+  else:
+    closest_lens = [corpus_utils.closest_refs(ref, out)[1] for out in missing_outs]
+    num_refs, num_outs = len(refs), len(missing_outs)
+    chunk_stats = parallel_utils.map_chunks(
+      lambda *cs: _multi_ref_ngram_match_stats(cs[:num_refs], cs[num_refs:num_refs+num_outs], cs[num_refs+num_outs:],
+                                               length, by_id),
+      *refs, *missing_outs, *closest_lens)
+  for i, out_stats in zip(missing, np.concatenate(chunk_stats, axis=1)):
+    stats[i] = out_stats
+    if shared[i]:
+      _pair_stats.setdefault(outs[i], weakref.WeakKeyDictionary())[ref] = out_stats
+  return stats
+
+def _ngram_match_stats(ref, outs, length, by_id):
+  stats = np.zeros((len(outs), len(ref), length, 3), dtype=np.int64)
+  out_counts = [_ngram_counts(out, length, by_id) for out in outs]
+  for i, (ref_sent, *out_sents) in enumerate(zip(_ngram_counts(ref, length, by_id), *out_counts)):
+    ref_totals = [sum(ref_cnt.values()) for ref_cnt in ref_sent]
+    for j, out_sent in enumerate(out_sents):
+      stats[j, i] = [(sum(min(cnt, ref_cnt[ngram]) for ngram, cnt in out_cnt.items()) if ref_cnt else 0,
+                      sum(out_cnt.values()), ref_total)
+                     for ref_cnt, out_cnt, ref_total in zip(ref_sent, out_sent, ref_totals)]
+  return stats
+
+def _multi_ref_ngram_match_stats(refs, outs, closest_lens, length, by_id):
+  stats = np.zeros((len(outs), len(refs[0]), length, 3), dtype=np.int64)
+  ref_counts = [_ngram_counts(x, length, by_id) for x in refs]
+  out_counts = [_ngram_counts(out, length, by_id) for out in outs]
+  closest_lens = [x.tolist() for x in closest_lens]
+  for i, sent_counts in enumerate(zip(*ref_counts, *out_counts)):
+    ref_sents, out_sents = sent_counts[:len(refs)], sent_counts[len(refs):]
+    # The maximum count of each n-gram in any reference clips the matches of the output n-grams
+    max_counts = [functools.reduce(operator.or_, ref_cnts) for ref_cnts in zip(*ref_sents)]
+    for j, out_sent in enumerate(out_sents):
+      # The closest reference has one n-gram of order n+1 at each position but the last n
+      stats[j, i] = [(sum(min(cnt, max_cnt[ngram]) for ngram, cnt in out_cnt.items()), sum(out_cnt.values()),
+                      max(closest_lens[j][i] - n, 0))
+                     for n, (max_cnt, out_cnt) in enumerate(zip(max_counts, out_sent))]
+  return stats
+
 def compare_ngrams(ref, out, ref_labels=None, out_labels=None, min_length=1, max_length=4):
   """
   Compare n-grams appearing in the reference sentences and output
@@ -61,13 +207,21 @@ def compare_ngrams(ref, out, ref_labels=None, out_labels=None, min_length=1, max
   """
   if (ref_labels is None) != (out_labels is None):
     raise ValueError('ref_labels or out_labels must both be either None or not None')
-  total, match, over, under = [defaultdict(lambda: 0) for _ in range(4)]
-  if ref_labels is None: ref_labels = []
-  if out_labels is None: out_labels = []
+  results = parallel_utils.map_chunks(
+    lambda r, o, r_lab, o_lab: _compare_ngrams(r, o, r_lab, o_lab, min_length, max_length),
+    ref, out, ref_labels, out_labels)
+  if len(results) == 1:
+    return results[0]
+  return tuple(parallel_utils.sum_counts(x) for x in zip(*results))
+
+def _compare_ngrams(ref, out, ref_labels, out_labels, min_length, max_length):
+  if ref_labels is None:
+    return _compare_ngram_counts(ref, out, min_length, max_length)
+  total, match, over, under = [defaultdict(int) for _ in range(4)]
   for ref_sent, out_sent, ref_lab, out_lab in itertools.zip_longest(ref, out, ref_labels, out_labels):
     # Find the number of reference n-grams (on a word level)
     ref_ngrams = list(iterate_sent_ngrams(ref_sent, labels=ref_lab, min_length=min_length, max_length=max_length))
-    ref_word_counts = defaultdict(lambda: 0)
+    ref_word_counts = defaultdict(int)
     for ref_w, ref_l in ref_ngrams:
       ref_word_counts[ref_w] += 1
     # Step through the output ngrams and find matched and overproduced ones
@@ -85,3 +239,32 @@ def compare_ngrams(ref, out, ref_labels=None, out_labels=None, min_length=1, max
         under[ref_l] += 1
         ref_word_counts[ref_w] -= 1
   return total, match, over, under
+
+def _compare_ngram_counts(ref, out, min_length, max_length):
+  """
+  Compare n-grams without labels, from the shared n-gram counts of each sentence
+  """
+  total, match, over, under = [defaultdict(int) for _ in range(4)]
+  ref_counts, out_counts, vocab = _pair_ngram_counts(ref, out, max_length)
+  for ref_sent, out_sent in zip(ref_counts, out_counts):
+    for n in range(min_length-1, max_length):
+      ref_cnt, out_cnt = ref_sent[n], out_sent[n]
+      for ngram, cnt in out_cnt.items():
+        matched = min(cnt, ref_cnt[ngram])
+        total[ngram] += cnt
+        if matched > 0:
+          match[ngram] += matched
+        if cnt > matched:
+          over[ngram] += cnt - matched
+      for ngram, cnt in ref_cnt.items():
+        if cnt > out_cnt[ngram]:
+          under[ngram] += cnt - out_cnt[ngram]
+  if vocab is not None:
+    total, match, over, under = [_decode_keys(x, vocab) for x in (total, match, over, under)]
+  return total, match, over, under
+
+def _decode_keys(counts, vocab):
+  decoded = defaultdict(int)
+  for ngram, cnt in counts.items():
+    decoded[tuple(vocab.i2w[x] for x in ngram)] = cnt
+  return decoded
@@ -0,0 +1,115 @@
+import itertools
+import multiprocessing
+import threading
+import warnings
+from collections import defaultdict
+
+from compare_mt import corpus_utils
+
+# Global variable specifying the number of processes that run the per-sentence loops (1 to run them serially)
+global_jobs = 1
+
+# Minimum number of sentences in a chunk, as smaller chunks are not worth sending to another process
+_MIN_CHUNK_SIZE = 256
+
+# Number of chunks per process, so that processes finishing early take over the remaining chunks
+_CHUNKS_PER_JOB = 4
+
+# The function and corpora of the running map, inherited by the forked worker processes
+_task = None
+
+def _fork_context():
+  try:
+    return multiprocessing.get_context('fork')
+  except ValueError:
+    return None
+
+def _init_worker():
+  global global_jobs
+  # Maps started inside a worker run serially
+  global_jobs = 1
+
+def _run_chunk(bounds):
+  func, corpora = _task
+  start, end = bounds
+  return func(*[corpus_utils.slice_corpus(x, start, end) for x in corpora])
+
+def _stop_threads():
+  """
+  Stop the background threads of the current process before forking, as a forked child can deadlock on a lock that
+  another thread held at the time of the fork (e.g. in logging or a decompressor). The threads of the corpus loader
+  are stopped once their files are loaded, and later files are loaded in the calling thread.
+
+  Returns:
+    Whether the current thread is the only one left
+  """
+  if corpus_utils.global_loader is not None:
+    corpus_utils.global_loader.close()
+  return threading.active_count() == 1
+
+def map_chunks(func, *corpora, jobs=None):
+  """
+  Apply a function to chunks of consecutive sentences of aligned corpora, in `global_jobs` processes.
+  The worker processes are forked, so the function and the corpora are shared with them without being copied, and
+  the function can be any callable (e.g. a lambda or a bound method). Only the results are sent back.
+
+  With a single job (or on platforms that cannot fork, for small corpora, or while other threads that cannot be
+  stopped are alive), the function is applied to the whole corpora in the current process. The function must
+  therefore handle sentences independently, so that merging the results of the chunks gives the same result as a
+  single call.
+
+  Args:
+    func: The function to apply to the chunks of each corpus
+    corpora: Corpora or lists of per-sentence items (e.g. labels) aligned with the first corpus, or None
+    jobs: The number of processes (defaults to `global_jobs`)
+
+  Returns:
+    A list with the result of each chunk, in the order of the sentences
+  """
+  global _task
+  jobs = global_jobs if jobs is None else jobs
+  num_sents = len(corpora[0])
+  num_chunks = min(jobs * _CHUNKS_PER_JOB, num_sents // _MIN_CHUNK_SIZE)
+  context = _fork_context() if jobs > 1 and num_chunks > 1 else None
+  if context is not None and not _stop_threads():
+    warnings.warn('Running serially as other threads are alive, which could deadlock forked processes')
+    context = None
+  if context is None:
+    return [func(*corpora)]
+
+  bounds = [(num_sents * i // num_chunks, num_sents * (i+1) // num_chunks) for i in range(num_chunks)]
+  _task = (func, corpora)
+  try:
+    with context.Pool(min(jobs, num_chunks), initializer=_init_worker) as pool:
+      return pool.map(_run_chunk, bounds, chunksize=1)
+  finally:
+    _task = None
+
+def concat_lists(results):
+  """
+  Merge the per-sentence lists returned for each chunk
+
+  Args:
+    results: The results of `map_chunks`
+
+  Returns:
+    A single list
+  """
+  return list(itertools.chain.from_iterable(results))
+
+def sum_counts(results):
+  """
+  Merge count dictionaries returned for each chunk by adding them up. Keys appear in the order in which they first
+  appear in the chunks, as they would in a single pass over all the sentences.
+
+  Args:
+    results: The results of `map_chunks`, each a dictionary of counts
+
+  Returns:
+    A defaultdict with the sum of the counts
+  """
+  total = defaultdict(int)
+  for counts in results:
+    for key, value in counts.items():
+      total[key] += value
+  return total
@@ -1,11 +1,12 @@
 
-import itertools
 import numpy as np
 
 from typing import List, Tuple, Optional
 from collections import Counter
 
 from compare_mt import ngram_utils
+from compare_mt import corpus_utils
+from compare_mt import parallel_utils
 
 
 Tokens = List[str]
@@ -66,27 +67,52 @@ def repetition_stats_in_corpus(ref: Sentences,
     :return: A list of integers, where list elements correspond to lines in the input corpus.
     """
 
-    reps_per_line = []
+    return parallel_utils.concat_lists(parallel_utils.map_chunks(
+        lambda o, r, s: _repetition_stats_in_corpus(r, o, s, adjacent, ngram_order, subtract_legitimate_reps),
+        out, ref, src))
 
-    src_lines = [] if src is None else src
 
-    for out_line, ref_line, src_line in itertools.zip_longest(out, ref, src_lines):
+def _repetition_stats_in_corpus(ref: Sentences,
+                                out: Sentences,
+                                src: Optional[Sentences],
+                                adjacent: bool,
+                                ngram_order: int,
+                                subtract_legitimate_reps: bool) -> List[int]:
 
-        out_reps = num_repetitions_in_sentence(out_line, adjacent, ngram_order)
+    reps_per_line = num_repetitions_in_corpus(out, adjacent, ngram_order)
 
-        if subtract_legitimate_reps:
-            ref_reps = num_repetitions_in_sentence(ref_line, adjacent, ngram_order)
+    if subtract_legitimate_reps:
+        ref_reps = num_repetitions_in_corpus(ref, adjacent, ngram_order)
+        src_reps = [0] * len(ref_reps) if src is None else num_repetitions_in_corpus(src, adjacent, ngram_order)
 
-            if src is None:
-                src_reps = 0
-            else:
-                src_reps = num_repetitions_in_sentence(src_line, adjacent, ngram_order)
+        for i in range(len(reps_per_line)):
+            reps_per_line[i] -= max(src_reps[i], ref_reps[i])
 
-            out_reps -= max(src_reps, ref_reps)
+    return reps_per_line
 
-        reps_per_line.append(out_reps)
 
-    return reps_per_line
+def num_repetitions_in_corpus(corpus: Sentences,
+                              adjacent: bool = True,
+                              ngram_order: int = 1) -> List[int]:
+    """
+    Counts repetitions in each sentence of a corpus. Repetitions that need not be adjacent
+    are read from the n-gram counts of each sentence.
+
+    :param corpus: Lines of a corpus.
+    :param adjacent: Whether repeated elements need to occur adjacent
+                     to each other to count towards repetitions.
+    :param ngram_order: Order of ngrams considered, positive integer.
+
+    :return: A list with the number of times an element was repeated in each line.
+    """
+
+    if not adjacent:
+        return [sum(counts[ngram_order - 1].values()) - len(counts[ngram_order - 1])
+                for counts in ngram_utils.corpus_ngram_counts(corpus, ngram_order)]
+
+    # repetitions only depend on token equality, so count over word IDs when possible
+    corpus, = corpus_utils.as_id_sents(corpus)
+    return [num_repetitions_in_sentence(line, adjacent, ngram_order) for line in corpus]
 
 
 def repetition_examples(ref: Sentences,
@@ -38,7 +38,6 @@ import collections
 import re
 
 from nltk.stem import porter
-import numpy as np
 import six
 from six.moves import xrange  # pylint: disable=redefined-builtin
 from compare_mt.rouge import scoring
@@ -136,17 +135,7 @@ def _score_lcs(target_tokens, prediction_tokens):
   if not target_tokens or not prediction_tokens:
     return scoring.Score(precision=0, recall=0, fmeasure=0)
 
-  # Compute length of LCS from the bottom up in a table (DP appproach).
-  cols = len(prediction_tokens) + 1
-  rows = len(target_tokens) + 1
-  lcs_table = np.zeros((rows, cols))
-  for i in xrange(1, rows):
-    for j in xrange(1, cols):
-      if target_tokens[i - 1] == prediction_tokens[j - 1]:
-        lcs_table[i, j] = lcs_table[i - 1, j - 1] + 1
-      else:
-        lcs_table[i, j] = max(lcs_table[i - 1, j], lcs_table[i, j - 1])
-  lcs_length = lcs_table[-1, -1]
+  lcs_length = _lcs_length(target_tokens, prediction_tokens)
 
   precision = lcs_length / len(prediction_tokens)
   recall = lcs_length / len(target_tokens)
@@ -155,6 +144,32 @@ def _score_lcs(target_tokens, prediction_tokens):
   return scoring.Score(precision=precision, recall=recall, fmeasure=fmeasure)
 
 
+def _lcs_length(target_tokens, prediction_tokens):
+  """Computes the length of the LCS (Longest Common Subsequence).
+
+  Uses the bit-parallel algorithm of Allison and Dix (1986), in the formulation
+  of Hyyro (2004): one bit per target token is kept in a Python integer, and
+  each prediction token updates all of them with a few integer operations.
+
+  Args:
+    target_tokens: Tokens (or token IDs) from the target text.
+    prediction_tokens: Tokens (or token IDs) from the predicted text.
+  Returns:
+    The length of the LCS.
+  """
+
+  matches = {}
+  for i, token in enumerate(target_tokens):
+    matches[token] = matches.get(token, 0) | (1 << i)
+  mask = (1 << len(target_tokens)) - 1
+  # Zero bits of v mark the target positions that end a common subsequence.
+  v = mask
+  for token in prediction_tokens:
+    u = v & matches.get(token, 0)
+    v = ((v + u) | (v - u)) & mask
+  return len(target_tokens) - bin(v).count("1")
+
+
 def _score_ngrams(target_ngrams, prediction_ngrams):
   """Compute n-gram based rouge scores.
 
@@ -1,24 +1,141 @@
 import nltk
-import nltk.translate.chrf_score  # This is necessary to avoid an AttributeError in NLTK
+import nltk.translate.bleu_score  # This is necessary to avoid an AttributeError in NLTK
 import sacrebleu
 import numpy as np
 import math
 import re
-import subprocess
-import tempfile
 from collections import Counter
 
 from compare_mt import corpus_utils
 from compare_mt import align_utils
+from compare_mt import edit_utils
+from compare_mt import meteor_utils
 from compare_mt import ngram_utils
+from compare_mt import parallel_utils
 from compare_mt.rouge import rouge_scorer
 
 # Global variable controlling scorer scale
 global_scorer_scale = 100.0
 
 
+class SufficientStats(object):
+  """
+  The sufficient statistics of a scorer for the sentences of a corpus, stored once as a contiguous numpy array with
+  one row per sentence.
+
+  Scorers calculate corpus scores from sums of rows, possibly after deriving other per-sentence values from them.
+  The derived values and the sums over all the sentences are calculated only once, so that the score of a corpus
+  and the scores of the many subsets drawn by a bootstrap test all work on the same arrays without converting the
+  statistics again. The statistics can be read like a numpy array (e.g. with indexing, len or np.asarray).
+  """
+  def __init__(self, data):
+    """
+    Args:
+      data: The statistics of each sentence, as anything numpy can convert into an array
+    """
+    self.data = np.ascontiguousarray(data)
+    self._derived = {}
+    self._totals = {}
+
+  @classmethod
+  def of(cls, cached_stats):
+    """
+    Get statistics as SufficientStats, converting them only if necessary
+
+    Args:
+      cached_stats: SufficientStats, or statistics in another format (e.g. a list or an array)
+
+    Returns:
+      The SufficientStats
+    """
+    return cached_stats if isinstance(cached_stats, cls) else cls(cached_stats)
+
+  @classmethod
+  def concatenate(cls, stats_list):
+    """
+    Concatenate the statistics of consecutive parts of a corpus
+
+    Args:
+      stats_list: A list of SufficientStats or arrays
+
+    Returns:
+      The SufficientStats of the whole corpus
+    """
+    return cls(np.concatenate([np.asarray(x) for x in stats_list]))
+
+  def __len__(self):
+    return len(self.data)
+
+  def __getitem__(self, i):
+    return self.data[i]
+
+  def __array__(self, dtype=None, copy=None):
+    return self.data if dtype is None else self.data.astype(dtype)
+
+  @property
+  def shape(self):
+    return self.data.shape
+
+  @property
+  def dtype(self):
+    return self.data.dtype
+
+  def rows(self, derive=None):
+    """
+    Get the per-sentence rows that are summed to calculate scores
+
+    Args:
+      derive: A function calculating other per-sentence values from the statistics (e.g. sentence F-scores),
+              which is called only once for each function, or None to use the statistics themselves
+
+    Returns:
+      A numpy array with one row per sentence
+    """
+    if derive is None:
+      return self.data
+    if derive not in self._derived:
+      self._derived[derive] = derive(self.data)
+    return self._derived[derive]
+
+  def sum(self, sent_ids=None, derive=None):
+    """
+    Sum the rows of a set of sentences
+
+    Args:
+      sent_ids: The ids of the sentences, or None for all the sentences
+      derive: A function deriving the rows from the statistics, as in `rows`
+
+    Returns:
+      A numpy array with the sum of each column
+    """
+    rows = self.rows(derive)
+    if sent_ids is None or (isinstance(sent_ids, range) and sent_ids == range(len(self))):
+      if derive not in self._totals:
+        self._totals[derive] = rows.sum(axis=0)
+      return self._totals[derive]
+    return np.take(rows, np.asarray(sent_ids, dtype=np.int64), axis=0).sum(axis=0)
+
+  def sum_samples(self, sample_counts, derive=None):
+    """
+    Sum the rows of many samples of sentences at once, as a single product of matrices
+
+    Args:
+      sample_counts: A matrix with one row per sample and one column per sentence, holding the number of times each
+                     sentence is drawn in each sample
+      derive: A function deriving the rows from the statistics, as in `rows`
+
+    Returns:
+      A float numpy array with the sum of each column for each sample
+    """
+    rows = self.rows(derive)
+    return np.asarray(sample_counts, dtype=float) @ rows.reshape(len(rows), -1).astype(float)
+
+
 class Scorer(object):
 
+  # Whether the scorer uses all the references of a corpus_utils.MultiReference, and not only the first one
+  multi_reference = False
+
   @property
   def scale(self):
     return 1.0
@@ -29,9 +146,111 @@ class Scorer(object):
   def score_sentence(self, ref, out):
     pass
 
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the score and the auxiliary information string of each sentence
+    """
+    return [self.score_sentence(r, o) for r, o in zip(ref, out)]
+
   def cache_stats(self, ref, out):
     return None
 
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache sufficient statistics for several systems with the same reference. Structures built from a Corpus (its
+    lowercased words and lengths) are cached on it and thus already shared by all the systems; scorers
+    building other structures from the reference override this to build them only once.
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with the statistics returned by cache_stats for each system
+    """
+    return [self.cache_stats(ref, out) for out in outs]
+
+  def score_corpora(self, ref, outs):
+    """
+    Score the corpora of several systems with the same reference, building the reference-side structures only once
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with a tuple of the score and a string summarizing auxiliary information for each system
+    """
+    cached_stats = self.cache_system_stats(ref, outs)
+    if all(x is not None for x in cached_stats):
+      return [self.score_cached_corpus(range(len(ref)), x) for x in cached_stats]
+    return [self.score_corpus(ref, out) for out in outs]
+
+  def sum_stats(self, cached_stats):
+    """
+    Sum cached statistics over sentences. Scorers whose corpus score only depends on these sums implement this and
+    `score_summed_stats`, so that the score of a growing corpus can be updated from the statistics of the new
+    sentences alone (see `incremental_utils`).
+
+    Args:
+      cached_stats: The statistics returned by cache_stats
+
+    Returns:
+      A numpy array with the summed statistics, which can be added to the sums of other sentences, or None if the
+      corpus score cannot be calculated from sums
+    """
+    return None
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    """
+    Sum cached statistics over many samples of sentences at once, e.g. for bootstrap resampling. Scorers that
+    implement `sum_stats` implement this too.
+
+    Args:
+      cached_stats: The statistics returned by cache_stats
+      sample_counts: A matrix with one row per sample and one column per sentence, holding the number of times each
+                     sentence is drawn in each sample
+
+    Returns:
+      A numpy array with the summed statistics of each sample, or None if the corpus score cannot be calculated from
+      sums
+    """
+    return None
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    """
+    Score a corpus from statistics summed by sum_stats
+
+    Args:
+      summed_stats: The summed statistics of the sentences of the corpus
+      num_sents: The number of sentences in the corpus
+
+    Returns:
+      A tuple containing a single value for the score and a string summarizing auxiliary information
+    """
+    raise NotImplementedError(f'{type(self).__name__} cannot score a corpus from summed statistics')
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    """
+    Score many corpora of the same size from their summed statistics. Scorers override this with a vectorized
+    version when their score is easy to calculate with array operations.
+
+    Args:
+      summed_stats: A matrix with the summed statistics of each corpus, e.g. as returned by sum_sampled_stats
+      num_sents: The number of sentences in each corpus
+
+    Returns:
+      A numpy array with the score of each corpus
+    """
+    return np.array([self.score_summed_stats(x, num_sents)[0] for x in summed_stats], dtype=float)
+
   def name(self):
     """
     A name that can have spaces that describes the scorer.
@@ -45,6 +264,33 @@ class Scorer(object):
     return None
 
 class SentenceFactoredScorer(Scorer):
+  """
+  A scorer whose corpus score is the average of sentence scores.
+  Subclasses implement `_score_sentence`, which receives sentences that are already lowercased when the scorer
+  is case insensitive, so that whole corpora can be lowercased only once.
+  """
+  def _normalize(self, ref, *outs):
+    if hasattr(self, 'case_insensitive') and self.case_insensitive:
+      ref = corpus_utils.lower(ref)
+      outs = [corpus_utils.lower(out) for out in outs]
+    return (ref, *outs)
+
+  def score_sentence(self, ref, out):
+    """
+    Score a single sentence
+
+    Args:
+      ref: A reference sentence
+      out: An output sentence
+
+    Returns:
+      The score, and a string summarizing auxiliary information
+    """
+    return self._score_sentence(*self._normalize(ref, out))
+
+  def _score_sentence(self, ref, out):
+    raise NotImplementedError('_score_sentence must be implemented in subclasses of SentenceFactoredScorer')
+
   def score_corpus(self, ref, out):
     """
     Score a corpus using the average of the score
@@ -59,10 +305,23 @@ class SentenceFactoredScorer(Scorer):
     if len(ref) == 0:
       return 0.0, None
     score_sum = 0
-    for r, o in zip(ref, out):
-      score_sum += self.score_sentence(r, o)[0]
+    for score, _ in self.score_sentences(ref, out):
+      score_sum += score
     return score_sum/len(ref), None
 
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus, lowercasing the whole corpus only once if necessary
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the score and the auxiliary information string of each sentence
+    """
+    return [self._score_sentence(r, o) for r, o in zip(*self._normalize(ref, out))]
+
   def cache_stats(self, ref, out):
     """
     Cache sufficient statistics for caculating scores
@@ -72,17 +331,10 @@ class SentenceFactoredScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A tuple of cached statistics
+      SufficientStats with the score of each sentence
     """
-    if hasattr(self, 'case_insensitive') and self.case_insensitive:
-      ref = corpus_utils.lower(ref)
-      out = corpus_utils.lower(out)
-
-    cached_scores = []
-    for r, o in zip(ref, out):
-      cached_scores.append(self.score_sentence(r, o)[0])
-  
-    return cached_scores
+    return SufficientStats(np.concatenate(parallel_utils.map_chunks(
+      lambda r, o: np.array([score for score, _ in self.score_sentences(r, o)], dtype=float), ref, out)))
 
   def score_cached_corpus(self, sent_ids, cached_stats):
     """
@@ -90,18 +342,39 @@ class SentenceFactoredScorer(Scorer):
 
     Args:
       sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A tuple of cached statistics
+      cached_stats: The cached statistics
 
     Returns:
       A tuple containing a single value for the score and a string summarizing auxiliary information
     """
-    cached_stats = np.array(cached_stats)
-    return np.mean(cached_stats[sent_ids]), None
+    summed_stats = SufficientStats.of(cached_stats).sum(sent_ids)
+    return self.score_summed_stats(np.atleast_1d(summed_stats), len(sent_ids))
+
+  def sum_stats(self, cached_stats):
+    return np.atleast_1d(SufficientStats.of(cached_stats).sum()).astype(float)
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return 0.0, None
+    return summed_stats[0] / num_sents, None
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts)
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return np.zeros(len(summed_stats))
+    return summed_stats[:, 0] / num_sents
 
 class BleuScorer(Scorer):
   """
   A scorer that calculates BLEU score.
+
+  With several references, n-gram matches are clipped by the maximum count of each n-gram in any reference, and the
+  brevity penalty uses the reference length closest to the length of each output sentence.
   """
+  multi_reference = True
+
   def __init__(self, weights=(0.25, 0.25, 0.25, 0.25), case_insensitive=False):
     self.weights = weights
     self.case_insensitive = case_insensitive
@@ -128,55 +401,58 @@ class BleuScorer(Scorer):
     raise NotImplementedError("Sentence-level calculation is not implemented in BleuScorer as it is usually 0."
                               "Consider using SentenceBleuScorer (string sentbleu) instead.")
 
-  def _precision(self, ref, out, n):
-    """
-    Caculate n-gram precision 
-
-    Args:
-      ref: A reference sentence
-      out: An output sentence
-
-    Returns:
-      Numerator and denominator of the precision
-    """
-    out_ngram = ngram_utils.sent_ngrams_list(out, n)
-    ref_ngram = ngram_utils.sent_ngrams_list(ref, n)
-    out_cnt = Counter(out_ngram)
-    ref_cnt = Counter(ref_ngram)
-
-    num = 0
-    denom = 0
-    for ngram, o_cnt in out_cnt.items():
-      num += min(o_cnt, ref_cnt[ngram])
-      denom += o_cnt
-    denom = max(1, denom)
-
-    return num, denom
-  
   def cache_stats(self, ref, out):
     """
     Cache sufficient statistics for caculating BLEU score
 
     Args:
-      ref: A reference corpus
+      ref: A reference corpus, or a MultiReference with several references
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      SufficientStats with an integer array of one row per sentence and 2*order+2 columns: the reference length (of the closest
+      reference if there are several), the output length, and then the numerator and denominator of the precision
+      of each n-gram order
     """
     if self.case_insensitive:
       ref = corpus_utils.lower(ref)
       out = corpus_utils.lower(out)
 
-    cached_stats = []
+    # The n-gram statistics are shared with the other scorers working on the same corpora
+    order = len(self.weights)
+    ngram_stats = ngram_utils.ngram_match_stats(ref, out, order)[:, :order]
+
+    cached_stats = np.empty((len(ngram_stats), 2 * order + 2), dtype=np.int64)
+    # The lengths for the brevity penalty come from the lengths shared with the other scorers and bucketers
+    if isinstance(ref, corpus_utils.MultiReference):
+      cached_stats[:, 0] = corpus_utils.closest_refs(ref, out)[1]
+    else:
+      cached_stats[:, 0] = corpus_utils.sent_lengths(ref)
+    cached_stats[:, 1] = corpus_utils.sent_lengths(out)
+    cached_stats[:, 2::2] = ngram_stats[:, :, 0]
+    cached_stats[:, 3::2] = np.maximum(ngram_stats[:, :, 1], 1)
+    return SufficientStats(cached_stats)
 
-    for r, o in zip(ref, out):
-      prec = []
-      for n in range(1, len(self.weights) + 1):
-        prec.append(self._precision(r, o, n))
-      cached_stats.append( (len(r), len(o), prec) )
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache sufficient statistics for several systems. Corpora that do not share a vocabulary are first converted into
+    Corpus objects that do, and the n-grams of each reference sentence are counted only once for all the systems.
 
-    return cached_stats
+    Args:
+      ref: A reference corpus, or a MultiReference with several references
+      outs: A list of output corpora
+
+    Returns:
+      A list with the SufficientStats of each system
+    """
+    if len(outs) > 1:
+      ref, *outs = corpus_utils.shared_corpora(ref, *outs)
+      if self.case_insensitive:
+        ngram_utils.system_ngram_match_stats(corpus_utils.lower(ref), [corpus_utils.lower(x) for x in outs],
+                                             len(self.weights))
+      else:
+        ngram_utils.system_ngram_match_stats(ref, outs, len(self.weights))
+    return [self.cache_stats(ref, out) for out in outs]
 
   def score_cached_corpus(self, sent_ids, cached_stats):
     """
@@ -184,35 +460,68 @@ class BleuScorer(Scorer):
 
     Args:
       sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
+      cached_stats: The cached statistics
 
     Returns:
       A tuple containing a single value for the BLEU score and a string summarizing auxiliary information
     """
     if len(cached_stats) == 0:
       return 0.0, None
+    return self._score_totals(SufficientStats.of(cached_stats).sum(sent_ids))
 
-    cached_ref_len, cached_out_len, cached_prec = zip(*cached_stats)
+  def sum_stats(self, cached_stats):
+    if len(cached_stats) == 0:
+      return np.zeros(2 * len(self.weights) + 2, dtype=np.int64)
+    return SufficientStats.of(cached_stats).sum()
 
-    num_prec = Counter()
-    denom_prec = Counter()
-  
-    ref_len = 0
-    out_len = 0
-    for sent_id in sent_ids:
-      ref_len += cached_ref_len[sent_id]
-      out_len += cached_out_len[sent_id]
-      for n in range(1, len(self.weights) + 1):
-        num, denom = cached_prec[sent_id][n-1]
-        num_prec[n] += num
-        denom_prec[n] += denom
-
-    if num_prec[1] == 0:
+  def score_summed_stats(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return 0.0, None
+    return self._score_totals(summed_stats)
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts)
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    """
+    Calculate the BLEU scores of many corpora at once, as in `_score_totals`
+
+    Args:
+      summed_stats: A matrix with the column sums of the statistics of each corpus
+      num_sents: The number of sentences in each corpus
+
+    Returns:
+      A numpy array with the BLEU score of each corpus
+    """
+    if num_sents == 0:
+      return np.zeros(len(summed_stats))
+    ref_lens, out_lens = summed_stats[:, 0], summed_stats[:, 1]
+    nums, denoms = summed_stats[:, 2::2], summed_stats[:, 3::2]
+    prec = np.divide(nums, denoms, out=np.zeros(nums.shape), where=denoms != 0)
+    log_prec = np.log(prec, out=np.zeros(prec.shape), where=prec > 0) @ np.asarray(self.weights, dtype=float)
+    len_ratio = np.divide(ref_lens, out_lens, out=np.zeros(len(ref_lens)), where=out_lens != 0)
+    bp = np.where(out_lens != 0, np.minimum(1, np.exp(1 - len_ratio)), 0)
+    return np.where(nums[:, 0] == 0, 0.0, self.scale * bp * np.exp(log_prec))
+
+  def _score_totals(self, totals):
+    """
+    Calculate BLEU score from statistics summed over a corpus
+
+    Args:
+      totals: The column sums of the statistics returned by cache_stats
+
+    Returns:
+      A tuple containing a single value for the BLEU score and None
+    """
+    ref_len, out_len = int(totals[0]), int(totals[1])
+    num_prec, denom_prec = totals[2::2].tolist(), totals[3::2].tolist()
+
+    if num_prec[0] == 0:
       return 0, None
 
     prec = 0
-    for i, w in enumerate(self.weights, start=1):
-      p = num_prec[i] / denom_prec[i] if denom_prec[i] != 0 else 0
+    for w, num, denom in zip(self.weights, num_prec, denom_prec):
+      p = num / denom if denom != 0 else 0
       p = math.log(p) if p > 0 else 0
       prec += p * w 
     
@@ -229,15 +538,28 @@ class BleuScorer(Scorer):
 class SentBleuScorer(SentenceFactoredScorer):
   """
   A scorer that calculates sentence-level smoothed BLEU score.
+
+  The n-gram precisions are smoothed by adding one to their numerator and denominator (Lin and Och, 2004). By default
+  unigram precisions are not smoothed, as in method 2 of NLTK's SmoothingFunction, and the scores are the same as
+  those of NLTK's sentence_bleu.
   """
-  def __init__(self, case_insensitive=False):
+  def __init__(self, weights=(0.25, 0.25, 0.25, 0.25), case_insensitive=False, smooth_unigrams=False):
+    """
+    Args:
+      weights: The weights of the n-gram precisions
+      case_insensitive: A boolean specifying whether to turn on the case insensitive option
+      smooth_unigrams: A boolean specifying whether to also smooth the unigram precisions, as in the original method
+                       of Lin and Och (2004) and older versions of NLTK
+    """
+    self.weights = weights
     self.case_insensitive = case_insensitive
+    self.smooth_unigrams = smooth_unigrams
 
   @property
   def scale(self):
     return global_scorer_scale
 
-  def score_sentence(self, ref, out):
+  def _score_sentence(self, ref, out):
     """
     Score a single sentence with sentence-level smoothed BLEU score
 
@@ -248,18 +570,71 @@ class SentBleuScorer(SentenceFactoredScorer):
     Returns:
       The sentence-level BLEU score, and None
     """
-    chencherry = nltk.translate.bleu_score.SmoothingFunction()
-    if self.case_insensitive:
-      bleu_score = nltk.translate.bleu_score.sentence_bleu([corpus_utils.lower(ref)], corpus_utils.lower(out), smoothing_function=chencherry.method2)
-    else:  
-      bleu_score = nltk.translate.bleu_score.sentence_bleu([ref], out, smoothing_function=chencherry.method2)
-    return self.scale * bleu_score, None
+    return float(self._score_stats(BleuScorer(self.weights).cache_stats([ref], [out]))[0]), None
+
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus, smoothing the n-gram statistics of all the sentences at once
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the sentence-level BLEU score and None for each sentence
+    """
+    cached_stats = BleuScorer(self.weights).cache_stats(*self._normalize(ref, out))
+    return [(score, None) for score in self._score_stats(cached_stats).tolist()]
+
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache the score of each sentence for several systems, counting the n-grams of the reference only once as in
+    `BleuScorer.cache_system_stats`
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with the SufficientStats of each system
+    """
+    if len(outs) > 1:
+      ref, *outs = corpus_utils.shared_corpora(ref, *outs)
+      norm_ref, *norm_outs = self._normalize(ref, *outs)
+      ngram_utils.system_ngram_match_stats(norm_ref, norm_outs, len(self.weights))
+    return [self.cache_stats(ref, out) for out in outs]
+
+  def _score_stats(self, stats):
+    """
+    Calculate smoothed sentence-level BLEU scores. Each score is calculated with the same floating-point operations
+    as NLTK's sentence_bleu, so that the scores (and the buckets of sentences near bucket boundaries) are the same.
+
+    Args:
+      stats: The statistics of each sentence, as returned by BleuScorer.cache_stats
+
+    Returns:
+      A numpy array with the score of each sentence
+    """
+    weights = [float(w) for w in self.weights]
+    smoothing = [1 if n > 0 or self.smooth_unigrams else 0 for n in range(len(weights))]
+    scores = []
+    for ref_len, out_len, *counts in np.asarray(stats).tolist():
+      nums, denoms = counts[0::2], counts[1::2]
+      # Sentences without any matching word have a score of 0, as well as empty outputs
+      if nums[0] == 0 or out_len == 0:
+        scores.append(0.0)
+        continue
+      log_prec = math.fsum(w * math.log((num + s) / (denom + s))
+                           for w, num, denom, s in zip(weights, nums, denoms, smoothing) if num + s > 0)
+      bp = 1 if out_len > ref_len else math.exp(1 - ref_len / out_len)
+      scores.append(self.scale * (bp * math.exp(log_prec)))
+    return np.array(scores)
 
   def name(self):
     return "sentence-level BLEU"
 
   def idstr(self):
-    return "sentbleu"
+    return "sentbleu_smooth_unigrams" if self.smooth_unigrams else "sentbleu"
 
 class LengthScorer(Scorer):
   """
@@ -276,8 +651,54 @@ class LengthScorer(Scorer):
     Returns:
       A tuple containing a single value for the length ratio and a string summarizing auxiliary information
     """
-    ref_words = sum([len(x) for x in ref])
-    out_words = sum([len(x) for x in out])
+    ref_words = int(corpus_utils.sent_lengths(ref).sum())
+    out_words = int(corpus_utils.sent_lengths(out).sum())
+    return self._score_lengths(ref_words, out_words)
+
+  def cache_stats(self, ref, out):
+    """
+    Cache sufficient statistics for caculating the length ratio
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      SufficientStats with the reference and output length of each sentence
+    """
+    return SufficientStats(np.stack([corpus_utils.sent_lengths(ref), corpus_utils.sent_lengths(out)], axis=1))
+
+  def score_cached_corpus(self, sent_ids, cached_stats):
+    """
+    Calculate the length ratio with cache
+
+    Args:
+      sent_ids: The sentence ids for reference and output corpora
+      cached_stats: The cached statistics
+
+    Returns:
+      A tuple containing a single value for the length ratio and a string summarizing auxiliary information
+    """
+    if len(cached_stats) == 0:
+      return self._score_lengths(0, 0)
+    return self.score_summed_stats(SufficientStats.of(cached_stats).sum(sent_ids), len(sent_ids))
+
+  def sum_stats(self, cached_stats):
+    if len(cached_stats) == 0:
+      return np.zeros(2, dtype=np.int64)
+    return SufficientStats.of(cached_stats).sum()
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    return self._score_lengths(int(summed_stats[0]), int(summed_stats[1]))
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts)
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    ref_words, out_words = summed_stats[:, 0], summed_stats[:, 1]
+    return self.scale * np.divide(out_words, ref_words, out=np.zeros(len(ref_words)), where=ref_words != 0)
+
+  def _score_lengths(self, ref_words, out_words):
     if ref_words == 0:
       return 0.0, f'ref={ref_words}, out={out_words}'
     return self.scale * out_words / ref_words, f'ref={ref_words}, out={out_words}'
@@ -327,17 +748,12 @@ class RibesScorer(SentenceFactoredScorer):
     Returns:
       The Kendall's tau distance
     """
-    dis = 0
     n = len(alignment)
     if n <= 1:
       return 0
-    for i in range(n):
-      for j in range(i+1, n):
-        if alignment[j] > alignment[i]:
-          dis += 1
-    return 2*dis/(n*n-n)  
+    return 2*align_utils.count_increasing_pairs(alignment)/(n*n-n)
 
-  def score_sentence(self, ref, out):
+  def _score_sentence(self, ref, out):
     """
     Score a single sentence with RIBES score
 
@@ -348,12 +764,64 @@ class RibesScorer(SentenceFactoredScorer):
     Returns:
       The RIBES score, and None
     """
-    alignment = align_utils.ngram_context_align(ref, out, order=self.order, case_insensitive=self.case_insensitive)
+    alignment = align_utils.ngram_context_align(ref, out, order=self.order)
     kt_dis = self._kendall_tau_distance(alignment) 
     prec = len(alignment)/ len(out) if len(out) != 0 else 0
     bp = min(1, math.exp(1-len(ref)/len(out))) if len(out) != 0 else 0
     return self.scale * kt_dis * (prec**self.alpha) * (bp**self.beta), None
 
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus with RIBES, counting the ordered pairs of all the alignments at once
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the RIBES score and None for each sentence
+    """
+    return [(score, None) for score in self._score_systems(ref, [out])[0].tolist()]
+
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache the RIBES score of each sentence for several systems, finding the positions of the reference words only
+    once for all the systems
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with the SufficientStats of each system
+    """
+    chunks = parallel_utils.map_chunks(lambda r, *os: self._score_systems(r, os), ref, *outs)
+    return [SufficientStats(np.concatenate(x)) for x in zip(*chunks)]
+
+  def _score_systems(self, ref, outs):
+    ref, *outs = self._normalize(ref, *outs)
+    ref_lens = corpus_utils.sent_lengths(ref).astype(float)
+    out_lens = [corpus_utils.sent_lengths(out).astype(float) for out in outs]
+    ref, *outs = corpus_utils.as_id_sents(ref, *outs)
+    ref = list(ref)
+    ref_word_pos = [align_utils.word_positions(r) for r in ref]
+    scores = []
+    for out, lens in zip(outs, out_lens):
+      alignments = [align_utils.ngram_context_align(r, o, order=self.order, ref_word_pos=p)
+                    for r, o, p in zip(ref, out, ref_word_pos)]
+      scores.append(self._score_alignments(ref_lens, lens, alignments))
+    return scores
+
+  def _score_alignments(self, ref_lens, out_lens, alignments):
+    pairs = align_utils.count_increasing_pairs_batch(alignments)
+    align_lens = np.array([len(x) for x in alignments], dtype=float)
+    num_pairs = align_lens*align_lens - align_lens
+    kt_dis = np.divide(2*pairs, num_pairs, out=np.zeros(len(pairs)), where=num_pairs != 0)
+    prec = np.divide(align_lens, out_lens, out=np.zeros(len(pairs)), where=out_lens != 0)
+    len_ratio = np.divide(ref_lens, out_lens, out=np.zeros(len(pairs)), where=out_lens != 0)
+    bp = np.where(out_lens != 0, np.minimum(1, np.exp(1-len_ratio)), 0)
+    return self.scale * kt_dis * (prec**self.alpha) * (bp**self.beta)
+
   def name(self):
     return "RIBES"
 
@@ -363,11 +831,25 @@ class RibesScorer(SentenceFactoredScorer):
 
 class DetokBleuScorer(Scorer):
   """
-  A scorer that computes BLEU on detokenized text.
+  A scorer that computes BLEU on detokenized text, with one or several references.
 
+  Sentence statistics are extracted and scored with methods of sacreBLEU's BLEU metric that are not part of its
+  public API. With a version of sacreBLEU that lacks them, statistics are not cached and corpora are scored with the
+  public `corpus_score` instead.
   """
+  multi_reference = True
+
+  # The methods of sacrebleu.metrics.BLEU used to extract and score sentence statistics
+  _SEGMENT_METHODS = ('_extract_corpus_statistics', '_compute_score_from_stats')
+
   def __init__(self, case_insensitive=False):
     self.case_insensitive = case_insensitive
+    self._bleu = self._create_bleu()
+    self._segment_stats = all(hasattr(self._bleu, x) for x in self._SEGMENT_METHODS)
+
+  def _create_bleu(self, references=None):
+    # The same settings as sacrebleu.corpus_bleu
+    return sacrebleu.metrics.BLEU(tokenize='13a', references=references)
 
   @property
   def scale(self):
@@ -378,15 +860,95 @@ class DetokBleuScorer(Scorer):
                               "Consider using SentenceBleuScorer (string sentbleu) instead.")
 
   def score_corpus(self, ref, out):
+    """
+    Score a corpus using BLEU on detokenized text, as calculated by sacreBLEU
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A tuple containing a single value for the BLEU score and None
+    """
+    if not self._segment_stats:
+      if self.case_insensitive:
+        ref = corpus_utils.lower(ref)
+        out = corpus_utils.lower(out)
+      refs = ref.refs if isinstance(ref, corpus_utils.MultiReference) else [ref]
+      return self._bleu.corpus_score([" ".join(x) for x in out], [[" ".join(x) for x in r] for r in refs]).score, None
+    cached_stats = self.cache_stats(ref, out)
+    return self.score_cached_corpus(range(len(cached_stats)), cached_stats)
+
+  def cache_stats(self, ref, out):
+    """
+    Cache sufficient statistics for calculating BLEU on detokenized text. The sentences are tokenized by sacreBLEU
+    only once, here.
+
+    Args:
+      ref: A reference corpus, or a MultiReference with several references
+      out: An output corpus
+
+    Returns:
+      SufficientStats with sacreBLEU's statistics for each sentence: the output length, the reference length, and
+      the n-gram matches and totals of each order, or None if sacreBLEU cannot calculate sentence statistics
+    """
+    return self.cache_system_stats(ref, [out])[0]
+
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache sufficient statistics for several systems. The references are tokenized and their n-grams counted by
+    sacreBLEU only once for all the systems.
 
+    Args:
+      ref: A reference corpus, or a MultiReference with several references
+      outs: A list of output corpora
+
+    Returns:
+      A list with the SufficientStats of each system, or with None for each system if sacreBLEU cannot calculate
+      sentence statistics
+    """
+    if not self._segment_stats:
+      return [None] * len(outs)
     if self.case_insensitive:
       ref = corpus_utils.lower(ref)
-      out = corpus_utils.lower(out)
+      outs = [corpus_utils.lower(out) for out in outs]
+
+    num_cols = 2 + 2*self._bleu.max_ngram_order
+    if len(ref) == 0:
+      return [SufficientStats(np.zeros((0, num_cols), dtype=np.int64)) for _ in outs]
+    refs = ref.refs if isinstance(ref, corpus_utils.MultiReference) else [ref]
+    # The references are tokenized when they are given to the metric, and then cached by it for all the outputs
+    bleu = self._create_bleu([[" ".join(x) for x in r] for r in refs])
+    stats = []
+    for out in outs:
+      # sacreBLEU also warns about outputs that look tokenized, as corpus_score does
+      out_stats = bleu._extract_corpus_statistics([" ".join(o) for o in out], None)
+      stats.append(SufficientStats(np.array(out_stats, dtype=np.int64).reshape(-1, num_cols)))
+    return stats
+
+  def score_cached_corpus(self, sent_ids, cached_stats):
+    """
+    Score a corpus with cache
+
+    Args:
+      sent_ids: The sentence ids for reference and output corpora
+      cached_stats: The cached statistics
 
-    bleu_object = sacrebleu.corpus_bleu([" ".join(x) for x in out],
-                                        [[" ".join(x) for x in ref]])
+    Returns:
+      A tuple containing a single value for the score and None
+    """
+    return self.score_summed_stats(SufficientStats.of(cached_stats).sum(sent_ids), len(sent_ids))
+
+  def sum_stats(self, cached_stats):
+    if len(cached_stats) == 0:
+      return np.zeros(2 + 2*self._bleu.max_ngram_order, dtype=np.int64)
+    return SufficientStats.of(cached_stats).sum()
 
-    return bleu_object.score, None
+  def score_summed_stats(self, summed_stats, num_sents):
+    return self._bleu._compute_score_from_stats(summed_stats.tolist()).score, None
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts).astype(np.int64)
 
   def name(self):
     return "DetokBLEU"
@@ -403,19 +965,70 @@ class ChrFScorer(Scorer):
   """
   def __init__(self, case_insensitive=False):
     self.case_insensitive = case_insensitive
+    self.max_len = 6  # Order 6 n-grams
+    self.beta = 2.0  # F2 score
 
   @property
   def scale(self):
     return global_scorer_scale
 
   def chrf_score(self, refs, out):
-    return self.scale * nltk.translate.chrf_score.corpus_chrf(
-      [[" ".join(x) for x in ref] for ref in refs],
-      [" ".join(x) for x in out],
-      max_len=6,  # Order 6 n-grams
-      beta=2.0,  # F2 score
-      ignore_whitespace=True  # No whitespaces
-    )
+    stats = np.array([self._sent_stats(r[0], o) for r, o in zip(refs, out)], dtype=np.int64)
+    return self.score_cached_corpus(range(len(stats)), stats)[0]
+
+  def _sent_stats(self, ref, out):
+    """
+    Count the character n-grams of a sentence, ignoring whitespace
+
+    Args:
+      ref: A reference sentence
+      out: An output sentence
+
+    Returns:
+      A list with the number of matching, output and reference n-grams for each order
+    """
+    return self._match_stats(self._char_ngram_counts(ref), self._char_ngram_counts(out))
+
+  def _char_ngram_counts(self, sent):
+    """
+    Count the character n-grams of each order in a sentence, ignoring whitespace
+
+    Args:
+      sent: A sentence
+
+    Returns:
+      The number of characters, and a list with a Counter of the n-grams of each order
+    """
+    chars = re.sub(r"\s+", "", " ".join(sent))
+    return len(chars), [Counter(chars[i:i+n] for i in range(len(chars)-n+1)) for n in range(1, self.max_len+1)]
+
+  def _match_stats(self, ref_counts, out_counts):
+    ref_len, ref_ngrams = ref_counts
+    out_len, out_ngrams = out_counts
+    stats = []
+    for n, ref_cnt, out_cnt in zip(range(1, self.max_len+1), ref_ngrams, out_ngrams):
+      matches = sum(min(count, ref_cnt[gram]) for gram, count in out_cnt.items() if gram in ref_cnt)
+      stats.extend((matches, max(out_len-n+1, 0), max(ref_len-n+1, 0)))
+    return stats
+
+  def _sent_fscores(self, stats):
+    """
+    Calculate the F-score of each sentence and n-gram order. As in NLTK, it is a small epsilon when it is not defined.
+
+    Args:
+      stats: A matrix of cached statistics
+
+    Returns:
+      A matrix with the F-score for each sentence and n-gram order
+    """
+    matches, out_counts, ref_counts = [stats[:,i::3].astype(float) for i in range(3)]
+    factor = self.beta**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+      prec = matches / out_counts
+      rec = matches / ref_counts
+      denom = factor * prec + rec
+      fscores = (1 + factor) * (prec * rec) / denom
+    return np.where((out_counts == 0) | (ref_counts == 0) | (denom == 0), 1e-16, fscores)
 
   def score_corpus(self, ref, out):
     """
@@ -428,14 +1041,106 @@ class ChrFScorer(Scorer):
     Returns:
       A tuple containing a single value for the ChrF score and a string summarizing auxiliary information
     """
-    if self.case_insensitive:
-      chrf = self.chrf_score([[corpus_utils.lower(x)] for x in ref], corpus_utils.lower(out))
-    else:
-      chrf = self.chrf_score([[x] for x in ref], out)
-    return chrf, None
+    cached_stats = self.cache_stats(ref, out)
+    return self.score_cached_corpus(range(len(cached_stats)), cached_stats)
 
   def score_sentence(self, ref, out):
-    return self.chrf_score([ref], [out]), None
+    return self.score_corpus([ref], [out])
+
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the ChrF score and None for each sentence
+    """
+    scores = self.scale * self.cache_stats(ref, out).rows(self._sent_fscores).mean(axis=1)
+    return [(score, None) for score in scores.tolist()]
+
+  def cache_stats(self, ref, out):
+    """
+    Cache sufficient statistics for calculating ChrF
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      SufficientStats with the number of matching, output and reference character n-grams of each order for each
+      sentence
+    """
+    return self.cache_system_stats(ref, [out])[0]
+
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache sufficient statistics for calculating ChrF for several systems, counting the character n-grams of the
+    reference only once for all the systems
+
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
+
+    Returns:
+      A list with the SufficientStats of each system
+    """
+    if self.case_insensitive:
+      ref = corpus_utils.lower(ref)
+      outs = [corpus_utils.lower(out) for out in outs]
+    ref_counts = [self._char_ngram_counts(r) for r in ref]
+    stats = []
+    for out in outs:
+      out_stats = [self._match_stats(r, self._char_ngram_counts(o)) for r, o in zip(ref_counts, out)]
+      stats.append(SufficientStats(np.array(out_stats, dtype=np.int64).reshape(-1, 3*self.max_len)))
+    return stats
+
+  def score_cached_corpus(self, sent_ids, cached_stats):
+    """
+    Score a corpus with cache. The corpus score is the average of the sentence F-scores over sentences and n-gram
+    orders.
+
+    Args:
+      sent_ids: The sentence ids for reference and output corpora
+      cached_stats: The cached statistics
+
+    Returns:
+      A tuple containing a single value for the score and a string summarizing auxiliary information
+    """
+    if len(cached_stats) == 0:
+      return 0.0, None
+    # The sentence F-scores are calculated only once for all the subsets of the same statistics
+    summed_stats = SufficientStats.of(cached_stats).sum(sent_ids, derive=self._sent_fscores)
+    return self.score_summed_stats(summed_stats, len(sent_ids))
+
+  def sum_stats(self, cached_stats):
+    """
+    Sum the F-scores of each n-gram order over sentences, as the corpus score is their average
+
+    Args:
+      cached_stats: The cached statistics
+
+    Returns:
+      A numpy array with the sum of the F-scores of each n-gram order
+    """
+    if len(cached_stats) == 0:
+      return np.zeros(self.max_len)
+    return SufficientStats.of(cached_stats).sum(derive=self._sent_fscores)
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return 0.0, None
+    return self.scale * summed_stats.sum() / self.max_len / num_sents, None
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts, derive=self._sent_fscores)
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return np.zeros(len(summed_stats))
+    return self.scale * summed_stats.sum(axis=1) / self.max_len / num_sents
 
   def name(self):
     return "ChrF"
@@ -450,21 +1155,28 @@ class RougeScorer(SentenceFactoredScorer):
   def __init__(self, rouge_type, score_type='fmeasure', use_stemmer=False, case_insensitive=False):
     self.rouge_type = rouge_type
     self.score_type = score_type
+    self.use_stemmer = use_stemmer
     self._stemmer = nltk.stem.porter.PorterStemmer() if use_stemmer else None
     self.case_insensitive = case_insensitive
+    # Stems of the words seen so far, as each word type only needs to be stemmed once
+    self._stems = {}
 
   @property
   def scale(self):
     return global_scorer_scale
   
-  def score_sentence(self, ref, out):
-    if self.case_insensitive:
-      ref = corpus_utils.lower(ref)
-      out = corpus_utils.lower(out)
-
+  def _stem(self, sent):
+    stems = []
+    for x in sent:
+      if x not in self._stems:
+        self._stems[x] = self._stemmer.stem(x) if len(x) > 3 else x
+      stems.append(self._stems[x])
+    return stems
+
+  def _score_sentence(self, ref, out):
     if self._stemmer:
-      ref = [self._stemmer.stem(x) if len(x) > 3 else x for x in ref]
-      out = [self._stemmer.stem(x) if len(x) > 3 else x for x in out]
+      ref = self._stem(ref)
+      out = self._stem(out)
     
     if self.rouge_type == 'rougeL':
       scores = rouge_scorer._score_lcs(ref, out)
@@ -472,8 +1184,8 @@ class RougeScorer(SentenceFactoredScorer):
       n = int(self.rouge_type[5:])
       if n <= 0:
         raise ValueError(f"rougen requires positive n: {self.rouge_type}")
-      ref_ngrams = rouge_scorer._create_ngrams(ref, n)
-      out_ngrams = rouge_scorer._create_ngrams(out, n)
+      ref_ngrams = ngram_utils.sent_ngram_counts(ref, n)[n-1]
+      out_ngrams = ngram_utils.sent_ngram_counts(out, n)[n-1]
       scores = rouge_scorer._score_ngrams(ref_ngrams, out_ngrams)
     else:
       raise ValueError(f"Invalid rouge type: {self.rouge_type}")
@@ -490,6 +1202,50 @@ class RougeScorer(SentenceFactoredScorer):
 
     return self.scale * score_value, None
 
+  def score_sentences(self, ref, out):
+    """
+    Score every sentence of a corpus. For ROUGE-L, the LCS lengths are calculated over word IDs when possible. For
+    ROUGE-N, the n-gram matches are read from the n-gram statistics shared with the other scorers. The scores of all
+    the sentences are then calculated together.
+
+    Args:
+      ref: A reference corpus
+      out: An output corpus
+
+    Returns:
+      A list with the score and None for each sentence
+    """
+    ref, out = self._normalize(ref, out)
+    if self.rouge_type != 'rougeL':
+      if not re.match(r"rouge[0-9]$", self.rouge_type):
+        raise ValueError(f"Invalid rouge type: {self.rouge_type}")
+      n = int(self.rouge_type[5:])
+      if n <= 0:
+        raise ValueError(f"rougen requires positive n: {self.rouge_type}")
+    if self.score_type not in ('fmeasure', 'precision', 'recall'):
+      raise ValueError(f"Invalid score type: {self.score_type}")
+
+    if self._stemmer:
+      ref = [self._stem(r) for r in ref]
+      out = [self._stem(o) for o in out]
+    if self.rouge_type == 'rougeL':
+      if not self._stemmer:
+        ref, out = [list(x) for x in corpus_utils.as_id_sents(ref, out)]
+      lcs_lens = np.array([rouge_scorer._lcs_length(r, o) for r, o in zip(ref, out)], dtype=float)
+      ref_lens = corpus_utils.sent_lengths(ref).astype(float)
+      out_lens = corpus_utils.sent_lengths(out).astype(float)
+      valid = (ref_lens != 0) & (out_lens != 0)
+      precision = np.divide(lcs_lens, out_lens, out=np.zeros(len(lcs_lens)), where=valid)
+      recall = np.divide(lcs_lens, ref_lens, out=np.zeros(len(lcs_lens)), where=valid)
+    else:
+      matches, out_counts, ref_counts = ngram_utils.ngram_match_stats(ref, out, n)[:, n-1].T.astype(float)
+      precision = matches / np.maximum(out_counts, 1)
+      recall = matches / np.maximum(ref_counts, 1)
+    fmeasure = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(precision)),
+                         where=precision + recall > 0)
+    scores = {'fmeasure': fmeasure, 'precision': precision, 'recall': recall}[self.score_type]
+    return [(score, None) for score in (self.scale * scores).tolist()]
+
   def name(self):
     return self.rouge_type
 
@@ -501,9 +1257,9 @@ class WERScorer(Scorer):
   A scorer that calculates Word Error Rate (WER).
   """
   def __init__(self, sub_pen=1.0, ins_pen=1.0, del_pen=1.0, case_insensitive=False):
-    self.sub_pen = 1.0
-    self.ins_pen = 1.0
-    self.del_pen = 1.0
+    self.sub_pen = sub_pen
+    self.ins_pen = ins_pen
+    self.del_pen = del_pen
     self.case_insensitive = case_insensitive
 
   @property
@@ -522,7 +1278,7 @@ class WERScorer(Scorer):
       A tuple containing a single value for the WER and None
     """
     cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(np.arange(len(ref)), cached_stats)
+    return self.score_cached_corpus(range(len(ref)), cached_stats)
 
   def score_sentence(self, ref, out):
     return self.score_corpus([ref], [out])
@@ -536,14 +1292,18 @@ class WERScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      SufficientStats with the reference length and the edit distance of each sentence
     """
-    cached_stats = []
+    if self.case_insensitive:
+      ref = corpus_utils.lower(ref)
+      out = corpus_utils.lower(out)
 
-    for r, o in zip(ref, out):
-      cached_stats.append( (len(r), self._edit_distance(r, o)) )
+    return SufficientStats(np.concatenate(parallel_utils.map_chunks(self._cache_stats, ref, out)))
 
-    return cached_stats
+  def _cache_stats(self, ref, out):
+    ref_lens = corpus_utils.sent_lengths(ref).astype(float)
+    distances = edit_utils.edit_distances(ref, out, self.sub_pen, self.ins_pen, self.del_pen)
+    return np.stack([ref_lens, distances], axis=1)
 
   def score_cached_corpus(self, sent_ids, cached_stats):
     """
@@ -551,7 +1311,7 @@ class WERScorer(Scorer):
 
     Args:
       sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
+      cached_stats: The cached statistics, with the reference length and the edit distance of each sentence
 
     Returns:
       A tuple containing a single value for the score and a string summarizing auxiliary information
@@ -559,38 +1319,24 @@ class WERScorer(Scorer):
     if len(cached_stats) == 0:
       return 0.0, None
 
-    cached_ref_len, cached_edit_distance = zip(*cached_stats)
-    cached_ref_len, cached_edit_distance = np.array(cached_ref_len), np.array(cached_edit_distance)
-    denom = np.sum(cached_ref_len[sent_ids])
-    wer = np.sum(cached_edit_distance[sent_ids])/denom if denom != 0 else 0
+    return self.score_summed_stats(SufficientStats.of(cached_stats).sum(sent_ids), len(sent_ids))
+
+  def sum_stats(self, cached_stats):
+    if len(cached_stats) == 0:
+      return np.zeros(2)
+    return SufficientStats.of(cached_stats).sum()
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    denom, distance = summed_stats
+    wer = distance/denom if denom != 0 else 0
     return self.scale * wer, None
 
-  def _edit_distance(self, ref, out):
-    if self.case_insensitive:
-      ref = corpus_utils.lower(ref)
-      out = corpus_utils.lower(out)
-  
-    sp1 = len(ref)+1
-    tp1 = len(out)+1
-    scores = np.zeros((sp1, tp1))
-    equals = (np.expand_dims(np.array(ref), axis=1) == np.array(out))
-    scores[:,0] = range(sp1)
-    scores[0,:] = range(tp1)
-
-    # Forward edit distance
-    for i in range(0, len(ref)):
-      for j in range(0, len(out)):
-        my_action = 0 if equals[i,j] else 1
-        my_score = scores[i,j] + my_action * self.sub_pen
-        del_score = scores[i,j+1] + self.del_pen 
-        if del_score < my_score:
-          my_score = del_score
-        ins_score = scores[i+1,j] + self.ins_pen 
-        if ins_score < my_score:
-          my_score = ins_score
-        scores[i+1,j+1] = my_score
-
-    return scores[-1,-1]
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts)
+
+  def score_summed_stats_batch(self, summed_stats, num_sents):
+    denoms, distances = summed_stats[:, 0], summed_stats[:, 1]
+    return self.scale * np.divide(distances, denoms, out=np.zeros(len(denoms)), where=denoms != 0)
 
   def name(self):
     return "Word Error Rate"
@@ -601,11 +1347,25 @@ class WERScorer(Scorer):
 class METEORScorer(Scorer):
   """
   A scorer that calculates METEOR score.
+
+  Sentences are scored by long-lived METEOR processes (see `meteor_utils`) that are shared by all the METEOR
+  scorers with the same settings, so that Java is started only once per run and not for every call.
   """
-  def __init__(self, meteor_directory, options=None):
+  def __init__(self, meteor_directory, options=None, num_workers=1, command=None):
+    """
+    Args:
+      meteor_directory: The directory of the METEOR code, containing meteor-*.jar
+      options: A string with additional command line options for METEOR
+      num_workers: The number of METEOR processes that may score different systems at the same time
+      command: The command that starts a METEOR process reading from standard input (by default, the jar in
+               `meteor_directory` in `-stdio` mode)
+    """
     self.meteor_directory = meteor_directory
     self.options = options
-    self.weights, self.parameters = self._get_weights_and_parameters(options)
+    if command is None:
+      command = meteor_utils.meteor_command(meteor_directory, options)
+    self.pool = meteor_utils.get_pool(command, num_workers=num_workers)
+    self.weights, self.parameters = meteor_utils.get_weights_and_parameters(meteor_directory, options)
 
   @property
   def scale(self):
@@ -623,7 +1383,7 @@ class METEORScorer(Scorer):
       A tuple containing a single value for the METEOR score and a string summarizing auxiliary information
     """
     cached_stats = self.cache_stats(ref, out)
-    return self.score_cached_corpus(np.arange(len(ref)), cached_stats)
+    return self.score_cached_corpus(range(len(ref)), cached_stats)
 
   def score_sentence(self, ref, out):
     return self.score_corpus([ref], [out])
@@ -637,30 +1397,22 @@ class METEORScorer(Scorer):
       out: An output corpus
 
     Returns:
-      A list of cached statistics
+      SufficientStats with the METEOR statistics of each sentence
     """
-    with tempfile.TemporaryDirectory() as directory:
-      ref_name = directory + '/ref'
-      out_name = directory + '/out'
-
-      corpus_utils.write_tokens(ref_name, ref)
-      corpus_utils.write_tokens(out_name, out)
-
-      cached_stats = []
-
-      command = f'java -Xmx2G -jar {self.meteor_directory}/meteor-*.jar {out_name} {ref_name} '
-      if self.options:
-        command += self.options
-      command += ' -ssOut'
+    return SufficientStats(self.pool.sentence_stats(ref, out))
 
-      p = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-      stats = p.communicate()[0].decode("utf-8").split('\n')[:-1]
+  def cache_system_stats(self, ref, outs):
+    """
+    Cache sufficient statistics for several systems, scoring them at the same time if there are several workers
 
-      for stat_str in stats:
-        stat = tuple(float(x) for x in stat_str.split())
-        cached_stats.append(stat)
+    Args:
+      ref: A reference corpus
+      outs: A list of output corpora
 
-    return cached_stats
+    Returns:
+      A list with the SufficientStats of each system
+    """
+    return [SufficientStats(x) for x in self.pool.map_sentence_stats(ref, outs)]
 
   def score_cached_corpus(self, sent_ids, cached_stats):
     """
@@ -668,7 +1420,7 @@ class METEORScorer(Scorer):
 
     Args:
       sent_ids: The sentence ids for reference and output corpora
-      cached_stats: A list of cached statistics
+      cached_stats: The cached statistics
 
     Returns:
       A tuple containing a single value for the METEOR score and a string summarizing auxiliary information
@@ -676,23 +1428,49 @@ class METEORScorer(Scorer):
     if len(cached_stats) == 0:
       return 0.0, None
 
-    cached_stats = np.array(cached_stats)
+    summed_stats = SufficientStats.of(cached_stats).sum(sent_ids, derive=self._corrected_stats)
+    return self.score_summed_stats(summed_stats, len(sent_ids))
+
+  def _corrected_stats(self, sent_stats):
+    """
+    Correct the number of chunks of the sentences that are matched entirely as a single chunk, which METEOR does not
+    count as fragmented, so that the statistics can be summed over sentences
+
+    Args:
+      sent_stats: A matrix with the METEOR statistics of each sentence
 
-    # compute sufficient statistics
-    sent_stats = cached_stats[sent_ids]
+    Returns:
+      A float matrix with the corrected statistics
+    """
+    sent_stats = np.array(sent_stats, dtype=float).reshape(len(sent_stats), -1)
 
     # num_total_chunks = sum(num_sent_chunks) - minus_chunk
-    minus_chunk = 0
-    for stat in sent_stats:
-      out_len = stat[0]
-      ref_len = stat[1]
-      out_total_match = stat[4] + stat[6] + stat[8] + stat[10] + stat[12] + stat[14] + stat[16] + stat[18]
-      ref_total_match = stat[5] + stat[7] + stat[9] + stat[11] + stat[13] + stat[15] + stat[17] + stat[19]
-      if out_len == out_total_match and ref_len == ref_total_match and stat[-3] == 1:
-        minus_chunk += 1
-
-    cal_stats = np.sum(sent_stats, 0)
-    cal_stats[20] -= minus_chunk
+    out_total_match = sent_stats[:, 4:20:2].sum(axis=1)
+    ref_total_match = sent_stats[:, 5:20:2].sum(axis=1)
+    minus_chunk = (sent_stats[:, 0] == out_total_match) & (sent_stats[:, 1] == ref_total_match) & \
+                  (sent_stats[:, -3] == 1)
+    sent_stats[:, 20] -= minus_chunk
+    return sent_stats
+
+  def sum_stats(self, cached_stats):
+    """
+    Sum the METEOR statistics over sentences, with the number of chunks corrected as in `_corrected_stats`
+
+    Args:
+      cached_stats: The cached statistics
+
+    Returns:
+      A numpy array with the summed statistics
+    """
+    return SufficientStats.of(cached_stats).sum(derive=self._corrected_stats)
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return SufficientStats.of(cached_stats).sum_samples(sample_counts, derive=self._corrected_stats)
+
+  def score_summed_stats(self, summed_stats, num_sents):
+    if num_sents == 0:
+      return 0.0, None
+    cal_stats = summed_stats
 
     # rename
     alpha, beta, gamma, delta = self.parameters
@@ -719,7 +1497,7 @@ class METEORScorer(Scorer):
     out_total_match = np.sum(out_content_match_stage) + np.sum(out_func_match_stage)
     ref_total_match = np.sum(ref_content_match_stage) + np.sum(ref_func_match_stage)
 
-    frag = float(chunks) / (float(out_word_match+ref_word_match)/2) 
+    frag = float(chunks) / (float(out_word_match+ref_word_match)/2) if out_word_match+ref_word_match != 0 else 0
     frag = 0 if out_total_match == out_len and ref_total_match == ref_len and chunks == 1 else frag
   
     frag_penalty = gamma * math.pow(frag, beta)
@@ -728,44 +1506,21 @@ class METEORScorer(Scorer):
 
     return self.scale * score, None
 
-  def _get_weights_and_parameters(self, options):
-    if self.options is None:
-      return (np.array([1.0, 0.6, 0.8, 0.6]), np.array([0.85, 0.2, 0.6, 0.75]))
-
-    weights, parameters = np.zeros(4), np.zeros(4)
-    # a simple and (maybe) slow way to obtain weights and parameters
-    with tempfile.TemporaryDirectory() as directory:
-      ref_name = directory + '/ref'
-      out_name = directory + '/out'
-
-      corpus_utils.write_tokens(ref_name, [["test"]])
-      corpus_utils.write_tokens(out_name, [["test"]])
-
-      command = f'java -Xmx2G -jar {self.meteor_directory}/meteor-*.jar {out_name} {ref_name} {options}'
-
-      p = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-      stats = p.communicate()[0].decode("utf-8").split()
-
-      weights_index = stats.index('Weights:') + 1
-      params_index = stats.index('Parameters:') + 1
-      for i in range(4):
-        weights[i] = float(stats[weights_index+i])
-        parameters[i] = float(stats[params_index+i])
-
-    return weights, parameters
-
   def name(self):
     return "METEOR"
 
   def idstr(self):
     return "meteor"
 
-def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory=None, options=None):
+def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory=None, options=None, meteor_workers=1):
   """
   Create a scorer from a profile string
   Args:
     profile: a profile string of "bleu" for BLEU or "length" for length ratio
     case_insensitive: A boolean specifying whether to turn on the case insensitive option
+    meteor_directory: The directory of the METEOR code, for "meteor"
+    options: Additional command line options for METEOR
+    meteor_workers: The number of METEOR processes that may run at the same time
 
   Returns:
     A scorer to perform the appropriate scoring
@@ -776,6 +1531,8 @@ def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory
     return DetokBleuScorer(case_insensitive=case_insensitive)
   elif profile == 'sentbleu':
     return SentBleuScorer(case_insensitive=case_insensitive)
+  elif profile == 'sentbleu_smooth_unigrams':
+    return SentBleuScorer(case_insensitive=case_insensitive, smooth_unigrams=True)
   elif profile == 'length':
     return LengthScorer()
   elif profile == 'ribes':
@@ -789,6 +1546,6 @@ def create_scorer_from_profile(profile, case_insensitive=False, meteor_directory
   elif profile == 'meteor':
     if meteor_directory == None:
       raise ValueError("Must specify the directory of the METEOR source code.")
-    return METEORScorer(meteor_directory=meteor_directory, options=options)
+    return METEORScorer(meteor_directory=meteor_directory, options=options, num_workers=meteor_workers)
   else:
     raise ValueError(f'Invalid profile for scorer {profile}'.format(profile=profile))
@@ -12,16 +12,84 @@
 
 import numpy as np
 from compare_mt import scorers
+from compare_mt import cache_utils
 import nltk
 
+# Maximum number of (sample, sentence) pairs in the matrix of sample counts built at once. Samples are drawn and
+# scored in batches of this size, so that memory stays bounded for large test sets.
+_MAX_BATCH_ELEMENTS = 1 << 24
+
+def draw_samples(num_sents, num_samples, sample_ratio=0.5, with_replacement=False):
+  """
+  Draw the sentence ids of many bootstrap samples at once
+
+  Args:
+    num_sents: The number of sentences in the corpus
+    num_samples: The number of samples
+    sample_ratio: The size of each sample relative to the corpus
+    with_replacement: Whether to draw sentences with replacement (as in the standard bootstrap, usually with a
+                      sample ratio of 1.0), or to take a random subset of the sentences
+
+  Returns:
+    An integer numpy array with the sentence ids of one sample in each row
+  """
+  size = int(num_sents * sample_ratio)
+  if with_replacement:
+    return np.random.randint(num_sents, size=(num_samples, size))
+  if size >= num_sents:
+    return np.tile(np.arange(num_sents), (num_samples, 1))
+  # The sentences with the smallest random keys form a uniformly random subset
+  return np.argpartition(np.random.random_sample((num_samples, num_sents)), size, axis=1)[:, :size]
+
+def sample_counts(sample_ids, num_sents):
+  """
+  Count how many times each sentence is drawn in each sample
+
+  Args:
+    sample_ids: The sentence ids of one sample in each row, as returned by draw_samples
+    num_sents: The number of sentences in the corpus
+
+  Returns:
+    A float numpy array with one row per sample and one column per sentence
+  """
+  num_samples = len(sample_ids)
+  flat_ids = (sample_ids + num_sents * np.arange(num_samples)[:, None]).ravel()
+  return np.bincount(flat_ids, minlength=num_samples * num_sents).reshape(num_samples, num_sents).astype(float)
+
+def _score_samples(ref, outs, scorer, cache_stats, sample_ids):
+  """
+  Score the samples of every system, with matrix operations over the cached statistics when the scorer can sum them
+
+  Returns:
+    A numpy array with one row per system and one column per sample
+  """
+  num_sents = len(ref) if cache_stats[0] is None else len(cache_stats[0])
+  if cache_stats[0] is not None:
+    counts = sample_counts(sample_ids, num_sents)
+    summed_stats = [scorer.sum_sampled_stats(cache_stat, counts) for cache_stat in cache_stats]
+    if all(x is not None for x in summed_stats):
+      return np.array([scorer.score_summed_stats_batch(x, sample_ids.shape[1]) for x in summed_stats])
+    return np.array([[scorer.score_cached_corpus(ids, cache_stat)[0] for ids in sample_ids]
+                     for cache_stat in cache_stats])
+  sys_scores = []
+  for ids in sample_ids:
+    reduced_ref = [ref[i] for i in ids]
+    reduced_outs = [[out[i] for i in ids] for out in outs]
+    sys_scores.append([scorer.score_corpus(reduced_ref, reduced_out)[0] for reduced_out in reduced_outs])
+  return np.array(sys_scores).reshape(len(sample_ids), len(outs)).T
+
 def eval_with_paired_bootstrap(ref, outs,
                                scorer,
                                compare_directions=[(0, 1)],
-                               num_samples=1000, sample_ratio=0.5):
+                               num_samples=1000, sample_ratio=0.5,
+                               cached_stats=None,
+                               with_replacement=False):
   """
   Evaluate with paired boostrap.
   This compares several systems, performing a signifiance tests with
   paired bootstrap resampling to compare the accuracy of the specified systems.
+  All the samples are drawn at once (in batches bounded in memory), and scored for every system with matrix
+  operations over the cached statistics.
   
   Args:
     ref: The correct labels
@@ -30,50 +98,34 @@ def eval_with_paired_bootstrap(ref, outs,
     compare_directions: A string specifying which two systems to compare
     num_samples: The number of bootstrap samples to take
     sample_ratio: The ratio of samples to take every time
+    cached_stats: Statistics already calculated with `scorer.cache_stats` for each system (optional).
+                  If specified, `ref` and `outs` are not read and may be None.
+    with_replacement: Whether to draw the sentences of each sample with replacement
 
   Returns:
     A tuple containing the win ratios, statistics for systems
   """
   
-  sys_scores = [[] for _ in outs] 
-  wins = [[0, 0, 0] for _ in compare_directions]
-  n = len(ref)
-  ids = list(range(n))
-
-  cache_stats = [scorer.cache_stats(ref, out) for out in outs] 
+  cache_stats = cached_stats if cached_stats is not None else cache_utils.cache_system_stats(scorer, ref, outs)
+  n = len(ref) if cached_stats is None else len(cached_stats[0])
 
-  for _ in range(num_samples):
-    # Subsample the gold and system outputs
-    np.random.shuffle(ids)
-    reduced_ids = ids[:int(len(ids)*sample_ratio)]
-    # Calculate accuracy on the reduced sample and save stats
-    if cache_stats[0]:
-      sys_score, _ = zip(*[scorer.score_cached_corpus(reduced_ids, cache_stat) for cache_stat in cache_stats])
-    else:
-      reduced_ref = [ref[i] for i in reduced_ids]
-      reduced_outs = [[out[i] for i in reduced_ids] for out in outs]
-      sys_score, _ = zip(*[scorer.score_corpus(reduced_ref, reduced_out) for reduced_out in reduced_outs])
+  batch_size = max(1, _MAX_BATCH_ELEMENTS // max(n, 1))
+  sys_scores = np.concatenate([
+    _score_samples(ref, outs, scorer, cache_stats,
+                   draw_samples(n, min(batch_size, num_samples - start), sample_ratio, with_replacement))
+    for start in range(0, num_samples, batch_size)], axis=1)
 
-    for i, compare_direction in enumerate(compare_directions): 
-      left, right = compare_direction
-      if sys_score[left] > sys_score[right]:
-        wins[i][0] += 1
-      if sys_score[left] < sys_score[right]:
-        wins[i][1] += 1
-      else:
-        wins[i][2] += 1
-    
-    for i in range(len(outs)): 
-      sys_scores[i].append(sys_score[i])
+  # Win stats: the ratios of samples where the left system wins, loses, and ties
+  left, right = [np.array([x[i] for x in compare_directions], dtype=np.int64).reshape(-1) for i in range(2)]
+  left_scores, right_scores = sys_scores[left], sys_scores[right]
+  wins = np.stack([(left_scores > right_scores).mean(axis=1),
+                   (left_scores < right_scores).mean(axis=1),
+                   (left_scores == right_scores).mean(axis=1)], axis=1).tolist()
 
-  # Print win stats
-  wins = [[x/float(num_samples) for x in win] for win in wins]
-
-  # Print system stats
-  sys_stats = []
-  for i in range(len(outs)): 
-    sys_scores[i].sort()
-    sys_stats.append({'mean':np.mean(sys_scores[i]), 'median':np.median(sys_scores[i]), 'lower_bound':sys_scores[i][int(num_samples * 0.025)], 'upper_bound':sys_scores[i][int(num_samples * 0.975)]})
+  # System stats
+  sys_scores.sort(axis=1)
+  sys_stats = [{'mean': x.mean(), 'median': np.median(x),
+                'lower_bound': x[int(num_samples * 0.025)], 'upper_bound': x[int(num_samples * 0.975)]}
+               for x in sys_scores]
  
   return wins, sys_stats
-
@@ -15,4 +15,35 @@ def extract_salient_features(dict1, dict2, alpha=1.0):
   scores = {}
   for k in all_keys:
     scores[k] = (dict1[k]+alpha) / (dict1[k] + dict2[k] + 2*alpha)
-  return scores
\ No newline at end of file
+  return scores
+
+def calc_scorediff_lists(sent_scores, ref_hashes, out_hashes, compare_directions):
+  """
+  Calculate the differences between the sentence-level scores of pairs of systems.
+
+  Args:
+    sent_scores: For each system, a list with the score and auxiliary information string of each sentence
+                 (can be None for systems that are not compared)
+    ref_hashes: A content digest of each reference sentence, as calculated by corpus_utils.sent_hashes
+    out_hashes: For each system, a content digest of each output sentence (can be None for systems that are not
+                compared)
+    compare_directions: A list of (left, right) tuples specifying which systems to compare
+
+  Returns:
+    For each direction, a list of (score difference, left score, right score, left string, right string,
+    sentence index) tuples sorted by the score difference. A sentence is skipped if the reference and both outputs
+    are the same as for an earlier sentence.
+  """
+  scorediff_lists = []
+  for (left, right) in compare_directions:
+    scorediff_list = []
+    deduplicate_set = set()
+    for i, key in enumerate(zip(out_hashes[left], out_hashes[right], ref_hashes)):
+      if key in deduplicate_set:
+        continue
+      deduplicate_set.add(key)
+      (s1, str1), (s2, str2) = sent_scores[left][i], sent_scores[right][i]
+      scorediff_list.append((s2-s1, s1, s2, str1, str2, i))
+    scorediff_list.sort()
+    scorediff_lists.append(scorediff_list)
+  return scorediff_lists
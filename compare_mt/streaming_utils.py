@@ -0,0 +1,469 @@
+########################################################################################
+# Single-pass streaming analysis                                                       #
+#                                                                                      #
+# Instead of loading whole corpora into memory, the reference, outputs and source are  #
+# read in lockstep, one block of sentences at a time. Every report accumulates the     #
+# sufficient statistics it needs from each block, so memory is bounded by the          #
+# statistics and not by the size of the corpora.                                       #
+########################################################################################
+
+import itertools
+import operator
+from collections import defaultdict
+
+from compare_mt import corpus_utils
+from compare_mt import scorers
+from compare_mt import bucketers
+from compare_mt import ngram_utils
+from compare_mt import stat_utils
+from compare_mt import sign_utils
+from compare_mt import reporters
+from compare_mt import arg_utils
+from compare_mt import repetition_utils
+from compare_mt import incremental_utils
+
+# Number of sentences read from each file at once
+DEFAULT_BLOCK_SIZE = 10000
+
+def iterate_blocks(ref_file, out_files, src_file=None, block_size=DEFAULT_BLOCK_SIZE):
+  """
+  Read the reference, the outputs and the source in lockstep, one block of sentences at a time
+
+  Args:
+    ref_file: The reference file
+    out_files: The output files
+    src_file: The source file (optional)
+    block_size: The number of sentences in each block
+
+  Returns:
+    An iterator over tuples of (ref, outs, src) blocks, where src is None if there is no source file
+  """
+  iterators = [corpus_utils.iterate_tokens(x) for x in [ref_file] + list(out_files)]
+  if src_file:
+    iterators.append(corpus_utils.iterate_tokens(src_file))
+  lines = itertools.zip_longest(*iterators)
+  while True:
+    block = list(itertools.islice(lines, block_size))
+    if len(block) == 0:
+      return
+    if any(x is None for sents in block for x in sents):
+      raise ValueError('All input files must have the same number of lines when streaming')
+    columns = list(zip(*block))
+    ref = list(columns[0])
+    outs = [list(x) for x in columns[1:len(out_files)+1]]
+    src = list(columns[-1]) if src_file else None
+    yield ref, outs, src
+
+class _BlockReader(object):
+  """
+  Reads a side file (labels or alignments) one block at a time in lockstep with the main inputs
+  """
+  def __init__(self, filename):
+    self.iterator = corpus_utils.iterate_tokens(filename)
+
+  def next_block(self, size):
+    return list(itertools.islice(self.iterator, size))
+
+def _label_readers(out_labels, num_outs):
+  if out_labels is None:
+    return None
+  out_labels = arg_utils.parse_files(out_labels)
+  if len(out_labels) != num_outs:
+    raise ValueError(f'The number of output files should be equal to the number of output labels.')
+  return [_BlockReader(x) for x in out_labels]
+
+class StreamingReport(object):
+  """
+  A report whose statistics are accumulated over blocks of sentences
+  """
+  def add_block(self, ref, outs, src=None):
+    """
+    Accumulate the statistics of one block of sentences
+
+    Args:
+      ref: A block of reference sentences
+      outs: Blocks of output sentences, one for each system
+      src: A block of source sentences, if a source file was specified
+    """
+    raise NotImplementedError('add_block must be implemented in subclasses of StreamingReport')
+
+  def generate_report(self):
+    """
+    Create the report from the accumulated statistics
+
+    Returns:
+      The reporter, after printing the report
+    """
+    raise NotImplementedError('generate_report must be implemented in subclasses of StreamingReport')
+
+class ScoreStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_score_report`
+  """
+  def __init__(self, num_outs,
+               score_type='bleu',
+               bootstrap=0, prob_thresh=0.05,
+               meteor_directory=None, options=None, meteor_workers=1,
+               title=None,
+               case_insensitive=False,
+               sample_ratio=0.5, with_replacement=False):
+    self.score_type = score_type
+    self.bootstrap = int(bootstrap)
+    self.prob_thresh = float(prob_thresh)
+    self.sample_ratio = float(sample_ratio)
+    self.with_replacement = True if with_replacement == 'True' else False
+    self.title = title
+    case_insensitive = True if case_insensitive == 'True' else False
+    self.scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive,
+                                                     meteor_directory=meteor_directory, options=options,
+                                                     meteor_workers=int(meteor_workers))
+    self.scores = [incremental_utils.IncrementalScorer(self.scorer) for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    all_block_stats = self.scorer.cache_system_stats(ref, outs)
+    for sys_scores, block_stats in zip(self.scores, all_block_stats):
+      if block_stats is None:
+        raise ValueError(f'Scorer "{self.score_type}" does not support streaming as it cannot cache statistics')
+      sys_scores.append_stats(block_stats)
+
+  def generate_report(self):
+    scores, strs = zip(*[x.score() for x in self.scores])
+
+    if self.bootstrap != 0:
+      direcs = []
+      for i in range(len(scores)):
+        for j in range(i+1, len(scores)):
+          direcs.append( (i,j) )
+      wins, sys_stats = sign_utils.eval_with_paired_bootstrap(None, None, self.scorer, direcs,
+                                                              num_samples=self.bootstrap,
+                                                              sample_ratio=self.sample_ratio,
+                                                              cached_stats=[x.stats for x in self.scores],
+                                                              with_replacement=self.with_replacement)
+      wins = list(zip(direcs, wins))
+    else:
+      wins = sys_stats = None
+
+    reporter = reporters.ScoreReport(scorer=self.scorer, scores=scores, strs=strs,
+                                     wins=wins, sys_stats=sys_stats, prob_thresh=self.prob_thresh,
+                                     title=self.title)
+    reporter.generate_report(output_fig_file=f'score-{self.score_type}-{self.bootstrap}',
+                             output_fig_format='pdf',
+                             output_directory='outputs')
+    return reporter
+
+class WordAccuracyStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_word_accuracy_report`
+  """
+  def __init__(self, num_outs, ref_file,
+               acc_type='fmeas', bucket_type='freq', bucket_cutoffs=None,
+               freq_count_file=None, freq_corpus_file=None,
+               label_set=None,
+               ref_labels=None, out_labels=None,
+               title=None,
+               case_insensitive=False):
+    case_insensitive = True if case_insensitive == 'True' else False
+    self.acc_type = acc_type
+    self.title = title
+    self.out_labels = _label_readers(out_labels, num_outs)
+    self.ref_labels = _BlockReader(ref_labels) if ref_labels is not None else None
+    # Frequencies from the reference are counted by a separate pass over the reference file
+    if bucket_type == 'freq' and freq_count_file is None and freq_corpus_file is None:
+      freq_corpus_file = ref_file
+    self.bucketer = bucketers.create_word_bucketer_from_profile(bucket_type,
+                                                                bucket_cutoffs=bucket_cutoffs,
+                                                                freq_count_file=freq_count_file,
+                                                                freq_corpus_file=freq_corpus_file,
+                                                                label_set=label_set,
+                                                                case_insensitive=case_insensitive)
+    self.matches = [incremental_utils.IncrementalWordMatches(self.bucketer) for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    ref_labels = self.ref_labels.next_block(len(ref)) if self.ref_labels else None
+    for i, out in enumerate(outs):
+      out_labels = self.out_labels[i].next_block(len(out)) if self.out_labels else None
+      self.matches[i].append(ref, out, ref_labels=ref_labels, out_labels=out_labels)
+
+  def generate_report(self):
+    matches = [x.match_stats() for x in self.matches]
+    reporter = reporters.WordReport(bucketer=self.bucketer, matches=matches,
+                                    acc_type=self.acc_type, header="Word Accuracy Analysis",
+                                    title=self.title)
+    reporter.generate_report(output_fig_file=f'word-acc',
+                             output_fig_format='pdf',
+                             output_directory='outputs')
+    return reporter
+
+class SrcWordAccuracyStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_src_word_accuracy_report`
+  """
+  def __init__(self, num_outs, src_file, ref_align_file=None, out_align_files=None,
+               acc_type='fmeas', bucket_type='freq', bucket_cutoffs=None,
+               freq_count_file=None, freq_corpus_file=None,
+               label_set=None,
+               src_labels=None,
+               title=None,
+               case_insensitive=False):
+    case_insensitive = True if case_insensitive == 'True' else False
+    if not src_file or not ref_align_file or not out_align_files:
+      raise ValueError("Must specify the source and the alignment files when performing source analysis.")
+    self.acc_type = acc_type
+    self.title = title
+    self.ref_align = _BlockReader(ref_align_file)
+    self.out_aligns = [_BlockReader(x) for x in arg_utils.parse_files(out_align_files)]
+    if len(self.out_aligns) != num_outs:
+      raise ValueError(f'The number of output files should be equal to the number of output alignment files.')
+    self.src_labels = _BlockReader(src_labels) if src_labels is not None else None
+    if bucket_type == 'freq' and freq_count_file is None and freq_corpus_file is None:
+      freq_corpus_file = src_file
+    self.bucketer = bucketers.create_word_bucketer_from_profile(bucket_type,
+                                                                bucket_cutoffs=bucket_cutoffs,
+                                                                freq_count_file=freq_count_file,
+                                                                freq_corpus_file=freq_corpus_file,
+                                                                label_set=label_set,
+                                                                case_insensitive=case_insensitive)
+    self.matches = [incremental_utils.IncrementalWordMatches(self.bucketer) for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    ref_align = self.ref_align.next_block(len(ref))
+    src_labels = self.src_labels.next_block(len(ref)) if self.src_labels else None
+    for i, out in enumerate(outs):
+      out_align = self.out_aligns[i].next_block(len(out))
+      self.matches[i].append_source(src, ref, out, ref_align, out_align, src_labels=src_labels)
+
+  def generate_report(self):
+    matches = [x.match_stats() for x in self.matches]
+    reporter = reporters.WordReport(bucketer=self.bucketer, matches=matches,
+                                    acc_type=self.acc_type, header="Source Word Accuracy Analysis",
+                                    title=self.title)
+    reporter.generate_report(output_fig_file=f'src-word-acc',
+                             output_fig_format='pdf',
+                             output_directory='outputs')
+    return reporter
+
+class SentenceBucketStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_sentence_bucketed_report`
+  """
+  def __init__(self, num_outs,
+               bucket_type='score', bucket_cutoffs=None,
+               statistic_type='count',
+               score_measure='bleu',
+               label_set=None,
+               ref_labels=None, out_labels=None,
+               title=None,
+               case_insensitive=False):
+    case_insensitive = True if case_insensitive == 'True' else False
+    self.statistic_type = statistic_type
+    self.score_measure = score_measure
+    self.title = title
+    self.ref_labels = _BlockReader(ref_labels) if ref_labels is not None else None
+    self.out_labels = _label_readers(out_labels, num_outs) if ref_labels is None else None
+    self.bucketer = bucketers.create_sentence_bucketer_from_profile(bucket_type, bucket_cutoffs=bucket_cutoffs,
+                                                                    score_type=score_measure, label_set=label_set,
+                                                                    case_insensitive=case_insensitive)
+    if statistic_type == 'count':
+      self.scorer = None
+    elif statistic_type == 'score':
+      self.scorer = scorers.create_scorer_from_profile(score_measure, case_insensitive=case_insensitive)
+    else:
+      raise ValueError(f'Illegal statistic_type {statistic_type}')
+    # Sentence counts for each bucket, plus the scores of each bucket if the statistic is a score
+    self.buckets = [incremental_utils.IncrementalSentenceBuckets(self.bucketer, scorer=self.scorer)
+                    for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    ref_labels = self.ref_labels.next_block(len(ref)) if self.ref_labels else None
+    for i, out in enumerate(outs):
+      out_labels = self.out_labels[i].next_block(len(out)) if self.out_labels else None
+      self.buckets[i].append(out, ref=ref, ref_labels=ref_labels, out_labels=out_labels)
+
+  def generate_report(self):
+    sys_stats = [x.statistics() for x in self.buckets]
+    reporter = reporters.SentenceReport(bucketer=self.bucketer,
+                                        sys_stats=sys_stats,
+                                        statistic_type=self.statistic_type, scorer=self.scorer,
+                                        title=self.title)
+    reporter.generate_report(output_fig_file=f'sentence-{self.statistic_type}-{self.score_measure}',
+                             output_fig_format='pdf',
+                             output_directory='outputs')
+    return reporter
+
+class NgramStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_ngram_report`
+  """
+  def __init__(self, num_outs,
+               min_ngram_length=1, max_ngram_length=4,
+               report_length=50, alpha=1.0, compare_type='match',
+               ref_labels=None, out_labels=None,
+               compare_directions='0-1',
+               title=None,
+               case_insensitive=False):
+    self.min_ngram_length, self.max_ngram_length = int(min_ngram_length), int(max_ngram_length)
+    self.report_length = int(report_length)
+    self.alpha = float(alpha)
+    self.compare_type = compare_type
+    self.compare_directions = compare_directions
+    self.title = title
+    self.case_insensitive = (case_insensitive == 'True') and ref_labels is None
+    if ref_labels is not None:
+      label_files_str = f'    ref_labels={ref_labels},'
+      for i, out_label in enumerate(arg_utils.parse_files(out_labels)):
+        label_files_str += f' out{i}_labels={out_label},'
+      self.label_files = label_files_str
+    else:
+      self.label_files = None
+    self.ref_labels = _BlockReader(ref_labels) if ref_labels is not None else None
+    self.out_labels = _label_readers(out_labels, num_outs)
+    self.counts = [tuple(defaultdict(lambda: 0) for _ in range(4)) for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    ref_labels = self.ref_labels.next_block(len(ref)) if self.ref_labels else None
+    if self.case_insensitive:
+      ref = corpus_utils.lower(ref)
+    for i, out in enumerate(outs):
+      out_labels = self.out_labels[i].next_block(len(out)) if self.out_labels else None
+      if self.case_insensitive:
+        out = corpus_utils.lower(out)
+      block_counts = ngram_utils.compare_ngrams(ref, out, ref_labels=ref_labels, out_labels=out_labels,
+                                                min_length=self.min_ngram_length, max_length=self.max_ngram_length)
+      for total, block_total in zip(self.counts[i], block_counts):
+        for k, v in block_total.items():
+          total[k] += v
+
+  def generate_report(self):
+    totals, matches, overs, unders = zip(*self.counts)
+    direcs = arg_utils.parse_compare_directions(self.compare_directions)
+    compared = {'match': matches, 'over': overs, 'under': unders}
+    if self.compare_type not in compared:
+      raise ValueError(f'Illegal compare_type "{self.compare_type}"')
+    counts = compared[self.compare_type]
+    scores = [stat_utils.extract_salient_features(counts[left], counts[right], alpha=self.alpha) for (left, right) in direcs]
+    scorelist = [sorted(score.items(), key=operator.itemgetter(1), reverse=True) for score in scores]
+
+    reporter = reporters.NgramReport(scorelist=scorelist, report_length=self.report_length,
+                                     min_ngram_length=self.min_ngram_length,
+                                     max_ngram_length=self.max_ngram_length,
+                                     matches=matches,
+                                     compare_type=self.compare_type, alpha=self.alpha,
+                                     compare_directions=direcs,
+                                     label_files=self.label_files,
+                                     title=self.title)
+    reporter.generate_report(output_fig_file=f'ngram-min{self.min_ngram_length}-max{self.max_ngram_length}-{self.compare_type}',
+                             output_fig_format='pdf',
+                             output_directory='outputs')
+    return reporter
+
+class RepetitionStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_repetitions_report`
+  """
+  def __init__(self, num_outs, title=None, adjacent=True,
+               ngram_order=1, subtract_legitimate_reps=False):
+    self.title = title
+    self.adjacent = adjacent
+    self.ngram_order = int(ngram_order)
+    self.subtract_legitimate_reps = subtract_legitimate_reps
+    self.rep_totals = [0 for _ in range(num_outs)]
+
+  def add_block(self, ref, outs, src=None):
+    block_totals = repetition_utils.repetition_stats(ref=ref, outs=outs, src=src,
+                                                     adjacent=self.adjacent,
+                                                     ngram_order=self.ngram_order,
+                                                     subtract_legitimate_reps=self.subtract_legitimate_reps)
+    self.rep_totals = [x + y for x, y in zip(self.rep_totals, block_totals)]
+
+  def generate_report(self):
+    reporter = reporters.RepetitionReport(repetition_stats=self.rep_totals,
+                                          title=self.title,
+                                          adjacent=self.adjacent,
+                                          ngram_order=self.ngram_order,
+                                          subtract_legitimate_reps=self.subtract_legitimate_reps)
+    reporter.generate_report()
+    return reporter
+
+class SentenceExamplesStreamingReport(StreamingReport):
+  """
+  Streaming counterpart of `generate_sentence_examples`.
+  Only the sentence scores and hashes are accumulated, and the printed sentences are read back from the files.
+  """
+  def __init__(self, ref_file, out_files, src_file=None,
+               score_type='sentbleu',
+               report_length=10,
+               compare_directions='0-1',
+               title=None,
+               case_insensitive=False):
+    self.ref_file, self.out_files, self.src_file = ref_file, out_files, src_file
+    self.report_length = int(report_length)
+    self.title = title
+    case_insensitive = True if case_insensitive == 'True' else False
+    self.scorer = scorers.create_scorer_from_profile(score_type, case_insensitive=case_insensitive)
+    self.direcs = arg_utils.parse_compare_directions(compare_directions)
+    self.compared = set(itertools.chain.from_iterable(self.direcs))
+    self.sent_scores = [[] if i in self.compared else None for i in range(len(out_files))]
+    self.out_hashes = [[] if i in self.compared else None for i in range(len(out_files))]
+    self.ref_hashes = []
+
+  def add_block(self, ref, outs, src=None):
+    self.ref_hashes += corpus_utils.sent_hashes(ref)
+    for i in self.compared:
+      self.sent_scores[i] += self.scorer.score_sentences(ref, outs[i])
+      self.out_hashes[i] += corpus_utils.sent_hashes(outs[i])
+
+  def generate_report(self):
+    scorediff_lists = stat_utils.calc_scorediff_lists(self.sent_scores, self.ref_hashes, self.out_hashes, self.direcs)
+    example_ids = set(x[-1] for scorediff_list in scorediff_lists
+                      for x in scorediff_list[:self.report_length] + scorediff_list[-self.report_length:])
+    def view(filename):
+      if filename is None:
+        return None
+      corpus = corpus_utils.LazyCorpus(filename)
+      corpus.prefetch(example_ids)
+      return corpus
+    reporter = reporters.SentenceExampleReport(report_length=self.report_length, scorediff_lists=scorediff_lists,
+                                               scorer=self.scorer,
+                                               ref=view(self.ref_file),
+                                               outs=[view(x) for x in self.out_files],
+                                               src=view(self.src_file),
+                                               compare_directions=self.direcs,
+                                               title=self.title)
+    reporter.generate_report()
+    return reporter
+
+def generate_streaming_reports(ref_file, out_files, src_file=None, report_profiles=[], block_size=DEFAULT_BLOCK_SIZE):
+  """
+  Generate reports with a single pass over the input files
+
+  Args:
+    ref_file: The reference file
+    out_files: The output files
+    src_file: The source file (optional)
+    report_profiles: A list of (report name, report type, profile strings) tuples, where the report type is one of
+                     "score", "word_accuracy", "src_word_accuracy", "sentence_bucket", "ngram", "repetition"
+                     or "sentence_example"
+    block_size: The number of sentences to read from each file at once
+
+  Returns:
+    A list of (report name, reporters) tuples
+  """
+  num_outs = len(out_files)
+  creators = {
+    'score': lambda **kw: ScoreStreamingReport(num_outs, **kw),
+    'word_accuracy': lambda **kw: WordAccuracyStreamingReport(num_outs, ref_file, **kw),
+    'src_word_accuracy': lambda **kw: SrcWordAccuracyStreamingReport(num_outs, src_file, **kw),
+    'sentence_bucket': lambda **kw: SentenceBucketStreamingReport(num_outs, **kw),
+    'ngram': lambda **kw: NgramStreamingReport(num_outs, **kw),
+    'repetition': lambda **kw: RepetitionStreamingReport(num_outs, **kw),
+    'sentence_example': lambda **kw: SentenceExamplesStreamingReport(ref_file, out_files, src_file=src_file, **kw),
+  }
+  streams = [(name, [creators[report_type](**arg_utils.parse_profile(x)) for x in profiles])
+             for name, report_type, profiles in report_profiles]
+
+  for ref, outs, src in iterate_blocks(ref_file, out_files, src_file=src_file, block_size=block_size):
+    for _, name_streams in streams:
+      for stream in name_streams:
+        stream.add_block(ref, outs, src)
+
+  return [(name, [stream.generate_report() for stream in name_streams]) for name, name_streams in streams]
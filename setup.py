@@ -53,7 +53,7 @@ setup(
     "numpy",
     "matplotlib",
     "absl-py",
-    "sacrebleu",
+    "sacrebleu>=2.0,<3",
     "langid",
     "whatthelang"
   ],
@@ -0,0 +1,52 @@
+import os.path
+import random
+import unittest
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import align_utils
+
+
+def _simple_count_increasing_pairs(seq):
+  return sum(1 for i in range(len(seq)) for j in range(i+1, len(seq)) if seq[i] < seq[j])
+
+
+class TestNgramContextAlign(unittest.TestCase):
+
+  def test_unique_words(self):
+    self.assertEqual(align_utils.ngram_context_align("a b c d".split(), "c d a x".split()), [2, 3, 0])
+
+  def test_ambiguous_words(self):
+    # The repeated "a" are disambiguated by their left or right context
+    ref = "a b x a c".split()
+    out = "a c y a b".split()
+    self.assertEqual(align_utils.ngram_context_align(ref, out), [3, 4, 0, 1])
+    self.assertEqual(align_utils.ngram_context_align(ref, "a a".split()), [])
+
+  def test_shared_ref_word_pos(self):
+    ref = "a b x a c".split()
+    ref_word_pos = align_utils.word_positions(ref)
+    for out in ("a c y a b".split(), "a a".split(), "z a b".split()):
+      self.assertEqual(align_utils.ngram_context_align(ref, out, ref_word_pos=ref_word_pos),
+                       align_utils.ngram_context_align(ref, out))
+    self.assertEqual(dict(ref_word_pos), {"a": [0, 3], "b": [1], "x": [2], "c": [4]})
+
+
+class TestCountIncreasingPairs(unittest.TestCase):
+
+  def test_random(self):
+    rng = random.Random(0)
+    seqs = [[rng.randint(0, 20) for _ in range(rng.randint(0, 50))] for _ in range(200)]
+    expected = [_simple_count_increasing_pairs(x) for x in seqs]
+    self.assertEqual([align_utils.count_increasing_pairs(x) for x in seqs], expected)
+    self.assertEqual(align_utils.count_increasing_pairs_batch(seqs).tolist(), expected)
+
+  def test_empty(self):
+    self.assertEqual(align_utils.count_increasing_pairs([]), 0)
+    self.assertEqual(align_utils.count_increasing_pairs_batch([[], [3]]).tolist(), [0, 0])
+
+
+if __name__ == "__main__":
+  unittest.main()
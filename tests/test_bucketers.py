@@ -0,0 +1,56 @@
+import os.path
+import unittest
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import bucketers
+from compare_mt import corpus_utils
+
+
+def _get_example_file(name):
+  return os.path.join(compare_mt_root, "example", name)
+
+
+class TestSourceBucketedMatches(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    vocab = corpus_utils.Vocabulary()
+    self.src, self.ref, self.out = [corpus_utils.load_corpus(_get_example_file(x), vocab=vocab)
+                                    for x in ("ted.orig.slk", "ted.ref.eng", "ted.sys1.eng")]
+    self.ref_align = corpus_utils.load_alignments(_get_example_file("ted.ref.align"))
+    self.out_align = corpus_utils.load_alignments(_get_example_file("ted.sys1.align"))
+    self.bucketer = bucketers.create_word_bucketer_from_profile('freq', freq_data=self.src)
+
+  def test_same_as_token_lists(self):
+    # Corpora with a shared vocabulary take the array-based path, token lists the sentence-by-sentence one
+    id_matches = self.bucketer.calc_source_bucketed_match_counts(self.src, self.ref, self.out,
+                                                                 self.ref_align, self.out_align)
+    list_matches = self.bucketer.calc_source_bucketed_match_counts(
+      list(self.src), list(self.ref), list(self.out),
+      corpus_utils.load_tokens(_get_example_file("ted.ref.align")),
+      corpus_utils.load_tokens(_get_example_file("ted.sys1.align")))
+    self.assertEqual(id_matches, list_matches)
+    self.assertGreater(sum(x[0] for x in id_matches), 0)
+
+
+class TestLengthBuckets(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    vocab = corpus_utils.Vocabulary()
+    self.ref, self.out = [corpus_utils.load_corpus(_get_example_file(x), vocab=vocab)
+                          for x in ("ted.ref.eng", "ted.sys1.eng")]
+
+  def test_same_as_calc_bucket(self):
+    for profile in ("length", "lengthdiff"):
+      bucketer = bucketers.create_sentence_bucketer_from_profile(profile)
+      expected = [bucketer.calc_bucket(o, ref=r) for o, r in zip(self.out, self.ref)]
+      self.assertEqual(bucketer.calc_buckets(self.out, self.ref), expected)
+      self.assertEqual(bucketer.calc_buckets(list(self.out), list(self.ref)), expected)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,85 @@
+import os
+import os.path
+import tempfile
+import unittest
+import sys
+import numpy as np
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import cache_utils
+from compare_mt import scorers
+from compare_mt.corpus_utils import load_corpus, MultiReference
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+  outs = [load_corpus(os.path.join(example_path, x), vocab=ref.vocab) for x in ("ted.sys1.eng", "ted.sys2.eng")]
+  return ref, outs
+
+
+class _CountingScorer(scorers.BleuScorer):
+
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self._calls = 0
+
+  def cache_stats(self, ref, out):
+    self._calls += 1
+    return super().cache_stats(ref, out)
+
+
+class TestScoreCache(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.outs = _get_example_data()
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    cache_utils.global_score_cache = None
+    self.directory.cleanup()
+
+  def test_key(self):
+    cache = cache_utils.ScoreCache(self.directory.name)
+    key = cache.key(scorers.BleuScorer(), self.ref, self.outs[0])
+    self.assertEqual(key, cache.key(scorers.BleuScorer(), list(self.ref), list(self.outs[0])))
+    self.assertNotEqual(key, cache.key(scorers.BleuScorer(case_insensitive=True), self.ref, self.outs[0]))
+    self.assertNotEqual(key, cache.key(scorers.BleuScorer(), self.ref, self.outs[1]))
+    self.assertNotEqual(key, cache.key(scorers.BleuScorer(), self.outs[0], self.ref))
+    self.assertNotEqual(key, cache.key(scorers.BleuScorer(), MultiReference([self.ref, self.outs[1]]), self.outs[0]))
+    self.assertNotEqual(cache.key(scorers.RougeScorer("rouge1"), self.ref, self.outs[0]),
+                        cache.key(scorers.RougeScorer("rouge1", use_stemmer=True), self.ref, self.outs[0]))
+
+  def test_cache_system_stats(self):
+    cache_utils.global_score_cache = cache_utils.ScoreCache(self.directory.name)
+    scorer = _CountingScorer()
+    stats = cache_utils.cache_system_stats(scorer, self.ref, self.outs)
+    self.assertEqual(scorer._calls, 2)
+    scorer = _CountingScorer()
+    cached_stats = cache_utils.cache_system_stats(scorer, self.ref, self.outs)
+    self.assertEqual(scorer._calls, 0)
+    for x, y in zip(stats, cached_stats):
+      self.assertTrue(np.array_equal(x, y))
+
+  def test_evict(self):
+    stats = np.zeros((100, 10), dtype=np.int64)
+    cache = cache_utils.ScoreCache(self.directory.name)
+    for i in range(3):
+      cache.put(f'key{i}', stats)
+      os.utime(cache._path(f'key{i}'), ns=(i * 10**9, i * 10**9))
+    # Room for exactly three entries
+    cache.max_size = 3 * os.path.getsize(cache._path('key0'))
+    self.assertIsNotNone(cache.get('key0'))
+    cache.put('key3', stats)
+    self.assertIsNone(cache.get('key1'))
+    for key in ('key0', 'key2', 'key3'):
+      self.assertIsNotNone(cache.get(key))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,308 @@
+import bz2
+import gzip
+import lzma
+import os.path
+import shutil
+import tempfile
+import unittest
+import sys
+import warnings
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import corpus_utils
+
+
+def _get_example_file(name):
+  return os.path.join(compare_mt_root, "example", name)
+
+
+class TestCorpus(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref_file = _get_example_file("ted.ref.eng")
+    self.out_file = _get_example_file("ted.sys1.eng")
+    self.vocab = corpus_utils.Vocabulary()
+    self.ref = corpus_utils.load_corpus(self.ref_file, vocab=self.vocab)
+    self.out = corpus_utils.load_corpus(self.out_file, vocab=self.vocab)
+
+  def test_same_as_load_tokens(self):
+    ref_tokens = corpus_utils.load_tokens(self.ref_file)
+    self.assertEqual(len(self.ref), len(ref_tokens))
+    self.assertEqual(list(self.ref), ref_tokens)
+    self.assertEqual(self.ref[0], ref_tokens[0])
+    self.assertEqual(self.ref[-1], ref_tokens[-1])
+    self.assertEqual(self.ref[3:5], ref_tokens[3:5])
+
+  def test_shared_vocab(self):
+    self.assertIs(corpus_utils.shared_vocab(self.ref, self.out), self.vocab)
+    self.assertIsNone(corpus_utils.shared_vocab(self.ref, corpus_utils.load_tokens(self.out_file)))
+    other = corpus_utils.load_corpus(self.out_file)
+    self.assertIsNone(corpus_utils.shared_vocab(self.ref, other))
+
+  def test_lower(self):
+    lowered = corpus_utils.lower(self.ref)
+    self.assertIs(corpus_utils.lower(self.ref), lowered)
+    self.assertIs(lowered.lower(), lowered)
+    self.assertIs(lowered.vocab, self.vocab)
+    self.assertEqual(list(lowered), corpus_utils.lower(corpus_utils.load_tokens(self.ref_file)))
+
+  def test_iter_ids(self):
+    for i, sent_ids in enumerate(self.ref.iter_ids()):
+      self.assertEqual(sent_ids, self.ref.sent_ids(i).tolist())
+      self.assertEqual(self.vocab.decode(sent_ids), self.ref[i])
+
+  def test_sent_lengths(self):
+    lengths = corpus_utils.sent_lengths(self.ref)
+    self.assertIs(corpus_utils.sent_lengths(self.ref), lengths)
+    self.assertEqual(lengths.tolist(), [len(x) for x in corpus_utils.load_tokens(self.ref_file)])
+    self.assertEqual(corpus_utils.sent_lengths(self.ref.sub_corpus(10, 20)).tolist(), lengths[10:20].tolist())
+
+  def test_sent_hashes(self):
+    hashes = corpus_utils.sent_hashes(self.ref)
+    # The digests only depend on the words, not on the vocabulary
+    self.assertEqual(corpus_utils.sent_hashes(corpus_utils.load_tokens(self.ref_file)), hashes)
+    self.assertEqual(corpus_utils.sent_hashes(corpus_utils.load_corpus(self.ref_file)), hashes)
+    ref_tokens = corpus_utils.load_tokens(self.ref_file)
+    # Equal sentences, and only them, have equal digests
+    self.assertEqual(len(set(hashes)), len(set(tuple(x) for x in ref_tokens)))
+    self.assertEqual(len(set(zip(hashes, (tuple(x) for x in ref_tokens)))), len(set(hashes)))
+
+  def test_closest_refs(self):
+    refs = corpus_utils.MultiReference([[['a'] * 3, ['a'] * 2], [['a'] * 5, ['a'] * 4]])
+    closest, lengths = corpus_utils.closest_refs(refs, [['a'] * 4, ['a'] * 3])
+    self.assertEqual(closest.tolist(), [0, 0])
+    self.assertEqual(lengths.tolist(), [3, 2])
+
+
+class TestLazyCorpus(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.in_file = _get_example_file("ted.sys1.eng")
+    self.expected = corpus_utils.load_tokens(self.in_file)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_random_access(self):
+    lazy = corpus_utils.LazyCorpus(self.in_file)
+    self.assertEqual(len(lazy), len(self.expected))
+    for i in (5, 0, len(self.expected) - 1, 17, -2):
+      self.assertEqual(lazy[i], self.expected[i])
+    self.assertEqual(lazy[3:6], self.expected[3:6])
+
+  def test_no_final_newline(self):
+    in_file = os.path.join(self.tmp_dir, "in.txt")
+    with open(in_file, "w", encoding="utf-8") as f:
+      f.write("a b\n\nc d e")
+    lazy = corpus_utils.LazyCorpus(in_file)
+    self.assertEqual(lazy[0:3], corpus_utils.load_tokens(in_file))
+
+  def test_carriage_returns(self):
+    # Bare carriage returns end lines as in text mode, also at the boundary between two blocks of the file
+    in_file = os.path.join(self.tmp_dir, "in.txt")
+    with open(in_file, "wb") as f:
+      f.write("a b\r\nc\rd e\r\r\nf\n\rg\r".encode("utf-8"))
+    expected = corpus_utils.load_tokens(in_file)
+    self.assertEqual(len(expected), 7)
+    for block_size in (1 << 20, 1, 2, 3, 4):
+      corpus_utils._INDEX_BLOCK_SIZE = block_size
+      try:
+        lazy = corpus_utils.LazyCorpus(in_file)
+      finally:
+        corpus_utils._INDEX_BLOCK_SIZE = 1 << 20
+      self.assertEqual(len(lazy), len(expected))
+      self.assertEqual(lazy[0:len(lazy)], expected)
+
+  def test_compressed(self):
+    in_file = os.path.join(self.tmp_dir, "in.txt.gz")
+    with open(self.in_file, "rb") as f:
+      content = f.read()
+    with open(in_file, "wb") as f:
+      f.write(gzip.compress(content))
+    lazy = corpus_utils.LazyCorpus(in_file)
+    lazy.prefetch([7, 3])
+    self.assertEqual(len(lazy), len(self.expected))
+    self.assertEqual(lazy[3], self.expected[3])
+    self.assertEqual(lazy[7], self.expected[7])
+    self.assertEqual(lazy[10], self.expected[10])
+
+  def test_lazy_view(self):
+    corpus = corpus_utils.load_corpus(self.in_file)
+    self.assertIsInstance(corpus_utils.lazy_view(corpus), corpus_utils.LazyCorpus)
+    self.assertIs(corpus_utils.lazy_view(self.expected), self.expected)
+    self.assertIsNone(corpus_utils.lazy_view(None))
+
+
+class TestAlignments(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.align_file = _get_example_file("ted.ref.align")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_same_as_load_tokens(self):
+    expected = [[tuple(int(x) for x in link.split('-')) for link in sent]
+                for sent in corpus_utils.load_tokens(self.align_file)]
+    aligns = corpus_utils.load_alignments(self.align_file)
+    self.assertEqual(list(aligns), expected)
+    self.assertEqual(aligns[5], expected[5])
+    self.assertEqual(aligns.sent_links(5).tolist(), [list(x) for x in expected[5]])
+    self.assertEqual(list(corpus_utils.Alignments.from_strs(corpus_utils.load_tokens(self.align_file))), expected)
+
+  def test_cached_alignments(self):
+    cache_dir = os.path.join(self.tmp_dir, "cache")
+    expected = list(corpus_utils.load_alignments(self.align_file))
+    first = corpus_utils.load_alignments(self.align_file, cache_dir=cache_dir)
+    second = corpus_utils.load_alignments(self.align_file, cache_dir=cache_dir)
+    self.assertEqual(list(first), expected)
+    self.assertEqual(list(second), expected)
+    self.assertEqual(len(os.listdir(os.path.join(cache_dir, "align"))), 2)
+
+  def test_malformed(self):
+    self.assertEqual(list(corpus_utils.Alignments.from_strs([["0-1", "2-2"], [], ["10-3"]])),
+                     [[(0, 1), (2, 2)], [], [(10, 3)]])
+    for links in (["0-1", "a-2"], ["0-1", "2"], ["0-1", "2-x"], ["0-1", "1.5-2"], ["0-99999999999"]):
+      with self.assertRaisesRegex(ValueError, "Failed to parse alignments"):
+        corpus_utils.Alignments.from_strs([links])
+    align_file = os.path.join(self.tmp_dir, "malformed.align")
+    with open(align_file, "w") as f:
+      f.write("0-0 1-1\n0-1 2-x\n")
+    filters = list(warnings.filters)
+    with self.assertRaisesRegex(ValueError, "Failed to parse alignments"):
+      corpus_utils.load_alignments(align_file)
+    self.assertEqual(warnings.filters, filters)
+
+
+class TestCorpusLoader(unittest.TestCase):
+
+  def test_load_once(self):
+    files = [_get_example_file(x) for x in ("ted.ref.eng", "ted.sys1.eng", "ted.sys2.eng", "ted.ref.eng.tag")]
+    loader = corpus_utils.CorpusLoader(num_workers=4)
+    loader.preload(files, counted_filenames=files[:1])
+    corpora = [loader.load(x) for x in files]
+    self.assertIs(loader.load(files[1]), corpora[1])
+    self.assertIs(loader.count_words(files[0]), loader.count_words(files[0]))
+    loader.close()
+    # Word IDs are the same as when loading the files one by one
+    vocab = corpus_utils.Vocabulary()
+    for corpus, filename in zip(corpora, files):
+      expected = corpus_utils.load_corpus(filename, vocab=vocab)
+      self.assertEqual(corpus.ids.tolist(), expected.ids.tolist())
+    self.assertEqual(loader.vocab.i2w, vocab.i2w)
+    self.assertEqual(dict(loader.count_words(files[0])), dict(corpus_utils.count_words(files[0])))
+
+
+class TestCompressedInput(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.in_file = _get_example_file("ted.sys1.eng")
+    with open(self.in_file, "rb") as f:
+      self.content = f.read()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _check_compressed(self, compressed):
+    # The name does not give away the format, it is detected from the content
+    compressed_file = os.path.join(self.tmp_dir, "in.txt")
+    with open(compressed_file, "wb") as f:
+      f.write(compressed)
+    self.assertEqual(corpus_utils.load_tokens(compressed_file), corpus_utils.load_tokens(self.in_file))
+
+  def test_gzip(self):
+    self._check_compressed(gzip.compress(self.content))
+
+  def test_xz(self):
+    self._check_compressed(lzma.compress(self.content))
+
+  def test_bz2(self):
+    self._check_compressed(bz2.compress(self.content))
+
+  def test_zstd(self):
+    try:
+      import zstandard
+    except ImportError:
+      self.skipTest("zstandard is not installed")
+    self._check_compressed(zstandard.ZstdCompressor().compress(self.content))
+
+  def test_stop_early(self):
+    compressed_file = os.path.join(self.tmp_dir, "in.txt.gz")
+    with open(compressed_file, "wb") as f:
+      f.write(gzip.compress(self.content * 20))
+    tokens = corpus_utils.iterate_tokens(compressed_file)
+    self.assertEqual(next(tokens), corpus_utils.load_tokens(self.in_file)[0])
+    tokens.close()
+
+
+class TestCorpusCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.cache_dir = os.path.join(self.tmp_dir, "cache")
+    self.in_file = os.path.join(self.tmp_dir, "in.txt")
+    shutil.copy(_get_example_file("ted.sys1.eng"), self.in_file)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_cached_corpus(self):
+    expected = corpus_utils.load_tokens(self.in_file)
+    first = corpus_utils.load_corpus(self.in_file, cache_dir=self.cache_dir)
+    vocab = corpus_utils.Vocabulary()
+    vocab.encode(["a", "vocabulary", "with", "existing", "words"])
+    second = corpus_utils.load_corpus(self.in_file, vocab=vocab, cache_dir=self.cache_dir)
+    self.assertEqual(list(first), expected)
+    self.assertEqual(list(second), expected)
+    self.assertEqual(first.content_hash, second.content_hash)
+    self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, "corpus"))), 3)
+
+  def test_changed_file(self):
+    first = corpus_utils.load_corpus(self.in_file, cache_dir=self.cache_dir)
+    with open(self.in_file, "a", encoding="utf-8") as f:
+      f.write("an extra line\n")
+    second = corpus_utils.load_corpus(self.in_file, cache_dir=self.cache_dir)
+    self.assertNotEqual(first.content_hash, second.content_hash)
+    self.assertEqual(len(second), len(first) + 1)
+    self.assertEqual(second[-1], ["an", "extra", "line"])
+
+  def test_concurrent_loads(self):
+    # Identical files loaded at the same time by several threads are parsed and written to the cache only once
+    files = [self.in_file]
+    for i in range(3):
+      files.append(os.path.join(self.tmp_dir, f"copy{i}.txt"))
+      shutil.copy(self.in_file, files[-1])
+    parsed = []
+    iterate_tokens = corpus_utils.iterate_tokens
+    def counting_iterate_tokens(filename):
+      parsed.append(filename)
+      return iterate_tokens(filename)
+    corpus_utils.iterate_tokens = counting_iterate_tokens
+    try:
+      loader = corpus_utils.CorpusLoader(num_workers=4, cache_dir=self.cache_dir)
+      loader.preload(files, counted_filenames=files)
+      corpora = [loader.load(x) for x in files]
+      counts = [loader.count_words(x) for x in files]
+      loader.close()
+    finally:
+      corpus_utils.iterate_tokens = iterate_tokens
+    self.assertEqual(len(parsed), 1)
+    expected = corpus_utils.load_tokens(self.in_file)
+    for corpus, count in zip(corpora, counts):
+      self.assertEqual(list(corpus), expected)
+      self.assertEqual(dict(count), dict(corpus_utils.count_words(self.in_file)))
+    self.assertFalse([x for x in os.listdir(os.path.join(self.cache_dir, "corpus")) if x.endswith(".tmp")])
+
+  def test_count_words(self):
+    expected = corpus_utils.count_words(self.in_file)
+    self.assertEqual(dict(corpus_utils.count_words(self.in_file, cache_dir=self.cache_dir)), dict(expected))
+
+
+if __name__ == "__main__":
+  unittest.main()
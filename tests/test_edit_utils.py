@@ -0,0 +1,57 @@
+import os.path
+import random
+import unittest
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import corpus_utils
+from compare_mt import edit_utils
+
+
+def _simple_edit_distance(ref, out, sub_pen=1.0, ins_pen=1.0, del_pen=1.0):
+  scores = [[j * ins_pen for j in range(len(out)+1)]]
+  for i in range(len(ref)):
+    row = [(i+1) * del_pen]
+    for j in range(len(out)):
+      row.append(min(scores[i][j] + (ref[i] != out[j]) * sub_pen, scores[i][j+1] + del_pen, row[j] + ins_pen))
+    scores.append(row)
+  return scores[-1][-1]
+
+
+class TestEditDistance(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    rng = random.Random(0)
+    # Long sentences make the bit vectors of the unit-cost algorithm span several machine words
+    self.refs = [[rng.choice("abcd") for _ in range(rng.randint(0, 90))] for _ in range(100)]
+    self.outs = [[rng.choice("abcde") for _ in range(rng.randint(0, 90))] for _ in range(100)]
+
+  def test_unit_cost(self):
+    for ref, out in zip(self.refs, self.outs):
+      self.assertEqual(edit_utils.edit_distance(ref, out), _simple_edit_distance(ref, out))
+
+  def test_weighted(self):
+    expected = [_simple_edit_distance(ref, out, 2.0, 0.5, 1.5) for ref, out in zip(self.refs, self.outs)]
+    for ref, out, dist in zip(self.refs, self.outs, expected):
+      self.assertAlmostEqual(edit_utils.edit_distance(ref, out, 2.0, 0.5, 1.5), dist)
+    for actual, dist in zip(edit_utils.edit_distances(self.refs, self.outs, 2.0, 0.5, 1.5), expected):
+      self.assertAlmostEqual(actual, dist)
+
+  def test_ops(self):
+    dist, ops = edit_utils.edit_distance(["a", "b", "c"], ["a", "x", "c", "d"], return_ops=True)
+    self.assertEqual(dist, 2)
+    self.assertEqual(ops, [('match', 0, 0), ('sub', 1, 1), ('match', 2, 2), ('ins', None, 3)])
+
+  def test_corpus_ids(self):
+    vocab = corpus_utils.Vocabulary()
+    ref = corpus_utils.Corpus.from_sents(self.refs, vocab)
+    out = corpus_utils.Corpus.from_sents(self.outs, vocab)
+    self.assertEqual(edit_utils.edit_distances(ref, out).tolist(),
+                     [_simple_edit_distance(r, o) for r, o in zip(self.refs, self.outs)])
+
+
+if __name__ == "__main__":
+  unittest.main()
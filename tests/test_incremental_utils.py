@@ -0,0 +1,91 @@
+import os.path
+import unittest
+import sys
+import numpy as np
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import bucketers
+from compare_mt import incremental_utils
+from compare_mt import scorers
+from compare_mt.corpus_utils import load_corpus
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+  out = load_corpus(os.path.join(example_path, "ted.sys1.eng"), vocab=ref.vocab)
+  return ref, out
+
+
+def _blocks(corpus, size=300):
+  return [corpus[i:i+size] for i in range(0, len(corpus), size)]
+
+
+class _UnsummedScorer(scorers.WERScorer):
+
+  def sum_stats(self, cached_stats):
+    return None
+
+
+class TestIncrementalScorer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out = _get_example_data()
+
+  def test_append(self):
+    for profile in ("bleu", "detokbleu", "sentbleu", "length", "ribes", "chrf", "rouge1", "rougeL", "wer"):
+      scorer = scorers.create_scorer_from_profile(profile)
+      incremental = incremental_utils.IncrementalScorer(scorer)
+      for ref, out in zip(_blocks(self.ref), _blocks(self.out)):
+        incremental.append(ref, out)
+      self.assertEqual(len(incremental), len(self.ref))
+      self.assertAlmostEqual(incremental.score()[0], scorer.score_corpus(self.ref, self.out)[0], places=8)
+
+  def test_resume_from_stats(self):
+    scorer = scorers.BleuScorer()
+    half = len(self.ref) // 2
+    incremental = incremental_utils.IncrementalScorer(scorer, cached_stats=scorer.cache_stats(self.ref[:half],
+                                                                                              self.out[:half]))
+    incremental.append(self.ref[half:], self.out[half:])
+    self.assertAlmostEqual(incremental.score()[0], scorer.score_corpus(self.ref, self.out)[0])
+    self.assertTrue(np.array_equal(incremental.stats, scorer.cache_stats(self.ref, self.out)))
+
+  def test_unsummed_scorer(self):
+    scorer = _UnsummedScorer()
+    incremental = incremental_utils.IncrementalScorer(scorer)
+    self.assertEqual(incremental.score(), scorer.score_corpus([], []))
+    for ref, out in zip(_blocks(self.ref), _blocks(self.out)):
+      incremental.append(ref, out)
+    self.assertAlmostEqual(incremental.score()[0], scorer.score_corpus(self.ref, self.out)[0])
+
+
+class TestIncrementalBuckets(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out = _get_example_data()
+
+  def test_word_matches(self):
+    bucketer = bucketers.create_word_bucketer_from_profile("freq", freq_data=self.ref)
+    incremental = incremental_utils.IncrementalWordMatches(bucketer)
+    for ref, out in zip(_blocks(self.ref), _blocks(self.out)):
+      incremental.append(ref, out)
+    self.assertEqual(incremental.match_stats(), list(bucketer.calc_bucketed_matches(self.ref, self.out)))
+
+  def test_sentence_buckets(self):
+    bucketer = bucketers.create_sentence_bucketer_from_profile("length")
+    scorer = scorers.BleuScorer()
+    incremental = incremental_utils.IncrementalSentenceBuckets(bucketer, scorer=scorer)
+    for ref, out in zip(_blocks(self.ref), _blocks(self.out)):
+      incremental.append(out, ref=ref)
+    bucketed_corpus = bucketer.create_bucketed_corpus(self.out, ref=self.ref)
+    self.assertEqual(incremental.counts, [len(bucket_out) for bucket_out, _ in bucketed_corpus])
+    for score, (bucket_out, bucket_ref) in zip(incremental.statistics(), bucketed_corpus):
+      self.assertAlmostEqual(score, scorer.score_corpus(bucket_ref, bucket_out)[0])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,66 @@
+import os.path
+import unittest
+import sys
+from collections import Counter
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import ngram_utils
+from compare_mt.corpus_utils import Corpus, MultiReference, load_tokens
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref_file = os.path.join(example_path, "ted.ref.eng")
+  out_file = os.path.join(example_path, "ted.sys1.eng")
+  return [load_tokens(x) for x in (ref_file, out_file)]
+
+
+class TestNgramMatchStats(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out = [x[:200] for x in _get_example_data()]
+    ref_corpus = Corpus.from_sents(self.ref)
+    self.ref_corpus, self.out_corpus = ref_corpus, Corpus.from_sents(self.out, vocab=ref_corpus.vocab)
+
+  def test_ngram_match_stats(self):
+    stats = ngram_utils.ngram_match_stats(self.ref, self.out, max_length=2)
+    self.assertEqual(stats.shape, (len(self.ref), 2, 3))
+    for i, (ref, out) in enumerate(zip(self.ref, self.out)):
+      for n in range(1, 3):
+        ref_cnt = Counter(ngram_utils.sent_ngrams_list(ref, n))
+        out_cnt = Counter(ngram_utils.sent_ngrams_list(out, n))
+        self.assertEqual(stats[i, n-1].tolist(),
+                         [sum((ref_cnt & out_cnt).values()), sum(out_cnt.values()), sum(ref_cnt.values())])
+
+  def test_ngram_match_stats_shared(self):
+    stats = ngram_utils.ngram_match_stats(self.ref_corpus, self.out_corpus, max_length=2)
+    self.assertIs(ngram_utils.ngram_match_stats(self.ref_corpus, self.out_corpus, max_length=3), stats)
+    self.assertEqual(stats[:, :2].tolist(), ngram_utils.ngram_match_stats(self.ref, self.out, max_length=2).tolist())
+
+  def test_system_ngram_match_stats(self):
+    out2 = [x[:200] for x in _get_example_data()][0][::-1]
+    out2_corpus = Corpus.from_sents(out2, vocab=self.ref_corpus.vocab)
+    refs = MultiReference([self.ref_corpus, Corpus.from_sents(out2, vocab=self.ref_corpus.vocab)])
+    for ref, word_ref in [(self.ref_corpus, self.ref), (refs, MultiReference([self.ref, out2]))]:
+      stats = ngram_utils.system_ngram_match_stats(ref, [self.out_corpus, out2_corpus], max_length=2)
+      for sys_stats, out, out_corpus in zip(stats, [self.out, out2], [self.out_corpus, out2_corpus]):
+        self.assertIs(ngram_utils.ngram_match_stats(ref, out_corpus, max_length=2), sys_stats)
+        self.assertEqual(sys_stats[:, :2].tolist(), ngram_utils.ngram_match_stats(word_ref, out, max_length=2).tolist())
+
+  def test_compare_ngrams(self):
+    ref_labels = [['x'] * len(sent) for sent in self.ref]
+    out_labels = [['x'] * len(sent) for sent in self.out]
+    expected = ngram_utils.compare_ngrams(self.ref, self.out, ref_labels=self.ref, out_labels=self.out)
+    for ref, out in [(self.ref, self.out), (self.ref_corpus, self.out_corpus)]:
+      actual = ngram_utils.compare_ngrams(ref, out)
+      for actual_counts, expected_counts in zip(actual, expected):
+        self.assertEqual(dict(actual_counts), dict(expected_counts))
+    label_counts = ngram_utils.compare_ngrams(self.ref, self.out, ref_labels=ref_labels, out_labels=out_labels)
+    self.assertEqual(label_counts[0][('x',)], sum(len(sent) for sent in self.out))
+
+
+if __name__ == "__main__":
+  unittest.main()
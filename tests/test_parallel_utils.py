@@ -0,0 +1,109 @@
+import os.path
+import threading
+import unittest
+import sys
+import warnings
+import numpy as np
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import bucketers
+from compare_mt import corpus_utils
+from compare_mt import ngram_utils
+from compare_mt import parallel_utils
+from compare_mt import repetition_utils
+from compare_mt import scorers
+from compare_mt.corpus_utils import load_corpus
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+  out = load_corpus(os.path.join(example_path, "ted.sys1.eng"), vocab=ref.vocab)
+  return ref, out
+
+
+class TestMapChunks(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out = _get_example_data()
+
+  def tearDown(self):
+    parallel_utils.global_jobs = 1
+
+  def _serial_and_parallel(self, func):
+    # Each run gets new corpora, so that nothing is shared through the caches of the corpora
+    parallel_utils.global_jobs = 1
+    serial = func(*_get_example_data())
+    parallel_utils.global_jobs = 3
+    return serial, func(*_get_example_data())
+
+  def test_map_chunks(self):
+    lens = parallel_utils.map_chunks(lambda r, o: [len(x) for x in o], self.ref, self.out, jobs=3)
+    self.assertGreater(len(lens), 1)
+    self.assertEqual(parallel_utils.concat_lists(lens), [len(x) for x in self.out])
+    self.assertEqual(parallel_utils.map_chunks(len, self.ref[:10], jobs=3), [10])
+
+  def test_stop_threads(self):
+    # The threads of the corpus loader are stopped before forking, and the loader still loads files afterwards
+    files = [os.path.join(compare_mt_root, "example", x) for x in ("ted.ref.eng", "ted.sys1.eng", "ted.sys2.eng")]
+    loader = corpus_utils.CorpusLoader(num_workers=2)
+    loader.preload(files[:2])
+    corpus_utils.global_loader = loader
+    try:
+      lens = parallel_utils.map_chunks(lambda r, o: [len(x) for x in o], self.ref, self.out, jobs=3)
+      self.assertGreater(len(lens), 1)
+      self.assertIsNone(loader.executor)
+      self.assertEqual([len(loader.load(x)) for x in files], [len(self.ref)] * 3)
+    finally:
+      corpus_utils.global_loader = None
+
+  def test_serial_with_live_threads(self):
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+      with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        lens = parallel_utils.map_chunks(lambda r, o: [len(x) for x in o], self.ref, self.out, jobs=3)
+    finally:
+      stop.set()
+      thread.join()
+    self.assertEqual(len(lens), 1)
+    self.assertEqual(len(caught), 1)
+
+  def test_cache_stats(self):
+    for profile in ("bleu", "ribes", "wer"):
+      serial, parallel = self._serial_and_parallel(
+        lambda r, o: scorers.create_scorer_from_profile(profile, case_insensitive=True).cache_stats(r, o))
+      self.assertTrue(np.array_equal(serial, parallel))
+
+  def test_system_ngram_match_stats(self):
+    for multi_ref in (False, True):
+      serial, parallel = self._serial_and_parallel(
+        lambda r, o: ngram_utils.system_ngram_match_stats(corpus_utils.MultiReference([r, o]) if multi_ref else r,
+                                                          [o, r]))
+      for serial_stats, parallel_stats in zip(serial, parallel):
+        self.assertTrue(np.array_equal(serial_stats, parallel_stats))
+
+  def test_bucketers(self):
+    serial, parallel = self._serial_and_parallel(
+      lambda r, o: bucketers.create_word_bucketer_from_profile("freq", freq_data=r).calc_bucketed_match_counts(r, o))
+    self.assertEqual(serial, parallel)
+    serial, parallel = self._serial_and_parallel(
+      lambda r, o: bucketers.create_sentence_bucketer_from_profile("length").create_bucketed_corpus(o, ref=r))
+    self.assertEqual(serial, parallel)
+
+  def test_ngrams_and_repetitions(self):
+    serial, parallel = self._serial_and_parallel(lambda r, o: ngram_utils.compare_ngrams(r, o))
+    for serial_counts, parallel_counts in zip(serial, parallel):
+      self.assertEqual(list(serial_counts.items()), list(parallel_counts.items()))
+    serial, parallel = self._serial_and_parallel(
+      lambda r, o: repetition_utils.repetition_stats_in_corpus(r, o, adjacent=False, subtract_legitimate_reps=True))
+    self.assertEqual(serial, parallel)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,13 +1,20 @@
 import os.path
 import unittest
+import nltk.translate.bleu_score
+import nltk.translate.chrf_score
 import numpy as np
+import sacrebleu
 import sys
+import tempfile
 
 compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
 sys.path.append(compare_mt_root)
 
+from compare_mt import bucketers
 from compare_mt import scorers
-from compare_mt.corpus_utils import load_tokens
+from compare_mt import meteor_utils
+from compare_mt.corpus_utils import load_corpus, load_tokens, MultiReference
+from compare_mt.rouge import rouge_scorer
 
 
 def _get_example_data():
@@ -25,6 +32,36 @@ def _get_example_data_detokenized():
   return [load_tokens(x) for x in (ref_file, out1_file, out2_file)]
 
 
+class TestSufficientStats(unittest.TestCase):
+
+  def test_sum(self):
+    data = np.arange(12).reshape(4, 3)
+    stats = scorers.SufficientStats(data)
+    self.assertIs(scorers.SufficientStats.of(stats), stats)
+    self.assertEqual(len(stats), 4)
+    self.assertTrue(np.array_equal(np.asarray(stats), data))
+    self.assertIs(stats.sum(range(4)), stats.sum())
+    self.assertEqual(stats.sum().tolist(), data.sum(axis=0).tolist())
+    self.assertEqual(stats.sum([1, 3]).tolist(), (data[1] + data[3]).tolist())
+
+  def test_derive_once(self):
+    calls = []
+    def derive(data):
+      calls.append(1)
+      return data * 2
+    stats = scorers.SufficientStats(np.ones((5, 2)))
+    self.assertEqual(stats.sum([0, 1], derive=derive).tolist(), [4.0, 4.0])
+    self.assertEqual(stats.sum(derive=derive).tolist(), [10.0, 10.0])
+    self.assertEqual(len(calls), 1)
+
+  def test_concatenate(self):
+    scorer = scorers.BleuScorer()
+    ref, out, _ = _get_example_data()
+    stats = scorers.SufficientStats.concatenate([scorer.cache_stats(ref[:100], out[:100]),
+                                                 scorer.cache_stats(ref[100:], out[100:])])
+    self.assertTrue(np.array_equal(stats, scorer.cache_stats(ref, out)))
+
+
 class TestBleuScorer(unittest.TestCase):
 
   @classmethod
@@ -68,6 +105,68 @@ class TestBleuScorer(unittest.TestCase):
       self.assertAlmostEqual(my_sys1_score, nltk_sys1_score)
       self.assertAlmostEqual(my_sys2_score, nltk_sys2_score)
 
+  def test_cache_stats_array(self):
+    self.assertEqual(self.cache_stats1.shape, (len(self.ref), 10))
+    self.assertEqual(self.cache_stats1[:, 0].sum(), sum(len(x) for x in self.ref))
+    self.assertEqual(self.cache_stats1[:, 1].sum(), sum(len(x) for x in self.out1))
+    self.assertEqual(self.scorer.cache_stats([], []).shape, (0, 10))
+
+
+class TestMultiRefBleuScorer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    # The output of the second system serves as a second reference
+    self.ref, self.out, self.ref2 = _get_example_data()
+    self.scorer = scorers.create_scorer_from_profile("bleu")
+
+  def test_score_corpus(self):
+    bleu, _ = self.scorer.score_corpus(MultiReference([self.ref, self.ref2]), self.out)
+    nltk_bleu = nltk.translate.bleu_score.corpus_bleu([[r1, r2] for r1, r2 in zip(self.ref, self.ref2)], self.out)
+    self.assertAlmostEqual(bleu, 100 * nltk_bleu)
+
+  def test_shared_vocab(self):
+    example_path = os.path.join(compare_mt_root, "example")
+    ref = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+    out, ref2 = [load_corpus(os.path.join(example_path, x), vocab=ref.vocab) for x in ("ted.sys1.eng", "ted.sys2.eng")]
+    stats = self.scorer.cache_stats(MultiReference([ref, ref2]), out)
+    self.assertTrue(np.array_equal(stats, self.scorer.cache_stats(MultiReference([self.ref, self.ref2]), self.out)))
+    self.assertTrue(np.array_equal(self.scorer.cache_stats(MultiReference([ref]), out),
+                                   self.scorer.cache_stats(ref, out)))
+
+  def test_score_corpora(self):
+    ref = MultiReference([self.ref, self.ref2])
+    scores = self.scorer.score_corpora(ref, [self.out, self.ref])
+    self.assertEqual(scores, [self.scorer.score_corpus(ref, self.out), self.scorer.score_corpus(ref, self.ref)])
+
+
+class TestScoreCorpora(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out1, self.out2 = _get_example_data()
+    example_path = os.path.join(compare_mt_root, "example")
+    self.ref_corpus = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+    self.out_corpora = [load_corpus(os.path.join(example_path, x), vocab=self.ref_corpus.vocab)
+                        for x in ("ted.sys1.eng", "ted.sys2.eng")]
+
+  def test_score_corpora(self):
+    for profile in ("bleu", "sentbleu", "length", "ribes", "chrf", "rouge2", "rougeL", "wer", "detokbleu"):
+      for case_insensitive in (False, True):
+        scorer = scorers.create_scorer_from_profile(profile, case_insensitive=case_insensitive)
+        expected = [scorer.score_corpus(self.ref, out) for out in (self.out1, self.out2)]
+        for ref, outs in ((self.ref, [self.out1, self.out2]), (self.ref_corpus, self.out_corpora)):
+          for score, expected_score in zip(scorer.score_corpora(ref, outs), expected):
+            self.assertAlmostEqual(score[0], expected_score[0], places=8)
+
+  def test_cache_system_stats(self):
+    for profile in ("ribes", "chrf", "detokbleu"):
+      scorer = scorers.create_scorer_from_profile(profile)
+      stats = scorer.cache_system_stats(self.ref, [self.out1, self.out2])
+      self.assertEqual(len(stats), 2)
+      for x, out in zip(stats, (self.out1, self.out2)):
+        self.assertTrue(np.array_equal(x, scorer.cache_stats(self.ref, out)))
+
 
 class TestSentBleuScorer(unittest.TestCase):
 
@@ -79,7 +178,23 @@ class TestSentBleuScorer(unittest.TestCase):
   def test_score_sentence(self):
     bleu, _ = self.scorer.score_sentence(self.ref[0], self.out[0])
     # compare to nltk
+    self.assertEqual(bleu, 32.44376694160122)
+    # Smoothing the unigram precisions too, as older versions of nltk
+    bleu, _ = scorers.create_scorer_from_profile("sentbleu_smooth_unigrams").score_sentence(self.ref[0], self.out[0])
     self.assertAlmostEqual(bleu, 32.607099228782377)
+
+  def test_score_sentences(self):
+    # The scores and their buckets are exactly those of nltk, even near bucket boundaries
+    chencherry = nltk.translate.bleu_score.SmoothingFunction()
+    bucketer = bucketers.ScoreSentenceBucketer("sentbleu")
+    for out in _get_example_data()[1:]:
+      scores = [x for x, _ in self.scorer.score_sentences(self.ref, out)]
+      nltk_scores = [self.scorer.scale * nltk.translate.bleu_score.sentence_bleu([ref_sent], out_sent,
+                                                                                 smoothing_function=chencherry.method2)
+                     for ref_sent, out_sent in zip(self.ref, out)]
+      self.assertEqual(scores, nltk_scores)
+      self.assertEqual(bucketer.calc_buckets(out, self.ref), [bucketer.cutoff_into_bucket(x) for x in nltk_scores])
+    self.assertEqual(self.scorer.score_sentence(self.ref[1708], self.out[1708])[0], 50.0)
   
   def test_score_corpus(self):
     sent_bleu_corpus, _ = self.scorer.score_corpus(self.ref, self.out)
@@ -107,6 +222,13 @@ class TestLengthScorer(unittest.TestCase):
     self.assertAlmostEqual(length_ratio_corpus, 45672 / 48183)
     self.assertEqual(desc, "ref=48183, out=45672")
 
+  def test_score_cached_corpus(self):
+    cached_stats = self.scorer.cache_stats(self.ref, self.out)
+    self.assertEqual(cached_stats.shape, (len(self.ref), 2))
+    sent_ids = list(range(0, len(self.ref), 3))
+    self.assertEqual(self.scorer.score_cached_corpus(sent_ids, cached_stats),
+                     self.scorer.score_corpus([self.ref[i] for i in sent_ids], [self.out[i] for i in sent_ids]))
+
 
 
 class TestRibesScorer(unittest.TestCase):
@@ -124,6 +246,29 @@ class TestRibesScorer(unittest.TestCase):
     ribes_corpus, _ = self.scorer.score_corpus(self.ref, self.out)
     self.assertAlmostEqual(ribes_corpus, 80.0020, 4)
 
+  def test_score_sentences(self):
+    expected = [self.scorer.score_sentence(r, o)[0] for r, o in zip(self.ref[:100], self.out[:100])]
+    for (actual, _), score in zip(self.scorer.score_sentences(self.ref[:100], self.out[:100]), expected):
+      self.assertAlmostEqual(actual, score)
+
+
+class TestWERScorer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out, _ = _get_example_data()
+    self.scorer = scorers.create_scorer_from_profile("wer")
+
+  def test_score_corpus(self):
+    wer_corpus, _ = self.scorer.score_corpus(self.ref, self.out)
+    self.assertAlmostEqual(wer_corpus, 59.0478, 4)
+
+  def test_penalties(self):
+    ref, out = [["a", "b", "c"]], [["a", "x", "c", "d"]]
+    self.assertAlmostEqual(scorers.WERScorer().score_corpus(ref, out)[0], 200 / 3)
+    self.assertAlmostEqual(scorers.WERScorer(sub_pen=3.0).score_corpus(ref, out)[0], 100.0)
+    self.assertAlmostEqual(scorers.WERScorer(ins_pen=0.5).score_corpus(ref, out)[0], 150 / 3)
+
 
 class TestChrFScorer(unittest.TestCase):
 
@@ -142,6 +287,23 @@ class TestChrFScorer(unittest.TestCase):
     # compare to sacrebleu --force --metrics=chrf
     self.assertAlmostEqual(chrf, 48, places=0)
 
+  def test_same_as_nltk(self):
+    nltk_chrf = nltk.translate.chrf_score.corpus_chrf([" ".join(x) for x in self.ref[:100]],
+                                                      [" ".join(x) for x in self.out[:100]], max_len=6, beta=2.0)
+    chrf, _ = self.scorer.score_corpus(self.ref[:100], self.out[:100])
+    self.assertAlmostEqual(chrf, 100 * nltk_chrf)
+
+  def test_score_cached_corpus(self):
+    cached_stats = self.scorer.cache_stats(self.ref, self.out)
+    self.assertEqual(cached_stats.shape, (len(self.ref), 18))
+    sent_ids = [3, 1, 4, 1, 5, 9, 2, 6]
+    chrf, _ = self.scorer.score_cached_corpus(sent_ids, cached_stats)
+    expected, _ = self.scorer.score_corpus([self.ref[i] for i in sent_ids], [self.out[i] for i in sent_ids])
+    self.assertAlmostEqual(chrf, expected)
+    sent_scores = [score for score, _ in self.scorer.score_sentences(self.ref[:10], self.out[:10])]
+    for i, score in enumerate(sent_scores):
+      self.assertAlmostEqual(score, self.scorer.score_sentence(self.ref[i], self.out[i])[0])
+
 
 class TestDetokBleuScorer(unittest.TestCase):
 
@@ -155,6 +317,129 @@ class TestDetokBleuScorer(unittest.TestCase):
     # compare to sacrebleu
     self.assertAlmostEqual(detok_bleu, 21.7, places=0)
 
+  def test_cached_stats_same_as_sacrebleu(self):
+    # The statistics come from private methods of sacrebleu, so they are checked against its public API
+    ref2 = _get_example_data_detokenized()[2]
+    for ref, refs in [(self.ref, [self.ref]), (MultiReference([self.ref, ref2]), [self.ref, ref2])]:
+      cached_stats = self.scorer.cache_stats(ref, self.out)
+      for i in range(0, len(self.out), 50):
+        sent_bleu = sacrebleu.sentence_bleu(" ".join(self.out[i]), [" ".join(r[i]) for r in refs])
+        self.assertEqual(cached_stats[i].tolist(),
+                         [sent_bleu.sys_len, sent_bleu.ref_len] + list(sent_bleu.counts) + list(sent_bleu.totals))
+      corpus_bleu = sacrebleu.corpus_bleu([" ".join(x) for x in self.out], [[" ".join(x) for x in r] for r in refs])
+      self.assertEqual(self.scorer.score_corpus(ref, self.out)[0], corpus_bleu.score)
+
+  def test_score_cached_corpus(self):
+    cached_stats = self.scorer.cache_stats(self.ref, self.out)
+    self.assertEqual(cached_stats.shape, (len(self.ref), 10))
+    sent_ids = list(range(0, len(self.ref), 3))
+    detok_bleu, _ = self.scorer.score_cached_corpus(sent_ids, cached_stats)
+    sacrebleu_bleu = sacrebleu.corpus_bleu([" ".join(self.out[i]) for i in sent_ids],
+                                           [[" ".join(self.ref[i]) for i in sent_ids]])
+    self.assertEqual(detok_bleu, sacrebleu_bleu.score)
+
+  def test_multi_ref(self):
+    ref2 = _get_example_data_detokenized()[2]
+    detok_bleu, _ = self.scorer.score_corpus(MultiReference([self.ref, ref2]), self.out)
+    sacrebleu_bleu = sacrebleu.corpus_bleu([" ".join(x) for x in self.out],
+                                           [[" ".join(x) for x in self.ref], [" ".join(x) for x in ref2]])
+    self.assertAlmostEqual(detok_bleu, sacrebleu_bleu.score)
+
+  def test_tokenized_warning(self):
+    ref, out, _ = _get_example_data()
+    with self.assertLogs('sacrebleu', level='WARNING') as logs:
+      self.scorer.score_corpus(ref, out)
+    self.assertIn("It looks like you forgot to detokenize your test data, which may hurt your score.",
+                  "\n".join(logs.output))
+
+  def test_public_api_fallback(self):
+    scorer = scorers.DetokBleuScorer()
+    # As with a version of sacrebleu without the segment-level methods
+    scorer._segment_stats = False
+    self.assertIsNone(scorer.cache_stats(self.ref, self.out))
+    detok_bleu, _ = scorer.score_corpus(self.ref, self.out)
+    self.assertAlmostEqual(detok_bleu, self.scorer.score_corpus(self.ref, self.out)[0])
+
+
+class TestRougeScorer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    example_path = os.path.join(compare_mt_root, "example")
+    self.ref, self.out = [load_tokens(os.path.join(example_path, x)) for x in ("sum.ref.eng", "sum.sys1.eng")]
+
+  def test_lcs_length(self):
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+      # Long enough for the bit vectors to span several machine words
+      ref, out = rng.randint(0, 10, rng.randint(0, 150)).tolist(), rng.randint(0, 10, rng.randint(0, 150)).tolist()
+      table = np.zeros((len(ref)+1, len(out)+1), dtype=int)
+      for i in range(len(ref)):
+        for j in range(len(out)):
+          table[i+1, j+1] = table[i, j] + 1 if ref[i] == out[j] else max(table[i, j+1], table[i+1, j])
+      self.assertEqual(rouge_scorer._lcs_length(ref, out), table[-1, -1])
+
+  def test_score_sentences(self):
+    for score_type in ("fmeasure", "precision", "recall"):
+      scorer = scorers.RougeScorer("rougeL", score_type=score_type, use_stemmer=True)
+      expected = [scorer.score_sentence(r, o)[0] for r, o in zip(self.ref[:200], self.out[:200])]
+      for (actual, _), score in zip(scorer.score_sentences(self.ref[:200], self.out[:200]), expected):
+        self.assertAlmostEqual(actual, score)
+
+  def test_score_corpus(self):
+    scorer = scorers.create_scorer_from_profile("rougeL")
+    rouge_corpus, _ = scorer.score_corpus(self.ref, self.out)
+    self.assertAlmostEqual(rouge_corpus, 33.5277, 4)
+
+
+# A stand-in for METEOR in -stdio mode that counts exact matches of unique words as content words
+_METEOR_STUB = """
+import sys
+for line in sys.stdin:
+  _, ref, out = [x.split() for x in line.rstrip('\\n').split(' ||| ')]
+  matches = len(set(ref) & set(out))
+  stats = [len(out), len(ref), 0, 0, matches, matches] + [0] * 14 + [min(matches, 1), matches, matches]
+  print(' '.join(str(x) for x in stats), flush=True)
+"""
+
+class TestMETEORScorer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.out1, self.out2 = _get_example_data()
+    self.directory = tempfile.TemporaryDirectory()
+    stub_file = os.path.join(self.directory.name, "meteor_stub.py")
+    with open(stub_file, "w") as f:
+      f.write(_METEOR_STUB)
+    self.command = [sys.executable, stub_file]
+
+  @classmethod
+  def tearDownClass(self):
+    meteor_utils.close_pools()
+    self.directory.cleanup()
+
+  def test_score_sentence(self):
+    scorer = scorers.METEORScorer(None, command=self.command)
+    self.assertAlmostEqual(scorer.score_sentence(["a", "b", "c"], ["a", "b", "c"])[0], 100.0)
+    self.assertAlmostEqual(scorer.score_sentence(["a", "b"], ["c", "d"])[0], 0.0)
+
+  def test_worker_reused(self):
+    scorer1 = scorers.METEORScorer(None, command=self.command)
+    scorer2 = scorers.METEORScorer(None, command=self.command)
+    stats1 = scorer1.cache_stats(self.ref, self.out1)
+    scorer2.cache_stats(self.ref[:10], self.out2[:10])
+    self.assertEqual(stats1.shape, (len(self.ref), 23))
+    self.assertIs(scorer1.pool, scorer2.pool)
+    self.assertEqual(scorer1.pool.num_started, 1)
+
+  def test_cache_system_stats(self):
+    scorer = scorers.METEORScorer(None, num_workers=2, command=self.command + ["--parallel"])
+    stats1, stats2 = scorer.cache_system_stats(self.ref, [self.out1, self.out2])
+    self.assertEqual(scorer.pool.num_started, 2)
+    self.assertTrue(np.array_equal(stats1, scorer.cache_stats(self.ref, self.out1)))
+    self.assertEqual(scorer.score_cached_corpus(range(len(self.ref)), stats2),
+                     scorer.score_corpus(self.ref, self.out2))
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,90 @@
+import os.path
+import unittest
+import sys
+import numpy as np
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import scorers
+from compare_mt import sign_utils
+from compare_mt.corpus_utils import load_corpus
+
+
+def _get_example_data():
+  example_path = os.path.join(compare_mt_root, "example")
+  ref = load_corpus(os.path.join(example_path, "ted.ref.eng"))
+  outs = [load_corpus(os.path.join(example_path, x), vocab=ref.vocab) for x in ("ted.sys1.eng", "ted.sys2.eng")]
+  return ref, outs
+
+
+class _UnsummedScorer(scorers.BleuScorer):
+
+  def sum_sampled_stats(self, cached_stats, sample_counts):
+    return None
+
+
+class TestDrawSamples(unittest.TestCase):
+
+  def test_without_replacement(self):
+    sample_ids = sign_utils.draw_samples(10, 50, sample_ratio=0.5)
+    self.assertEqual(sample_ids.shape, (50, 5))
+    for ids in sample_ids:
+      self.assertEqual(len(set(ids.tolist())), 5)
+    self.assertEqual(sign_utils.draw_samples(4, 3, sample_ratio=1.0).tolist(), [[0, 1, 2, 3]] * 3)
+
+  def test_with_replacement(self):
+    sample_ids = sign_utils.draw_samples(10, 50, sample_ratio=1.0, with_replacement=True)
+    self.assertEqual(sample_ids.shape, (50, 10))
+    self.assertTrue(((sample_ids >= 0) & (sample_ids < 10)).all())
+    counts = sign_utils.sample_counts(sample_ids, 10)
+    self.assertEqual(counts.shape, (50, 10))
+    self.assertTrue((counts.sum(axis=1) == 10).all())
+    self.assertEqual(counts[0].tolist(), np.bincount(sample_ids[0], minlength=10).tolist())
+
+
+class TestPairedBootstrap(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref, self.outs = _get_example_data()
+
+  def test_sampled_scores(self):
+    sample_ids = sign_utils.draw_samples(len(self.ref), 20, with_replacement=True)
+    counts = sign_utils.sample_counts(sample_ids, len(self.ref))
+    for profile in ("bleu", "sentbleu", "length", "chrf", "wer", "detokbleu"):
+      scorer = scorers.create_scorer_from_profile(profile)
+      stats = scorer.cache_stats(self.ref, self.outs[0])
+      scores = scorer.score_summed_stats_batch(scorer.sum_sampled_stats(stats, counts), sample_ids.shape[1])
+      for score, ids in zip(scores, sample_ids):
+        self.assertAlmostEqual(score, scorer.score_cached_corpus(ids, stats)[0], places=8)
+
+  def test_vectorized_and_loop(self):
+    # Scores summed with matrix operations and scores of each sample give the same results for the same samples
+    for with_replacement in (False, True):
+      results = []
+      for scorer in (scorers.BleuScorer(), _UnsummedScorer()):
+        np.random.seed(0)
+        results.append(sign_utils.eval_with_paired_bootstrap(self.ref, self.outs, scorer, num_samples=50,
+                                                             with_replacement=with_replacement))
+      (wins, sys_stats), (loop_wins, loop_sys_stats) = results
+      self.assertEqual(wins, loop_wins)
+      for x, y in zip(sys_stats, loop_sys_stats):
+        for key in ('mean', 'median', 'lower_bound', 'upper_bound'):
+          self.assertAlmostEqual(x[key], y[key], places=8)
+
+  def test_wins(self):
+    scorer = scorers.BleuScorer()
+    wins, sys_stats = sign_utils.eval_with_paired_bootstrap(self.ref, [self.outs[0], self.outs[0], self.outs[1]],
+                                                            scorer, compare_directions=[(0, 1), (0, 2)],
+                                                            num_samples=100)
+    self.assertEqual(wins[0], [0.0, 0.0, 1.0])
+    self.assertAlmostEqual(sum(wins[1]), 1.0)
+    self.assertEqual(len(sys_stats), 3)
+    for x in sys_stats:
+      self.assertLessEqual(x['lower_bound'], x['median'])
+      self.assertLessEqual(x['median'], x['upper_bound'])
+
+
+if __name__ == "__main__":
+  unittest.main()
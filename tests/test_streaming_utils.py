@@ -0,0 +1,72 @@
+import os.path
+import unittest
+import sys
+
+compare_mt_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(compare_mt_root)
+
+from compare_mt import bucketers
+from compare_mt import corpus_utils
+from compare_mt import ngram_utils
+from compare_mt import scorers
+from compare_mt import stat_utils
+from compare_mt import streaming_utils
+
+
+def _get_example_files():
+  example_path = os.path.join(compare_mt_root, "example")
+  return [os.path.join(example_path, x) for x in ("ted.ref.eng", "ted.sys1.eng", "ted.sys2.eng")]
+
+
+class TestStreamingReports(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(self):
+    self.ref_file, self.out1_file, self.out2_file = _get_example_files()
+    self.ref, self.out1, self.out2 = [corpus_utils.load_tokens(x) for x in _get_example_files()]
+
+  def _stream(self, report):
+    for ref, outs, src in streaming_utils.iterate_blocks(self.ref_file, [self.out1_file, self.out2_file],
+                                                         block_size=37):
+      report.add_block(ref, outs, src)
+    return report
+
+  def test_iterate_blocks(self):
+    blocks = list(streaming_utils.iterate_blocks(self.ref_file, [self.out1_file, self.out2_file], block_size=100))
+    self.assertEqual(sum([len(ref) for ref, _, _ in blocks]), len(self.ref))
+    self.assertEqual(blocks[1][0], self.ref[100:200])
+    self.assertEqual(blocks[1][1][1], self.out2[100:200])
+    self.assertIsNone(blocks[0][2])
+
+  def test_score_stats(self):
+    report = self._stream(streaming_utils.ScoreStreamingReport(2, score_type='bleu'))
+    stats = report.scores[1].stats
+    scorer = scorers.create_scorer_from_profile('bleu')
+    streamed, _ = scorer.score_cached_corpus(range(len(stats)), stats)
+    expected, _ = scorer.score_corpus(self.ref, self.out2)
+    self.assertAlmostEqual(streamed, expected)
+
+  def test_word_accuracy_counts(self):
+    report = self._stream(streaming_utils.WordAccuracyStreamingReport(2, self.ref_file))
+    bucketer = bucketers.create_word_bucketer_from_profile('freq', freq_data=self.ref)
+    expected = bucketer.calc_bucketed_match_counts(self.ref, self.out1)
+    self.assertEqual(report.matches[0].match_counts, expected)
+
+  def test_ngram_counts(self):
+    report = self._stream(streaming_utils.NgramStreamingReport(2))
+    expected = ngram_utils.compare_ngrams(self.ref, self.out1)
+    for streamed_counts, expected_counts in zip(report.counts[0], expected):
+      self.assertEqual(dict(streamed_counts), dict(expected_counts))
+
+  def test_sentence_examples(self):
+    report = self._stream(streaming_utils.SentenceExamplesStreamingReport(self.ref_file, [self.out1_file, self.out2_file]))
+    scorer = scorers.create_scorer_from_profile('sentbleu')
+    expected = stat_utils.calc_scorediff_lists(
+      [scorer.score_sentences(self.ref, out) for out in (self.out1, self.out2)],
+      corpus_utils.sent_hashes(self.ref), [corpus_utils.sent_hashes(out) for out in (self.out1, self.out2)], [(0, 1)])
+    self.assertEqual(stat_utils.calc_scorediff_lists(report.sent_scores, report.ref_hashes, report.out_hashes,
+                                                     report.direcs), expected)
+
+
+if __name__ == "__main__":
+  unittest.main()